@@ -1,77 +1,489 @@
 import os
+import json
+import time
+import queue
 import shutil
+import hashlib
 import logging
-from concurrent.futures import ThreadPoolExecutor
-
-# 設定日誌
-logging.basicConfig(
-    filename='overwrite_log.txt',  # 日誌文件名稱
-    level=logging.INFO,           # 設定日誌級別
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    encoding='utf-8'
-)
-
-def build_target_index(target_dir):
-    target_index = {}
-    for root, _, files in os.walk(target_dir):
-        for file_name in files:
-            if file_name.endswith('.txt') and not file_name.startswith('.'):  # 排除隱藏文件
-                target_index[file_name] = os.path.join(root, file_name)
+import logging.handlers
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# 日誌只在執行時設定（見 setup_logging），被 import 時不會建立日誌文件
+logger = logging.getLogger('label_transfer')
+DEFAULT_LOG_FILE = 'overwrite_log.txt'
+DEFAULT_SUMMARY_FILE = 'label_transfer_summary.json'
+# 進度列的間隔秒數
+DEFAULT_PROGRESS_INTERVAL = 5.0
+
+# 增量模式的狀態檔：記錄上次同步的結果、檔案雜湊與已同步的檔案對，下次可直接沿用
+DEFAULT_STATE_FILE = 'label_transfer_state.json'
+STATE_VERSION = 2
+# 同時提交到線程池、尚未完成的覆蓋任務上限，記憶體用量只與此值有關
+DEFAULT_WINDOW = 1024
+# 建立目標索引時平行讀取資料夾的執行緒數量（網路磁碟上主要在等待 I/O）
+DEFAULT_INDEX_WORKERS = 32
+INDEX_CACHE_VERSION = 1
+# 報告中最多列出幾組重複的鍵（完整清單寫入日誌）
+MAX_REPORTED_DUPLICATES = 20
+
+def setup_logging(log_file=DEFAULT_LOG_FILE):
+    """以 QueueHandler 非同步寫入日誌：工作執行緒只把紀錄放進佇列，格式化與寫檔由背景的 QueueListener 負責。
+
+    回傳 listener，結束時需呼叫 listener.stop() 把佇列中剩餘的紀錄寫完。
+    """
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')  # 日誌文件名稱
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    log_queue = queue.SimpleQueue()
+    logger.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    logger.setLevel(logging.INFO)  # 設定日誌級別
+    logger.propagate = False
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    return listener
+
+class TransferMetrics:
+    """彙總覆蓋結果：各結果數量、複製的位元組數與各類錯誤數量，並定期輸出進度列。
+
+    只在主執行緒（收集 future 結果處）更新，不需要鎖。
+    """
+
+    def __init__(self, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+        self.counts = {'copied': 0, 'skipped': 0, 'missing': 0, 'ambiguous': 0, 'failed': 0}
+        self.bytes_copied = 0
+        self.errors = {}
+        self.progress_interval = progress_interval
+        self.started = time.monotonic()
+        self._last_progress = self.started
+
+    def record(self, result):
+        status, nbytes, error_type = result
+        self.counts[status] += 1
+        self.bytes_copied += nbytes
+        if error_type is not None:
+            self.errors[error_type] = self.errors.get(error_type, 0) + 1
+        now = time.monotonic()
+        if self.progress_interval and now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            self.report_progress()
+
+    def processed(self):
+        return sum(self.counts.values())
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def report_progress(self):
+        elapsed = max(self.elapsed(), 1e-9)
+        message = (f"進度: 已處理 {self.processed()} 個（覆蓋 {self.counts['copied']}、跳過 {self.counts['skipped']}、"
+                   f"失敗 {self.counts['failed']}），{self.processed() / elapsed:.0f} 檔/秒，"
+                   f"{self.bytes_copied / elapsed / 1024 / 1024:.2f} MB/秒")
+        print(message)
+        logger.info(message)
+
+    def summary(self):
+        elapsed = self.elapsed()
+        return {
+            'elapsed_sec': round(elapsed, 3),
+            'counts': dict(self.counts),
+            'files_processed': self.processed(),
+            'bytes_copied': self.bytes_copied,
+            'files_per_sec': round(self.processed() / elapsed, 1) if elapsed > 0 else None,
+            'bytes_per_sec': round(self.bytes_copied / elapsed, 1) if elapsed > 0 else None,
+            'errors': dict(self.errors),
+        }
+
+def _stem(rel_path):
+    return os.path.splitext(os.path.basename(rel_path))[0]
+
+# 來源與目標檔案的對應方式，參數為以 / 分隔的相對路徑
+MATCH_KEYS = {
+    'name': lambda rel_path: os.path.basename(rel_path),              # 檔名（原本的行為）
+    'relpath': lambda rel_path: rel_path,                              # 完整相對路徑
+    'stem': _stem,                                                     # 去掉副檔名的檔名
+    'parent-stem': lambda rel_path: f"{os.path.basename(os.path.dirname(rel_path))}/{_stem(rel_path)}",  # 上層資料夾 + 檔名
+}
+
+def scan_directory(path):
+    """以 os.scandir 讀取單一資料夾，回傳 (標籤檔名清單, 子資料夾名稱清單)。"""
+    files = []
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            # 與 os.walk 預設相同，不跟隨資料夾的符號連結
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            elif entry.name.endswith('.txt') and not entry.name.startswith('.'):  # 排除隱藏文件
+                files.append(entry.name)
+    return files, subdirs
+
+def crawl_directory_tree(root_dir, workers=DEFAULT_INDEX_WORKERS, cached_dirs=None):
+    """以線程池平行走訪整個資料夾樹，回傳 {相對路徑: {'mtime_ns', 'files', 'subdirs'}}。
+
+    cached_dirs 為上次的結果；資料夾 mtime 沒變（沒有新增、刪除或改名檔案）時直接沿用，不重新讀取。
+    """
+    cached_dirs = cached_dirs or {}
+
+    def visit(rel_dir):
+        full_dir = os.path.join(root_dir, rel_dir) if rel_dir else root_dir
+        try:
+            mtime_ns = os.stat(full_dir).st_mtime_ns
+            cached = cached_dirs.get(rel_dir)
+            if cached and cached.get('mtime_ns') == mtime_ns:
+                return rel_dir, cached
+            files, subdirs = scan_directory(full_dir)
+        except OSError as e:
+            # 與 os.walk 相同，無法讀取的資料夾略過
+            logger.warning(f"無法讀取資料夾: {full_dir}，錯誤: {e}")
+            return rel_dir, None
+        return rel_dir, {'mtime_ns': mtime_ns, 'files': files, 'subdirs': subdirs}
+
+    dirs = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(visit, '')}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                rel_dir, info = future.result()
+                if info is None:
+                    continue
+                dirs[rel_dir] = info
+                # 子資料夾一讀到就分派出去，讓多個資料夾同時等待 I/O
+                for name in info['subdirs']:
+                    pending.add(executor.submit(visit, os.path.join(rel_dir, name) if rel_dir else name))
+    return dirs
+
+def load_index_cache(index_cache, target_dir):
+    try:
+        with open(index_cache, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if (not isinstance(cache, dict) or cache.get('version') != INDEX_CACHE_VERSION
+            or cache.get('target_dir') != os.path.abspath(target_dir)):
+        return {}
+    return cache.get('dirs', {})
+
+def save_index_cache(index_cache, target_dir, dirs):
+    cache = {'version': INDEX_CACHE_VERSION, 'target_dir': os.path.abspath(target_dir), 'dirs': dirs}
+    tmp_file = index_cache + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_file, index_cache)
+
+class TargetIndex:
+    """目標檔案索引：唯一的鍵存在一般 dict，重複的鍵另外存成 {鍵: [路徑, ...]} 的 multimap。
+
+    同名檔案不再由最後走訪到的覆蓋前面的，查詢仍是 dict 的速度。
+    """
+
+    def __init__(self, match_key='name'):
+        self.match_key = match_key
+        self.key_fn = MATCH_KEYS[match_key]
+        self.unique = {}
+        self.duplicates = {}
+
+    def add(self, rel_path, path):
+        key = self.key_fn(rel_path)
+        if key in self.duplicates:
+            self.duplicates[key].append(path)
+        elif key in self.unique:
+            self.duplicates[key] = [self.unique.pop(key), path]
+        else:
+            self.unique[key] = path
+
+    def lookup(self, rel_path):
+        """回傳所有對應的目標路徑；找不到為空 list，重複時有多個。"""
+        key = self.key_fn(rel_path)
+        path = self.unique.get(key)
+        if path is not None:
+            return [path]
+        return self.duplicates.get(key, [])
+
+    def __len__(self):
+        return len(self.unique) + sum(len(paths) for paths in self.duplicates.values())
+
+def build_target_index(target_dir, workers=DEFAULT_INDEX_WORKERS, index_cache=None, match_key='name'):
+    """建立目標資料夾的 TargetIndex。index_cache 為索引快取檔路徑，指定時只重新讀取有變動的資料夾。"""
+    cached_dirs = load_index_cache(index_cache, target_dir) if index_cache else None
+    dirs = crawl_directory_tree(target_dir, workers, cached_dirs)
+    if index_cache and dirs != cached_dirs:
+        save_index_cache(index_cache, target_dir, dirs)
+
+    target_index = TargetIndex(match_key)
+    # 依路徑排序，重複清單的順序與執行緒完成順序無關
+    for rel_dir in sorted(dirs):
+        root = os.path.join(target_dir, rel_dir) if rel_dir else target_dir
+        rel_prefix = rel_dir.replace(os.sep, '/') + '/' if rel_dir else ''
+        for file_name in dirs[rel_dir]['files']:
+            target_index.add(rel_prefix + file_name, os.path.join(root, file_name))
     return target_index
 
-def copy_file(source_file, target_file):
+def report_duplicates(target_index):
+    """複製開始前列出重複的鍵，避免把標籤覆蓋到錯誤的檔案。"""
+    if not target_index.duplicates:
+        return
+    message = (f"目標資料夾有 {len(target_index.duplicates)} 組重複的鍵（對應方式: {target_index.match_key}），"
+               f"這些檔案預設不會覆蓋，可改用 --match relpath 或 --on-duplicate all。")
+    print(message)
+    logger.warning(message)
+    for i, (key, paths) in enumerate(sorted(target_index.duplicates.items())):
+        message = f"重複的鍵: {key} -> {', '.join(paths)}"
+        if i < MAX_REPORTED_DUPLICATES:
+            print(message)
+        logger.warning(message)
+    if len(target_index.duplicates) > MAX_REPORTED_DUPLICATES:
+        print(f"...另有 {len(target_index.duplicates) - MAX_REPORTED_DUPLICATES} 組，完整清單請見日誌。")
+
+def load_state(state_file):
+    """讀取上次同步的狀態檔，回傳 (雜湊快取, 已同步的檔案對)；不存在或格式不符時兩者皆為空。"""
     try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}, {}
+    if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+        return {}, {}
+    return state.get('hashes', {}), state.get('synced', {})
+
+def save_state(state_file, source_dir, target_dir, counts, hashes, synced):
+    state = {
+        'version': STATE_VERSION,
+        'source_dir': os.path.abspath(source_dir),
+        'target_dir': os.path.abspath(target_dir),
+        'finished_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'counts': counts,
+        'hashes': hashes,
+        'synced': synced,
+    }
+    tmp_file = state_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_file, state_file)
+
+def file_digest(path, st, hashes):
+    """計算檔案內容雜湊；大小與 mtime 都沒變時沿用狀態檔中的結果。"""
+    key = os.path.abspath(path)
+    cached = hashes.get(key)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    digest = digest.hexdigest()
+    # 各執行緒寫入不同的鍵，dict 的單一賦值在 GIL 下是安全的
+    hashes[key] = [st.st_size, st.st_mtime_ns, digest]
+    return digest
+
+def _synced_entry(source_file, source_stat, target_stat):
+    return [os.path.abspath(source_file), source_stat.st_size, source_stat.st_mtime_ns,
+            target_stat.st_size, target_stat.st_mtime_ns]
+
+def files_identical(source_file, target_file, hashes, synced):
+    """大小不同必定不同；上次同步記錄的正是這一對檔案且兩邊的大小與 mtime 都沒變時視為相同；否則比對內容雜湊。
+
+    標籤檔的大小由格式決定（one-hot 列、單一數字），大小與 mtime 相同本身不代表內容相同。
+    """
+    try:
+        source_stat = os.stat(source_file)
+        target_stat = os.stat(target_file)
+    except OSError:
+        return False
+    if source_stat.st_size != target_stat.st_size:
+        return False
+    entry = _synced_entry(source_file, source_stat, target_stat)
+    if synced.get(os.path.abspath(target_file)) == entry:
+        return True
+    if file_digest(source_file, source_stat, hashes) != file_digest(target_file, target_stat, hashes):
+        return False
+    synced[os.path.abspath(target_file)] = entry
+    return True
+
+def copy_file(source_file, target_file, hashes=None, log_each_file=False, synced=None):
+    """覆蓋單一檔案，回傳 (結果, 複製的位元組數, 錯誤類型)；結果為 'copied'、'skipped'（內容相同）或 'failed'。
+
+    hashes 為 None 時一律覆蓋；否則啟用增量模式，先比對內容是否相同，並把同步完成的檔案對記錄到 synced。
+    成功的覆蓋只在 log_each_file 為 True 時逐筆記錄，失敗一定會記錄。
+    """
+    try:
+        if hashes is not None and files_identical(source_file, target_file, hashes, synced):
+            return 'skipped', 0, None
         shutil.copy2(source_file, target_file)
-        message = f"覆蓋完成: {source_file} -> {target_file}"
-        # print(message)
-        logging.info(message)  # 記錄成功的覆蓋操作
+        if synced is not None:
+            # 各執行緒寫入不同的鍵（iter_copy_tasks 保證同一目標只會出現在一個任務）
+            synced[os.path.abspath(target_file)] = _synced_entry(source_file, os.stat(source_file),
+                                                                  os.stat(target_file))
+        if log_each_file:
+            logger.info(f"覆蓋完成: {source_file} -> {target_file}")  # 記錄成功的覆蓋操作
+        return 'copied', os.path.getsize(target_file), None
     except Exception as e:
+        if synced is not None:
+            synced.pop(os.path.abspath(target_file), None)
         message = f"覆蓋失敗: {source_file} -> {target_file}，錯誤: {e}"
         print(message)
-        logging.error(message)  # 記錄失敗的覆蓋操作
+        logger.error(message)  # 記錄失敗的覆蓋操作
+        return 'failed', 0, type(e).__name__
 
-def overwrite_labels_with_dict(source_dir, target_dir):
-    if not os.path.exists(source_dir):
-        message = f"來源資料夾不存在: {source_dir}"
-        print(message)
-        logging.error(message)
-        return
-    if not os.path.exists(target_dir):
-        message = f"目標資料夾不存在: {target_dir}"
-        print(message)
-        logging.error(message)
-        return
+def iter_copy_tasks(source_dir, target_index, counts, previous_hashes=None, hashes=None, on_duplicate='skip',
+                    log_each_file=False, previous_synced=None, synced=None):
+    """邊走訪來源資料夾邊比對目標索引，逐一產生 (來源檔, 目標檔)。
+
+    找不到對應的檔案計入 missing；對應到多個目標時，on_duplicate 為 'skip' 則計入 ambiguous 不覆蓋，
+    為 'all' 則覆蓋全部。逐筆的跳過訊息只在 log_each_file 為 True 時輸出。
+    多個來源對應到同一個目標時（例如以檔名對應），只有依路徑排序的第一個來源會覆蓋，
+    其餘計入 ambiguous 並一律寫入日誌，避免多個執行緒同時覆蓋同一個檔案、結果取決於完成順序。
+    """
+    # 本次已分配給某個來源的目標檔 -> 來源檔
+    assigned = {}
+    for root, dirs, files in os.walk(source_dir):
+        # 依路徑排序走訪，多個來源對應到同一目標時的結果固定
+        dirs.sort()
+        rel_root = os.path.relpath(root, source_dir)
+        rel_prefix = '' if rel_root == os.curdir else rel_root.replace(os.sep, '/') + '/'
+        for file_name in sorted(files):
+            if file_name.endswith('.txt') and not file_name.startswith('.'):  # 排除隱藏文件
+                source_file = os.path.join(root, file_name)
+
+                # 根據對應方式查找目標路徑
+                target_files = target_index.lookup(rel_prefix + file_name)
+                if not target_files:
+                    counts['missing'] += 1
+                    if log_each_file:
+                        message = f"未找到對應文件: {rel_prefix + file_name}，跳過覆蓋。"
+                        print(message)
+                        logger.warning(message)  # 記錄跳過的文件
+                    continue
+                if len(target_files) > 1 and on_duplicate == 'skip':
+                    counts['ambiguous'] += 1
+                    if log_each_file:
+                        logger.warning(f"對應到多個目標文件: {source_file}，跳過覆蓋。")
+                    continue
+                for target_file in target_files:
+                    other = assigned.setdefault(target_file, source_file)
+                    if other != source_file:
+                        counts['ambiguous'] += 1
+                        message = f"多個來源對應到同一個目標文件: {target_file}（已由 {other} 覆蓋），跳過 {source_file}。"
+                        if log_each_file:
+                            print(message)
+                        logger.warning(message)
+                        continue
+                    if hashes is not None:
+                        for path in (os.path.abspath(source_file), os.path.abspath(target_file)):
+                            if path in previous_hashes:
+                                hashes[path] = previous_hashes[path]
+                        target_key = os.path.abspath(target_file)
+                        if target_key in previous_synced:
+                            synced[target_key] = previous_synced[target_key]
+                    yield source_file, target_file
+
+def run_bounded(executor, tasks, fn, window, on_result):
+    """把 tasks 逐一提交給 executor，未完成的任務最多 window 個，完成的結果立即交給 on_result。"""
+    in_flight = set()
+    for args in tasks:
+        if len(in_flight) >= window:
+            # 背壓：等到至少一個任務完成才繼續走訪
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                on_result(future.result())
+        in_flight.add(executor.submit(fn, *args))
+    while in_flight:
+        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            on_result(future.result())
+
+def overwrite_labels_with_dict(source_dir, target_dir, incremental=False, state_file=DEFAULT_STATE_FILE,
+                               workers=None, window=DEFAULT_WINDOW, index_workers=DEFAULT_INDEX_WORKERS,
+                               index_cache=None, match_key='name', on_duplicate='skip', log_each_file=False,
+                               progress_interval=DEFAULT_PROGRESS_INTERVAL, summary_file=None):
+    """以檔名對應，將 source_dir 的標籤檔覆蓋到 target_dir，回傳執行摘要（dict）。
+
+    incremental 為 True 時跳過內容相同的檔案，並把用到的雜湊存到 state_file 供下次使用。
+    走訪、比對與覆蓋以管線方式進行，同時最多只有 window 個未完成的任務。
+    目標索引以 index_workers 個執行緒平行建立，指定 index_cache 時可跨次沿用。
+    match_key 決定來源與目標的對應方式（見 MATCH_KEYS），on_duplicate 決定對應到多個目標時的處理。
+    每 progress_interval 秒輸出一次進度；指定 summary_file 時把摘要寫成 JSON。
+    """
+    metrics = TransferMetrics(progress_interval)
+    summary = {'source_dir': os.path.abspath(source_dir), 'target_dir': os.path.abspath(target_dir),
+               'match_key': match_key, 'incremental': incremental}
+    for path, label in ((source_dir, '來源'), (target_dir, '目標')):
+        if not os.path.exists(path):
+            message = f"{label}資料夾不存在: {path}"
+            print(message)
+            logger.error(message)
+            summary.update(metrics.summary(), error=message)
+            return summary
 
     # 建立目標資料夾的索引
     print("正在建立目標資料夾的索引...")
-    target_index = build_target_index(target_dir)
+    target_index = build_target_index(target_dir, index_workers, index_cache, match_key)
+    index_sec = metrics.elapsed()
     print(f"索引建立完成，共 {len(target_index)} 個文件。")
-    logging.info(f"索引建立完成，共 {len(target_index)} 個文件。")
+    logger.info(f"索引建立完成，共 {len(target_index)} 個文件。")
+    report_duplicates(target_index)
+
+    previous_hashes, previous_synced = load_state(state_file) if incremental else ({}, {})
+    # 只保留本次用到的雜湊與檔案對，狀態檔不會無限成長
+    hashes = {} if incremental else None
+    synced = {} if incremental else None
 
     # 建立一個線程池
-    with ThreadPoolExecutor() as executor:
-        futures = []
-        for root, _, files in os.walk(source_dir):
-            for file_name in files:
-                if file_name.endswith('.txt') and not file_name.startswith('.'):  # 排除隱藏文件
-                    source_file = os.path.join(root, file_name)
-
-                    # 根據文件名稱查找目標路徑
-                    target_file = target_index.get(file_name)
-                    if target_file:
-                        # 提交覆蓋任務到線程池
-                        futures.append(executor.submit(copy_file, source_file, target_file))
-                    else:
-                        message = f"未找到對應文件: {file_name}，跳過覆蓋。"
-                        print(message)
-                        logging.warning(message)  # 記錄跳過的文件
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        tasks = iter_copy_tasks(source_dir, target_index, metrics.counts, previous_hashes, hashes, on_duplicate,
+                                log_each_file, previous_synced, synced)
+        run_bounded(executor,
+                    ((source_file, target_file, hashes, log_each_file, synced) for source_file, target_file in tasks),
+                    copy_file, window, metrics.record)
 
-        # 等待所有線程完成
-        for future in futures:
-            future.result()
+    counts = metrics.counts
+    message = (f"覆蓋 {counts['copied']} 個，內容相同跳過 {counts['skipped']} 個，"
+               f"找不到對應 {counts['missing']} 個，對應不唯一 {counts['ambiguous']} 個，失敗 {counts['failed']} 個。")
+    print(message)
+    logger.info(message)
+    if incremental:
+        save_state(state_file, source_dir, target_dir, counts, hashes, synced)
 
-# 使用範例
-source_folder = "testing/src"  # 替換為來源資料夾路徑
-target_folder = "testing/dest"  # 替換為目標資料夾路徑
+    summary.update(metrics.summary(), index_sec=round(index_sec, 3), target_files=len(target_index),
+                   duplicate_keys=len(target_index.duplicates))
+    if summary_file:
+        tmp_file = summary_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, summary_file)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='以檔名對應，將來源資料夾的標籤檔覆蓋到目標資料夾。')
+    parser.add_argument('source', nargs='?', default="testing/src", help='來源資料夾路徑')
+    parser.add_argument('target', nargs='?', default="testing/dest", help='目標資料夾路徑')
+    parser.add_argument('--incremental', action='store_true', help='跳過內容相同的檔案（上次同步過且未變動的檔案對直接跳過，其餘比對雜湊）')
+    parser.add_argument('--state-file', default=DEFAULT_STATE_FILE, help='增量模式的狀態檔路徑')
+    parser.add_argument('--workers', type=int, default=None, help='覆蓋檔案的執行緒數量（預設由 ThreadPoolExecutor 決定）')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='同時未完成的覆蓋任務上限')
+    parser.add_argument('--index-workers', type=int, default=DEFAULT_INDEX_WORKERS, help='平行建立目標索引的執行緒數量')
+    parser.add_argument('--index-cache', default=None, help='目標索引快取檔路徑，指定後只重新讀取有變動的資料夾')
+    parser.add_argument('--match', dest='match_key', choices=sorted(MATCH_KEYS), default='name',
+                        help='來源與目標的對應方式：name 檔名、relpath 相對路徑、stem 主檔名、parent-stem 上層資料夾加主檔名')
+    parser.add_argument('--on-duplicate', choices=('skip', 'all'), default='skip',
+                        help='對應到多個目標檔案時跳過（預設）或全部覆蓋')
+    parser.add_argument('--log-file', default=DEFAULT_LOG_FILE, help='日誌文件路徑')
+    parser.add_argument('--log-each-file', action='store_true', help='逐筆記錄每個覆蓋與跳過的檔案（檔案量大時日誌會很大）')
+    parser.add_argument('--progress-interval', type=float, default=DEFAULT_PROGRESS_INTERVAL,
+                        help='輸出進度列的間隔秒數，0 表示不輸出')
+    parser.add_argument('--summary-json', default=DEFAULT_SUMMARY_FILE, help='執行摘要（JSON）的輸出路徑')
+    args = parser.parse_args(argv)
+
+    listener = setup_logging(args.log_file)
+    try:
+        overwrite_labels_with_dict(args.source, args.target, args.incremental, args.state_file, args.workers,
+                                   max(1, args.window), args.index_workers, args.index_cache, args.match_key,
+                                   args.on_duplicate, args.log_each_file, args.progress_interval, args.summary_json)
+    finally:
+        listener.stop()
 
-overwrite_labels_with_dict(source_folder, target_folder)
+# 使用範例：
+#   python Cross-validation_label_transfer.py testing/src testing/dest
+#   python Cross-validation_label_transfer.py testing/src testing/dest --incremental
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,462 @@
+"""多人同時標記同一個（共享資料夾上的）資料集：以鎖定檔分配圖片分片，並合併各 session 的標記紀錄。
+
+每個 session 以 O_EXCL 建立鎖定檔取得一個分片（排序後圖片清單中連續的 shard_size 張），只標記自己的分片，
+不同 session 之間不會寫到同一個標籤檔。分片以圖片索引劃分，鎖定檔記錄圖片清單的雜湊，
+清單與其他仍在使用中的鎖定不同（圖片有增減）時拒絕取得分片，避免兩個 session 的分片重疊。鎖定檔需定期更新 mtime（heartbeat），超過 LEASE_TIMEOUT
+沒有更新的鎖定視為過期（例如程式當掉），可被其他 session 接手。
+每次標記另外附加到 session 自己的 journal（JSON Lines），merge 時依時間順序重新套用尚未寫回的紀錄。
+單人標記時 GUI 也會寫 journal；程式當掉後下次開啟資料集時，尚未寫回標籤檔的紀錄會自動重播。
+每個 journal 另有自己的鎖定檔（同樣以 heartbeat 更新），持有者還在執行時其他程式不會重播或修改它。
+紀錄都已寫回標籤檔的 journal 會被刪除（正常關閉時由持有者刪除，其餘在重播或合併後刪除），
+開啟資料集時只需讀取仍在執行或尚未處理完的 journal。
+
+所有檔案放在資料集資料夾的 .sessions/：
+    .sessions/leases/shard_00000.lock     鎖定檔（內容為持有者資訊）
+    .sessions/journals/<session>.jsonl    各 session 的標記紀錄
+    .sessions/journals/<session>.lock     journal 的鎖定檔
+
+使用範例：
+    python annotation_sessions.py status path/to/dataset
+    python annotation_sessions.py merge path/to/dataset
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+import uuid
+
+import numpy as np
+
+from label_utils import LabelJournal, atomic_write_text, image_list_digest, unmaterialized_records
+
+SESSIONS_DIRNAME = '.sessions'
+DEFAULT_SHARD_SIZE = 1000
+# 鎖定檔超過此秒數沒有 heartbeat 視為過期
+LEASE_TIMEOUT = 10 * 60
+# GUI 更新 heartbeat 的間隔（秒）
+HEARTBEAT_INTERVAL = 60
+
+
+def sessions_dir_for(dataset_dir):
+    return os.path.join(dataset_dir, SESSIONS_DIRNAME)
+
+
+def shard_count(image_count, shard_size=DEFAULT_SHARD_SIZE):
+    return (image_count + shard_size - 1) // shard_size
+
+
+def journal_path_for(dataset_dir, session_id):
+    return os.path.join(sessions_dir_for(dataset_dir), 'journals', f'{session_id}.jsonl')
+
+
+def journal_lock_path_for(dataset_dir, session_id):
+    return os.path.join(sessions_dir_for(dataset_dir), 'journals', f'{session_id}.lock')
+
+
+def open_journal(dataset_dir, session_id):
+    return LabelJournal(journal_path_for(dataset_dir, session_id), session_id)
+
+
+def new_session_id():
+    host = ''.join(c if c.isalnum() or c in '-_' else '_' for c in socket.gethostname()) or 'host'
+    return f'{host}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+
+def _owner_info():
+    return {'host': socket.gethostname(), 'pid': os.getpid(), 'acquired': time.time()}
+
+
+def _owner_exited(info):
+    """同一台主機上的持有者程序已結束時回傳 True，不必等鎖定過期。
+
+    Windows 的 os.kill 會直接結束程序，無法用來檢查，只能依 heartbeat 判斷。
+    """
+    if os.name != 'posix' or info.get('host') != socket.gethostname():
+        return False
+    try:
+        os.kill(int(info['pid']), 0)
+    except ProcessLookupError:
+        return True
+    except (OSError, KeyError, TypeError, ValueError):
+        return False
+    return False
+
+
+class JournalLease:
+    """session 持有自己 journal 的鎖定檔；需定期 heartbeat，正常關閉 journal 後才 release。"""
+
+    def __init__(self, dataset_dir, session_id):
+        self.path = journal_lock_path_for(dataset_dir, session_id)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # session_id 不會重複，O_EXCL 失敗代表有問題，直接讓例外往上拋
+        fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(dict(_owner_info(), session=session_id), f)
+
+    def heartbeat(self):
+        try:
+            os.utime(self.path)
+        except OSError:
+            pass
+
+    def release(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def remove_journal(dataset_dir, session_id):
+    """刪除已處理完的 journal 與其鎖定檔（持有者已結束）。"""
+    for path in (journal_path_for(dataset_dir, session_id), journal_lock_path_for(dataset_dir, session_id)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def journal_is_live(dataset_dir, session_id, lease_timeout=LEASE_TIMEOUT):
+    """journal 的持有者是否仍在執行（鎖定檔存在、未過期，且持有者程序沒有結束）。"""
+    path = journal_lock_path_for(dataset_dir, session_id)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        stale = time.time() - os.stat(path).st_mtime > lease_timeout
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError):
+        # 鎖定檔正在建立或讀取失敗時當作仍在使用，下次開啟再處理
+        return True
+    return not stale and not _owner_exited(info)
+
+
+class AnnotationSession:
+    """一個標記 session 持有的分片鎖定；標記紀錄由 GUI 以同一個 session_id 寫入 journal。"""
+
+    def __init__(self, dataset_dir, image_files, shard_size=DEFAULT_SHARD_SIZE, session_id=None,
+                 lease_timeout=LEASE_TIMEOUT):
+        self.dataset_dir = dataset_dir
+        self.image_count = len(image_files)
+        # 分片是排序後圖片清單的索引範圍，只有同一份清單的分片才不會重疊
+        self.images_digest = image_list_digest(image_files)
+        self.shard_size = shard_size
+        self.session_id = session_id or new_session_id()
+        self.lease_timeout = lease_timeout
+        self.lease_dir = os.path.join(sessions_dir_for(dataset_dir), 'leases')
+        self.shards = []
+
+    def _lock_path(self, shard):
+        return os.path.join(self.lease_dir, f'shard_{shard:05d}.lock')
+
+    def shard_range(self, shard):
+        start = shard * self.shard_size
+        return start, min(start + self.shard_size, self.image_count)
+
+    def _is_stale(self, path):
+        try:
+            return time.time() - os.stat(path).st_mtime > self.lease_timeout
+        except FileNotFoundError:
+            return False
+
+    def _try_lock(self, shard):
+        path = self._lock_path(shard)
+        if self._is_stale(path):
+            # 先改名再刪除：多個 session 同時接手時只有一個能改名成功
+            tomb = f'{path}.stale-{self.session_id}'
+            try:
+                os.rename(path, tomb)
+            except OSError:
+                return False
+            if not self._is_stale(tomb):
+                # 改名前一刻持有者剛好更新了 heartbeat，把鎖定還回去
+                try:
+                    os.link(tomb, path)
+                except OSError:
+                    pass
+                os.remove(tomb)
+                return False
+            os.remove(tomb)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(dict(_owner_info(), session=self.session_id, start=self.shard_range(shard)[0],
+                           end=self.shard_range(shard)[1], images=self.images_digest), f)
+        return True
+
+    def check_image_list(self):
+        """其他仍在使用中的鎖定是以不同的圖片清單劃分分片時拋出 ValueError（過期的鎖定可直接接手）。"""
+        for name, info, stale in list_leases(self.dataset_dir, self.lease_timeout):
+            if stale or info.get('session') == self.session_id:
+                continue
+            if info.get('images') != self.images_digest:
+                raise ValueError(f'{name} 的持有者（session {info.get("session")}）使用的圖片清單不同，'
+                                 '圖片有增減時需等所有人結束目前的 session 後再重新開始')
+
+    def acquire(self, candidates=None, count=1):
+        """依 candidates 的順序（預設為全部分片）取得最多 count 個分片，回傳新取得的分片。
+
+        其他 session 的圖片清單與自己不同時拋出 ValueError（見 check_image_list）。
+        """
+        os.makedirs(self.lease_dir, exist_ok=True)
+        self.check_image_list()
+        if candidates is None:
+            candidates = range(shard_count(self.image_count, self.shard_size))
+        acquired = []
+        for shard in candidates:
+            if len(acquired) >= count:
+                break
+            if shard not in self.shards and self._try_lock(shard):
+                acquired.append(shard)
+        self.shards.extend(acquired)
+        return acquired
+
+    def owner_of(self, shard):
+        """讀取鎖定檔的持有者 session，沒有鎖定時回傳 None。"""
+        try:
+            with open(self._lock_path(shard), 'r', encoding='utf-8') as f:
+                return json.load(f).get('session')
+        except (OSError, ValueError):
+            return None
+
+    def heartbeat(self):
+        """更新所有鎖定檔的 mtime，回傳已被其他 session 接手（失去鎖定）的分片。"""
+        lost = []
+        for shard in self.shards:
+            if self.owner_of(shard) != self.session_id:
+                lost.append(shard)
+                continue
+            try:
+                os.utime(self._lock_path(shard))
+            except OSError:
+                lost.append(shard)
+        self.shards = [shard for shard in self.shards if shard not in lost]
+        return lost
+
+    def image_ids(self):
+        """持有的分片內所有圖片索引（遞增排序）。"""
+        ranges = [np.arange(*self.shard_range(shard)) for shard in sorted(self.shards)]
+        return np.concatenate(ranges) if ranges else np.zeros(0, dtype=np.intp)
+
+    def owns(self, img_ids):
+        """img_ids 是否位於持有的分片內（向量化，回傳 bool 陣列）。"""
+        shards = np.asarray(img_ids) // self.shard_size
+        return np.isin(shards, self.shards)
+
+    def release(self):
+        """釋放所有鎖定（只刪除仍屬於自己的鎖定檔）。"""
+        for shard in self.shards:
+            if self.owner_of(shard) == self.session_id:
+                try:
+                    os.remove(self._lock_path(shard))
+                except OSError:
+                    pass
+        self.shards = []
+
+
+def list_leases(dataset_dir, lease_timeout=LEASE_TIMEOUT):
+    """回傳 [(鎖定檔名, 持有者資訊 dict, 是否過期), ...]。"""
+    lease_dir = os.path.join(sessions_dir_for(dataset_dir), 'leases')
+    leases = []
+    if not os.path.isdir(lease_dir):
+        return leases
+    now = time.time()
+    for name in sorted(os.listdir(lease_dir)):
+        if not name.endswith('.lock'):
+            continue
+        path = os.path.join(lease_dir, name)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            stale = now - os.stat(path).st_mtime > lease_timeout
+        except (OSError, ValueError):
+            continue
+        leases.append((name, info, stale))
+    return leases
+
+
+def _replay(lines, records):
+    """把依時間排序的 records 套用到標籤檔目前的內容 lines，回傳 (結果, 是否衝突)。
+
+    目前的內容等於某筆紀錄修改後的內容時，代表寫到那一筆為止都已寫回，從下一筆開始重播；
+    之後每一筆都必須從它記錄的修改前內容開始，否則標籤檔在 journal 以外被改過，停止重播。
+    """
+    start = 0
+    for i, record in enumerate(records):
+        if lines == record['after']:
+            start = i + 1
+    for record in records[start:]:
+        if lines != record['before']:
+            return lines, True
+        lines = record['after']
+    return lines, False
+
+
+def _pending_records(dataset_dir, lease_timeout, cleanup=True):
+    """讀取所有已結束 session 的 journal 中 checkpoint 之後的紀錄。
+
+    回傳 (依標籤檔分組並依時間排序的紀錄, [(session, 最大 seq, 是否已關閉), ...], 統計 dict)；
+    持有者還在執行中的 journal 由它自己寫回，不讀取。cleanup 為 True 時刪除沒有待處理紀錄的 journal。
+    """
+    journal_dir = os.path.join(sessions_dir_for(dataset_dir), 'journals')
+    stats = {'journals': 0, 'records': 0, 'live': 0, 'removed': 0}
+    by_file = {}
+    journals = []
+    if not os.path.isdir(journal_dir):
+        return by_file, journals, stats
+    for name in sorted(os.listdir(journal_dir)):
+        if not name.endswith('.jsonl'):
+            continue
+        session_id = name[:-len('.jsonl')]
+        if journal_is_live(dataset_dir, session_id, lease_timeout):
+            stats['live'] += 1
+            continue
+        pending, closed = unmaterialized_records(os.path.join(journal_dir, name))
+        if not pending:
+            if cleanup:
+                remove_journal(dataset_dir, session_id)
+                stats['removed'] += 1
+            continue
+        stats['journals'] += 1
+        stats['records'] += len(pending)
+        journals.append((session_id, max(r.get('seq', 0) for r in pending), closed))
+        for record in pending:
+            by_file.setdefault(record['label_file'], []).append(record)
+    for records in by_file.values():
+        records.sort(key=lambda r: (r['t'], r['session'], r.get('seq', 0)))
+    return by_file, journals, stats
+
+
+def _read_label_lines(label_dir, label_file):
+    try:
+        with open(os.path.join(label_dir, label_file), 'r', encoding='utf-8') as f:
+            return f.readlines()
+    except FileNotFoundError:
+        return []
+
+
+def _write_label_lines(label_dir, label_file, lines):
+    path = os.path.join(label_dir, label_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    atomic_write_text(path, ''.join(lines))
+
+
+def _retire(dataset_dir, journals):
+    """journals 的紀錄都已處理：先記錄 checkpoint（刪除失敗時也不會再重播），再刪除 journal。
+
+    中途失敗時下次會再處理一次。
+    """
+    for session_id, seq, closed in journals:
+        with open(journal_path_for(dataset_dir, session_id), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'checkpoint': seq}) + '\n')
+            if not closed:
+                f.write(json.dumps({'closed': True}) + '\n')
+        remove_journal(dataset_dir, session_id)
+
+
+def recover_journals(dataset_dir, label_dir, lease_timeout=LEASE_TIMEOUT):
+    """重播已結束（正常關閉或當掉）的 session 尚未寫回標籤檔的紀錄，回傳統計（dict）。
+
+    journal 的持有者還在執行中（見 journal_is_live）時由它自己寫回，這裡不讀也不修改。
+    標籤檔目前的內容與紀錄的修改前內容不符時不覆寫，列在 stats['conflicts']（標籤檔名, session）。
+    """
+    by_file, journals, stats = _pending_records(dataset_dir, lease_timeout)
+    stats.update(written=0, conflicts=[])
+    for label_file, records in sorted(by_file.items()):
+        lines = _read_label_lines(label_dir, label_file)
+        result, conflict = _replay(lines, records)
+        if conflict:
+            stats['conflicts'].append((label_file, records[-1]['session']))
+        if result != lines:
+            _write_label_lines(label_dir, label_file, result)
+            stats['written'] += 1
+    # 全部寫回後才標記並刪除（衝突的紀錄也不再重播）
+    _retire(dataset_dir, journals)
+    return stats
+
+
+def merge_journals(dataset_dir, label_dir, dry_run=False, force=False, lease_timeout=LEASE_TIMEOUT):
+    """依時間順序把已結束 session 尚未寫回的紀錄（checkpoint 之後）重播到標籤檔，回傳統計與衝突清單。
+
+    標籤檔在 journal 以外被修改過（目前的內容不是紀錄的修改前內容）時列為衝突，預設不寫入；
+    force 為 True 時以時間最晚的紀錄覆寫。處理完的 journal 會被刪除；有未處理衝突的 journal 保留，
+    之後仍可加上 force 重新合併。
+    """
+    by_file, journals, stats = _pending_records(dataset_dir, lease_timeout, cleanup=not dry_run)
+    stats.update(labels=len(by_file), written=0, unchanged=0)
+    conflicts = []
+    unresolved = set()
+    for label_file, records in sorted(by_file.items()):
+        lines = _read_label_lines(label_dir, label_file)
+        result, conflict = _replay(lines, records)
+        if conflict:
+            conflicts.append((label_file, records[-1]['session']))
+            if not force:
+                unresolved.update(record['session'] for record in records)
+                continue
+            result = records[-1]['after']
+        if result == lines:
+            stats['unchanged'] += 1
+            continue
+        if not dry_run:
+            _write_label_lines(label_dir, label_file, result)
+        stats['written'] += 1
+    if not dry_run:
+        _retire(dataset_dir, [journal for journal in journals if journal[0] not in unresolved])
+    return stats, conflicts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='多人標記：查看分片鎖定，或合併各 session 的標記紀錄。')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    status_parser = subparsers.add_parser('status', help='列出目前的分片鎖定')
+    status_parser.add_argument('dataset', help='資料集資料夾')
+    merge_parser = subparsers.add_parser('merge', help='把所有 journal 的結果寫回標籤檔')
+    merge_parser.add_argument('dataset', help='資料集資料夾')
+    merge_parser.add_argument('--dry-run', action='store_true', help='只統計，不寫入任何檔案')
+    merge_parser.add_argument('--force', action='store_true',
+                              help='標籤檔在 journal 以外被修改過時，仍以時間最晚的紀錄覆寫')
+    args = parser.parse_args(argv)
+
+    if args.command == 'status':
+        leases = list_leases(args.dataset)
+        if not leases:
+            print("目前沒有任何分片被鎖定。")
+        for name, info, stale in leases:
+            state = '（已過期）' if stale else ''
+            print(f"{name}: 圖片 {info.get('start')}-{info.get('end', 0) - 1}，"
+                  f"session {info.get('session')} @ {info.get('host')}{state}")
+        return 0
+
+    label_dir = None
+    for name in ('labels', 'labelTxt'):
+        if os.path.isdir(os.path.join(args.dataset, name)):
+            label_dir = os.path.join(args.dataset, name)
+            break
+    if label_dir is None:
+        print(f"合併失敗: 資料集內沒有 labels 或 labelTxt 資料夾: {args.dataset}")
+        return 1
+    try:
+        stats, conflicts = merge_journals(args.dataset, label_dir, args.dry_run, args.force)
+    except OSError as e:
+        print(f"合併失敗: {e}")
+        return 1
+    print(f"session 數: {stats['journals']}，標籤檔: {stats['labels']}，"
+          f"寫入: {stats['written']}，已是最新: {stats['unchanged']}，衝突: {len(conflicts)}")
+    if stats['live']:
+        print(f"略過 {stats['live']} 個仍在執行中的 session（由各自的程式寫回）。")
+    for label_file, session_id in conflicts:
+        if args.force:
+            print(f"  {label_file}: 在 journal 以外被修改過，已以 session {session_id} 的結果覆寫")
+        else:
+            print(f"  {label_file}: 在 journal 以外被修改過，未寫入（加上 --force 以 session {session_id} 的結果覆寫）")
+    if args.dry_run:
+        print("dry run：未寫入任何檔案。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,435 @@
+"""效能基準測試：產生合成資料集，量測標籤讀寫、GUI 換圖延遲與標籤同步的速度，結果輸出成 JSON。
+
+不需要顯示器：GUI 以 Qt 的 offscreen 平台執行，載入資料集時的對話框由程式自動回答。
+每次量測使用新產生的資料集（相同參數與種子會產生相同的內容），可以比較不同 commit 的結果：
+
+    python benchmark.py --output before.json
+    （修改程式）
+    python benchmark.py --output after.json --compare before.json
+
+量測項目（--only 可只執行其中幾項）：
+    io          LabelStore 讀取 / 批次寫回、journal 附加、標籤快取建立與開啟
+    navigation  GUI 連續換圖（連按方向鍵與每張間隔 --nav-interval-ms 兩種情況）、標記並換圖、updateRadioButtons
+    transfer    Cross-validation_label_transfer.py 全部覆蓋與增量同步的檔案數 / 秒
+
+使用範例：
+    python benchmark.py
+    python benchmark.py --images 5000 --size 1920x1080 --classes 20 --depth 2 --output bench.json
+    python benchmark.py --only io,transfer --images 100000 --size 64x64
+    python benchmark.py --only navigation --trace trace.json   # 同時記錄各階段耗時（profiling.py）
+"""
+import os
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PyQt5.QtCore import QT_VERSION_STR, Qt
+from PyQt5.QtGui import QImage
+from PyQt5.QtWidgets import QApplication, QFileDialog, QMessageBox
+
+from label_utils import (CLASSES_FILENAME, LABEL_CACHE_DIRNAME, LabelJournal, LabelStore, format_one_hot,
+                         label_filename_for, load_label_cache, write_classes_file)
+from profiling import PROFILER
+
+BENCHMARKS = ('io', 'navigation', 'transfer')
+BENCHMARK_VERSION = 1
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+GUI_SCRIPT = os.path.join(SCRIPT_DIR, 'yolo-classification-gui-by-gyf-v1.py')
+TRANSFER_SCRIPT = os.path.join(SCRIPT_DIR, 'Cross-validation_label_transfer.py')
+# 比較結果時變化超過此比例才標示
+COMPARE_TOLERANCE = 0.10
+
+
+def _load_script(name, path):
+    """檔名含連字號的程式無法直接 import，以檔案路徑載入。"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _latency_stats(samples):
+    """延遲樣本（秒）的統計，單位為毫秒。"""
+    ms = np.asarray(samples, dtype=np.float64) * 1000
+    if not len(ms):
+        return {'n': 0}
+    return {
+        'n': int(len(ms)),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'max_ms': round(float(ms.max()), 3),
+    }
+
+
+def _rate(count, seconds):
+    return round(count / seconds, 1) if seconds > 0 else None
+
+
+def _image_path(i, depth, files_per_dir):
+    """第 i 張圖片的相對路徑：每 files_per_dir 張一個資料夾，資料夾再依 depth 層每層 10 個分組。"""
+    leaf = i // files_per_dir
+    parts = [f'd{level}_{(leaf // 10 ** level) % 10}' for level in reversed(range(depth))]
+    return '/'.join(parts + [f'img_{i:07d}.jpg'])
+
+
+def _write_image(path, width, height, seed):
+    # 低解析度的亂數平滑放大，內容接近照片，JPEG 大小與解碼時間比純色圖片接近真實資料
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (max(1, height // 32), max(1, width // 32), 3), dtype=np.uint8)
+    # QImage 不複製資料，scaled() 完成前 data 必須存在
+    data = small.tobytes()
+    image = QImage(data, small.shape[1], small.shape[0], small.shape[1] * 3, QImage.Format_RGB888)
+    image = image.scaled(width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not image.save(path, 'JPG', 90):
+        raise OSError(f'cannot write image: {path}')
+
+
+def make_dataset(root, images=1000, size=(1280, 960), classes=10, depth=0, files_per_dir=1000, mode='onehot',
+                 labeled_fraction=0.5, seed=0, workers=None):
+    """產生合成資料集（images/、labels/ 與 classes.txt），回傳圖片相對路徑清單。"""
+    width, height = size
+    class_names = [f'class_{i}' for i in range(classes)]
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, classes, images)
+    labeled = rng.random(images) < labeled_fraction
+    image_files = [_image_path(i, depth, files_per_dir) for i in range(images)]
+
+    images_dir = os.path.join(root, 'images')
+    label_dir = os.path.join(root, 'labels')
+    os.makedirs(label_dir, exist_ok=True)
+    write_classes_file(os.path.join(label_dir, CLASSES_FILENAME), class_names, mode)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda i: _write_image(os.path.join(images_dir, image_files[i]), width, height, seed + i),
+                          range(images)))
+    for i in np.flatnonzero(labeled):
+        label_path = os.path.join(label_dir, label_filename_for(image_files[i]))
+        os.makedirs(os.path.dirname(label_path), exist_ok=True)
+        value = format_one_hot(int(labels[i]), classes) if mode == 'onehot' else str(labels[i])
+        with open(label_path, 'w', encoding='utf-8') as f:
+            f.write(value)
+    return image_files
+
+
+def bench_label_io(root, image_files, classes, mode='onehot'):
+    """LabelStore 讀取與批次寫回、journal 附加，以及標籤快取的建立與開啟。"""
+    label_dir = os.path.join(root, 'labels')
+    label_filenames = [label_filename_for(f) for f in image_files]
+    class_names = [f'class_{i}' for i in range(classes)]
+    results = {}
+
+    store = LabelStore(label_dir)
+    start = time.perf_counter()
+    store.load(label_filenames)
+    elapsed = time.perf_counter() - start
+    results['read'] = {'files': len(label_filenames), 'sec': round(elapsed, 3),
+                       'files_per_sec': _rate(len(label_filenames), elapsed)}
+
+    shutil.rmtree(os.path.join(label_dir, LABEL_CACHE_DIRNAME), ignore_errors=True)
+    start = time.perf_counter()
+    load_label_cache(image_files, label_dir, class_names, mode, store)
+    build_sec = time.perf_counter() - start
+    start = time.perf_counter()
+    load_label_cache(image_files, label_dir, class_names, mode)
+    open_sec = time.perf_counter() - start
+    results['label_cache'] = {'build_sec': round(build_sec, 3), 'open_sec': round(open_sec, 4)}
+
+    rng = np.random.default_rng(1)
+    items = []
+    for name, cls in zip(label_filenames, rng.integers(0, classes, len(label_filenames))):
+        items.append((name, [format_one_hot(int(cls), classes) if mode == 'onehot' else str(cls)]))
+    start = time.perf_counter()
+    store.set_many(items)
+    store.flush()
+    elapsed = time.perf_counter() - start
+    store.close()
+    results['write'] = {'files': len(items), 'sec': round(elapsed, 3), 'files_per_sec': _rate(len(items), elapsed)}
+
+    # 每個標記動作在 GUI 執行緒上的成本：附加一筆 journal 並更新記憶體（寫回在背景）
+    journal = LabelJournal(os.path.join(root, '.benchmark_journal', 'bench.jsonl'), 'benchmark')
+    store = LabelStore(label_dir, flush_interval=3600, journal=journal)
+    store.load(label_filenames[:1000])
+    samples = []
+    for (name, lines), image_file in zip(items[:1000], image_files):
+        before = store.get_lines(name)
+        start = time.perf_counter()
+        store.set_many([(name, lines)], [(image_file, name, before, lines)])
+        samples.append(time.perf_counter() - start)
+    store.close()
+    journal.close()
+    results['journaled_set'] = _latency_stats(samples)
+    return results
+
+
+@contextlib.contextmanager
+def _headless_dialogs(dataset_dir, messages):
+    """自動回答 GUI 的對話框：選擇 dataset_dir、確認沿用 classes 與關閉程式，其他訊息記錄到 messages。"""
+    originals = (QFileDialog.getExistingDirectory, QMessageBox.information, QMessageBox.warning,
+                 QMessageBox.critical, QMessageBox.question)
+    QFileDialog.getExistingDirectory = staticmethod(lambda *args, **kwargs: dataset_dir)
+    QMessageBox.information = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+    QMessageBox.warning = staticmethod(lambda *args, **kwargs: messages.append(args[2]) or QMessageBox.Ok)
+    QMessageBox.critical = staticmethod(lambda *args, **kwargs: messages.append(args[2]) or QMessageBox.Ok)
+    QMessageBox.question = staticmethod(lambda *args, **kwargs: QMessageBox.Yes)
+    try:
+        yield
+    finally:
+        (QFileDialog.getExistingDirectory, QMessageBox.information, QMessageBox.warning,
+         QMessageBox.critical, QMessageBox.question) = originals
+
+
+def _pump(app, seconds):
+    """處理事件（背景預取的結果）直到經過 seconds 秒。"""
+    end = time.perf_counter() + seconds
+    while True:
+        app.processEvents()
+        if time.perf_counter() >= end:
+            return
+        time.sleep(0.001)
+
+
+def bench_navigation(root, steps=200, interval_ms=100, window_size=(1280, 900)):
+    """以 offscreen 平台開啟 GUI，量測換圖、標記並換圖與 updateRadioButtons 的延遲。"""
+    app = QApplication.instance() or QApplication([])
+    gui = _load_script('labeling_gui', GUI_SCRIPT)
+    messages = []
+    results = {}
+    with _headless_dialogs(root, messages):
+        start = time.perf_counter()
+        window = gui.ImageLabelingApp()
+        window.resize(*window_size)
+        window.show()
+        window.load_dataset()
+        window.go_to_classes_or_review()
+        window.show_page5_with_pictureid0()
+        results['open_dataset_sec'] = round(time.perf_counter() - start, 3)
+        _pump(app, 0.2)
+
+        def measure(action, count, interval):
+            samples = []
+            for _ in range(count):
+                start = time.perf_counter()
+                action()
+                samples.append(time.perf_counter() - start)
+                _pump(app, interval)
+            return _latency_stats(samples)
+
+        # 連按方向鍵：預取來不及時每張都要同步解碼
+        results['next_image_burst'] = measure(window.show_next_image, steps, 0)
+        # 依一般標記速度換圖，預取有時間在背景完成
+        results['next_image_paced'] = measure(window.show_next_image, steps, interval_ms / 1000)
+        num_classes = len(window.image_classes)
+        classes = iter(np.random.default_rng(2).integers(0, num_classes, steps).tolist())
+        results['label_and_next'] = measure(lambda: window.on_radio_button_clicked(next(classes)), steps,
+                                            interval_ms / 1000)
+        one_hot = ' '.join(['0'] * (num_classes - 1) + ['1'])
+        results['update_radio_buttons'] = measure(lambda: window.updateRadioButtons(one_hot), steps, 0)
+        window.close()
+    results['gui_messages'] = messages
+    return results
+
+
+def bench_transfer(root, image_files, workdir):
+    """以資料集的標籤檔為目標，量測全部覆蓋、第一次增量與沒有變動的增量同步。"""
+    transfer = _load_script('label_transfer', TRANSFER_SCRIPT)
+    label_dir = os.path.join(root, 'labels')
+    source_dir = os.path.join(workdir, 'transfer_src')
+    shutil.rmtree(source_dir, ignore_errors=True)
+    for image_file in image_files:
+        label_file = label_filename_for(image_file)
+        source_path = os.path.join(source_dir, label_file)
+        os.makedirs(os.path.dirname(source_path), exist_ok=True)
+        with open(source_path, 'w', encoding='utf-8') as f:
+            f.write('0')
+    state_file = os.path.join(workdir, 'transfer_state.json')
+    results = {}
+    for name, incremental in (('full', False), ('incremental_first', True), ('incremental_noop', True)):
+        # 同步程式會輸出進度與摘要，量測時不顯示
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = transfer.overwrite_labels_with_dict(source_dir, label_dir, incremental, state_file,
+                                                          match_key='relpath', progress_interval=0)
+        elapsed = summary.get('elapsed_sec') or 0
+        results[name] = {
+            'files': len(image_files),
+            'copied': summary.get('counts', {}).get('copied'),
+            'skipped': summary.get('counts', {}).get('skipped'),
+            'sec': elapsed,
+            'files_per_sec': _rate(len(image_files), elapsed),
+        }
+    return results
+
+
+def _git_commit():
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR, capture_output=True,
+                                text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.stdout.strip() or None
+
+
+def _flatten(results, prefix=''):
+    """把巢狀結果攤平成 {'io.read.files_per_sec': 值, ...}，只保留數值。"""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_results(baseline, current, tolerance=COMPARE_TOLERANCE):
+    """回傳 [(指標, 舊值, 新值, 變化比例, 是否變差), ...]，只列出變化超過 tolerance 的項目。
+
+    名稱以 _per_sec 結尾的指標越大越好，其餘（秒、毫秒）越小越好。
+    """
+    old, new = _flatten(baseline.get('results', {})), _flatten(current.get('results', {}))
+    changes = []
+    for name in sorted(old.keys() & new.keys()):
+        # 數量不是效能指標；單次最大值受雜訊影響太大
+        if name.endswith(('.n', '.files', '.copied', '.skipped', '.max_ms')) or not old[name]:
+            continue
+        ratio = new[name] / old[name] - 1
+        if abs(ratio) <= tolerance:
+            continue
+        worse = ratio < 0 if name.endswith('_per_sec') else ratio > 0
+        changes.append((name, old[name], new[name], ratio, worse))
+    return changes
+
+
+def run_benchmarks(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix='labeling_benchmark_')
+    dataset_dir = os.path.join(workdir, 'dataset')
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    report = {
+        'version': BENCHMARK_VERSION,
+        'meta': {
+            'commit': _git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'qt': QT_VERSION_STR,
+            'numpy': np.__version__,
+            'cpu_count': os.cpu_count(),
+        },
+        'params': {
+            'images': args.images, 'size': list(args.size), 'classes': args.classes, 'depth': args.depth,
+            'files_per_dir': args.files_per_dir, 'mode': args.mode, 'labeled_fraction': args.labeled_fraction,
+            'seed': args.seed, 'steps': args.steps, 'nav_interval_ms': args.nav_interval_ms,
+            'trace': bool(args.trace),
+        },
+        'results': {},
+    }
+    if args.trace:
+        # 計時本身有少量額外負擔，參數中記錄 trace 以免和未計時的結果直接比較
+        PROFILER.clear()
+        PROFILER.set_enabled(True)
+    try:
+        print(f"產生合成資料集: {args.images} 張 {args.size[0]}x{args.size[1]} 圖片 -> {dataset_dir}")
+        start = time.perf_counter()
+        image_files = make_dataset(dataset_dir, args.images, args.size, args.classes, args.depth, args.files_per_dir,
+                                   args.mode, args.labeled_fraction, args.seed)
+        report['meta']['generate_sec'] = round(time.perf_counter() - start, 3)
+        if 'io' in args.only:
+            print("量測標籤讀寫...")
+            report['results']['io'] = bench_label_io(dataset_dir, image_files, args.classes, args.mode)
+        if 'navigation' in args.only:
+            print("量測 GUI 換圖延遲...")
+            report['results']['navigation'] = bench_navigation(dataset_dir, min(args.steps, args.images),
+                                                               args.nav_interval_ms)
+        if 'transfer' in args.only:
+            print("量測標籤同步...")
+            report['results']['transfer'] = bench_transfer(dataset_dir, image_files, workdir)
+        if args.trace:
+            report['stages'] = PROFILER.summary()
+            count = PROFILER.export_chrome_trace(args.trace)
+            print(f"已匯出 {count} 個計時事件到 {args.trace}")
+    finally:
+        if args.trace:
+            PROFILER.set_enabled(False)
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def _parse_size(text):
+    width, _, height = text.lower().partition('x')
+    return int(width), int(height)
+
+
+def _parse_only(text):
+    names = tuple(name.strip() for name in text.split(',') if name.strip())
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f'未知的量測項目: {", ".join(unknown)}（可用 {", ".join(BENCHMARKS)}）')
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='以合成資料集量測標籤讀寫、GUI 換圖延遲與標籤同步速度。')
+    parser.add_argument('--images', type=int, default=1000, help='圖片數量')
+    parser.add_argument('--size', type=_parse_size, default=(1280, 960), help='圖片大小，例如 1920x1080')
+    parser.add_argument('--classes', type=int, default=10, help='類別數量')
+    parser.add_argument('--depth', type=int, default=0, help='images 底下的資料夾層數')
+    parser.add_argument('--files-per-dir', type=int, default=1000, help='每個最底層資料夾的圖片數（depth > 0 時）')
+    parser.add_argument('--mode', choices=('onehot', 'truelabel'), default='onehot', help='標記模式')
+    parser.add_argument('--labeled-fraction', type=float, default=0.5, help='已有標籤檔的圖片比例')
+    parser.add_argument('--seed', type=int, default=0, help='產生資料集的亂數種子')
+    parser.add_argument('--steps', type=int, default=200, help='GUI 每項量測的換圖次數')
+    parser.add_argument('--nav-interval-ms', type=int, default=100, help='模擬標記速度時每張圖片的間隔（毫秒）')
+    parser.add_argument('--only', type=_parse_only, default=BENCHMARKS, help='只執行指定的項目，以逗號分隔')
+    parser.add_argument('--workdir', help='資料集產生位置（指定時不會刪除），預設為暫存資料夾')
+    parser.add_argument('--keep', action='store_true', help='保留暫存資料夾')
+    parser.add_argument('--output', help='將結果寫入此 JSON 檔')
+    parser.add_argument('--compare', help='與先前輸出的 JSON 比較，列出變化超過 10% 的指標')
+    parser.add_argument('--trace', help='記錄各階段耗時，匯出 Chrome trace 到此檔案並在結果中加入 stages')
+    args = parser.parse_args(argv)
+
+    try:
+        report = run_benchmarks(args)
+    except (OSError, ValueError) as e:
+        print(f"量測失敗: {e}")
+        return 1
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"讀取比較基準失敗: {e}")
+            return 1
+        if baseline.get('params') != report['params']:
+            print("注意：比較基準的參數不同，結果可能無法直接比較。")
+        changes = compare_results(baseline, report)
+        if not changes:
+            print(f"與 {baseline['meta'].get('commit')} 相比沒有超過 {COMPARE_TOLERANCE:.0%} 的變化。")
+        for name, old, new, ratio, worse in changes:
+            print(f"{'變差' if worse else '改善'} {name}: {old} -> {new}（{ratio:+.1%}）")
+        return 1 if any(worse for *_, worse in changes) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""由 images/ 與 labels/ 資料集產生分層（stratified）K-fold 交叉驗證資料夾。
+
+每個 fold 都是 GUI 可以直接載入的資料集結構，圖片以硬連結或符號連結建立，不複製實際內容；
+標籤檔預設複製一份，在 fold 中修改標籤（GUI、標籤同步）不會影響原始資料集與其他 fold。
+也可以只輸出 YOLO 可讀取的圖片清單（manifest）。原始資料集只會被讀取，不會寫入任何檔案。
+
+輸出結構（--mode hardlink / symlink）：
+    out_dir/fold_0/train/images/...   out_dir/fold_0/train/labels/...（含 classes.txt）
+    out_dir/fold_0/val/images/...     out_dir/fold_0/val/labels/...
+輸出結構（--mode manifest）：
+    out_dir/fold_0/train.txt          out_dir/fold_0/val.txt（每行一個圖片的絕對路徑）
+以及記錄切分方式與各 fold 類別數量的 out_dir/folds.json。
+
+使用範例：
+    python cross_validation_split.py path/to/dataset path/to/folds --folds 10 --mode hardlink
+    python cross_validation_split.py path/to/dataset path/to/folds --folds 5 --mode manifest --seed 42
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from label_utils import (CLASSES_FILENAME, MANIFEST_FILENAME, UNLABELED, index_images, label_filename_for,
+                         load_label_cache, read_classes_file)
+
+SPLIT_MODES = ('hardlink', 'symlink', 'manifest')
+# 每個連結工作一次處理的檔案數
+LINK_CHUNK_SIZE = 1000
+
+
+def find_dataset_dirs(dataset_dir):
+    """與 GUI 的 load_dataset 相同：images 資料夾，以及 labels（或 labelTxt）資料夾。"""
+    images_dir = os.path.join(dataset_dir, 'images')
+    if not os.path.isdir(images_dir):
+        raise FileNotFoundError(f'資料集內沒有 images 資料夾: {dataset_dir}')
+    for name in ('labels', 'labelTxt'):
+        label_dir = os.path.join(dataset_dir, name)
+        if os.path.isdir(label_dir):
+            return images_dir, label_dir
+    raise FileNotFoundError(f'資料集內沒有 labels 或 labelTxt 資料夾: {dataset_dir}')
+
+
+def stratified_folds(labels, num_folds, seed=0, include_unlabeled=False):
+    """回傳每張圖片所屬的 fold（-1 表示不參與切分）。
+
+    每個類別各自洗牌後依序輪流分配到各 fold，起始 fold 隨類別遞移，讓各 fold 的總數也平均。
+    """
+    labels = np.asarray(labels)
+    fold_of = np.full(len(labels), -1, dtype=np.int32)
+    rng = np.random.default_rng(seed)
+    strata = np.unique(labels)
+    if not include_unlabeled:
+        strata = strata[strata != UNLABELED]
+    offset = 0
+    for cls in strata:
+        ids = np.flatnonzero(labels == cls)
+        rng.shuffle(ids)
+        fold_of[ids] = (np.arange(len(ids)) + offset) % num_folds
+        offset = (offset + len(ids)) % num_folds
+    return fold_of
+
+
+def _link_chunk(pairs, mode):
+    """建立一批連結（mode 為 'copy' 時複製），回傳 [(目的路徑, 錯誤訊息), ...]。"""
+    errors = []
+    for src, dst in pairs:
+        try:
+            if mode == 'copy':
+                shutil.copy2(src, dst)
+            elif mode == 'hardlink':
+                os.link(src, dst)
+            else:
+                os.symlink(os.path.abspath(src), dst)
+        except OSError as e:
+            errors.append((dst, str(e)))
+    return errors
+
+
+def _iter_chunks(items, chunk_size):
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
+
+
+def split_dataset(dataset_dir, out_dir, num_folds=5, mode='hardlink', seed=0, include_unlabeled=False,
+                  workers=None, overwrite=False, copy_labels=True):
+    """產生 num_folds 個 fold 並回傳摘要（dict）。
+
+    copy_labels 為 False 時標籤檔也以 mode 建立連結，只適合唯讀使用：GUI 以原子取代寫入會切斷硬連結，
+    標籤同步則會經由連結改寫原始資料集與所有 fold。
+    """
+    if num_folds < 2:
+        raise ValueError('fold 數量至少為 2')
+    images_dir, label_dir = find_dataset_dirs(dataset_dir)
+    classes, label_mode, _ = read_classes_file(os.path.join(label_dir, CLASSES_FILENAME))
+    if not classes:
+        raise ValueError(f'{label_dir} 的 classes.txt 沒有任何類別')
+
+    # 沿用 GUI 的 manifest 與標籤快取，但不寫入原始資料集；過期時只在記憶體中重新掃描、解析 .txt
+    image_files = index_images(images_dir, os.path.join(label_dir, MANIFEST_FILENAME), write_manifest=False)
+    label_cache, _ = load_label_cache(image_files, label_dir, classes, label_mode, persist=False)
+    labels = np.asarray(label_cache.labels)
+    fold_of = stratified_folds(labels, num_folds, seed, include_unlabeled)
+
+    fold_dirs = [os.path.join(out_dir, f'fold_{k}') for k in range(num_folds)]
+    existing = [d for d in fold_dirs if os.path.exists(d)]
+    if existing and not overwrite:
+        raise FileExistsError(f'輸出資料夾已存在（可加上 --overwrite）: {existing[0]}')
+    # 換了種子或 fold 數時舊的連結會留在錯誤的 split，直接移除整個 fold（只刪連結，不影響原始資料集）
+    for fold_dir in existing:
+        if os.path.isdir(fold_dir) and not os.path.islink(fold_dir):
+            shutil.rmtree(fold_dir)
+        else:
+            os.remove(fold_dir)
+
+    selected = np.flatnonzero(fold_of >= 0)
+    summary = {
+        'dataset_dir': os.path.abspath(dataset_dir),
+        'num_folds': num_folds,
+        'seed': seed,
+        'mode': mode,
+        'copy_labels': copy_labels,
+        'label_mode': label_mode,
+        'classes': classes,
+        'images': len(image_files),
+        'selected': int(len(selected)),
+        'unlabeled_excluded': 0 if include_unlabeled else int(np.count_nonzero(labels == UNLABELED)),
+        'folds': [],
+        'errors': [],
+    }
+    num_strata = len(classes) + 1
+    for k in range(num_folds):
+        in_val = fold_of[selected] == k
+        # 最後一格為未標記
+        val_hist = np.bincount(labels[selected][in_val] % num_strata, minlength=num_strata)
+        train_hist = np.bincount(labels[selected][~in_val] % num_strata, minlength=num_strata)
+        summary['folds'].append({
+            'fold': k,
+            'train': int(np.count_nonzero(~in_val)),
+            'val': int(np.count_nonzero(in_val)),
+            'train_per_class': train_hist[:len(classes)].tolist(),
+            'val_per_class': val_hist[:len(classes)].tolist(),
+        })
+
+    os.makedirs(out_dir, exist_ok=True)
+    if mode == 'manifest':
+        abs_images_dir = os.path.abspath(images_dir)
+        for k, fold_dir in enumerate(fold_dirs):
+            os.makedirs(fold_dir, exist_ok=True)
+            for split, ids in (('train', selected[fold_of[selected] != k]), ('val', selected[fold_of[selected] == k])):
+                with open(os.path.join(fold_dir, f'{split}.txt'), 'w', encoding='utf-8') as f:
+                    f.writelines(os.path.join(abs_images_dir, image_files[i]) + '\n' for i in ids)
+    else:
+        pairs = []
+        label_pairs = []
+        for k, fold_dir in enumerate(fold_dirs):
+            for split in ('train', 'val'):
+                split_images = os.path.join(fold_dir, split, 'images')
+                split_labels = os.path.join(fold_dir, split, 'labels')
+                ids = selected[(fold_of[selected] == k) == (split == 'val')]
+                # 先建立所有子資料夾，連結工作只做 link
+                for rel_dir in {os.path.dirname(image_files[i]) for i in ids}:
+                    os.makedirs(os.path.join(split_images, rel_dir), exist_ok=True)
+                    os.makedirs(os.path.join(split_labels, rel_dir), exist_ok=True)
+                shutil.copyfile(os.path.join(label_dir, CLASSES_FILENAME), os.path.join(split_labels, CLASSES_FILENAME))
+                for i in ids:
+                    image_file = image_files[i]
+                    pairs.append((os.path.join(images_dir, image_file), os.path.join(split_images, image_file)))
+                    label_file = label_filename_for(image_file)
+                    src_label = os.path.join(label_dir, label_file)
+                    if labels[i] != UNLABELED or os.path.exists(src_label):
+                        label_pairs.append((src_label, os.path.join(split_labels, label_file)))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # 標籤檔很小，預設複製一份讓各 fold 的標籤互相獨立
+            for items, item_mode in ((pairs, mode), (label_pairs, 'copy' if copy_labels else mode)):
+                link_chunk = partial(_link_chunk, mode=item_mode)
+                for errors in executor.map(link_chunk, _iter_chunks(items, LINK_CHUNK_SIZE)):
+                    summary['errors'].extend(errors)
+
+    with open(os.path.join(out_dir, 'folds.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='產生分層 K-fold 交叉驗證資料夾（以連結或清單取代複製）。')
+    parser.add_argument('dataset', help='含 images 與 labels 的資料集資料夾')
+    parser.add_argument('out_dir', help='輸出資料夾')
+    parser.add_argument('--folds', type=int, default=5, help='fold 數量')
+    parser.add_argument('--mode', choices=SPLIT_MODES, default='hardlink',
+                        help='hardlink / symlink 建立連結資料夾，manifest 只輸出圖片清單')
+    parser.add_argument('--seed', type=int, default=0, help='洗牌用的亂數種子')
+    parser.add_argument('--include-unlabeled', action='store_true', help='未標記的圖片也參與切分（自成一層）')
+    parser.add_argument('--link-labels', action='store_true',
+                        help='標籤檔也以連結建立（預設複製）；只適合唯讀使用，不要用 GUI 或標籤同步修改')
+    parser.add_argument('--workers', type=int, default=None, help='建立連結的執行緒數量')
+    parser.add_argument('--overwrite', action='store_true', help='輸出資料夾已有 fold 時先刪除再重新建立')
+    args = parser.parse_args(argv)
+
+    try:
+        summary = split_dataset(args.dataset, args.out_dir, args.folds, args.mode, args.seed, args.include_unlabeled,
+                                args.workers, args.overwrite, not args.link_labels)
+    except (OSError, ValueError) as e:
+        print(f"切分失敗: {e}")
+        return 1
+
+    print(f"共 {summary['images']} 張圖片，參與切分 {summary['selected']} 張，"
+          f"略過未標記 {summary['unlabeled_excluded']} 張。")
+    for fold in summary['folds']:
+        print(f"fold_{fold['fold']}: train {fold['train']} 張，val {fold['val']} 張，"
+              f"val 各類別 {fold['val_per_class']}")
+    if summary['errors']:
+        print(f"有 {len(summary['errors'])} 個連結建立失敗，例如: {summary['errors'][0][0]}: {summary['errors'][0][1]}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
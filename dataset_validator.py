@@ -0,0 +1,206 @@
+"""在開始標記前以多個程序檢查整個資料集，並輸出統計報告（不需開啟 GUI）。
+
+檢查項目：
+- 每張圖片的檔頭能否讀取（只讀檔頭取得大小，加上 --decode 才完整解碼）
+- 每個標籤檔是否符合 classes.txt 的類別數與標記模式（與 GUI 相同只看最後一行）
+- 沒有對應圖片的標籤檔（orphaned）
+並統計各類別的圖片數量。
+
+使用範例：
+    python dataset_validator.py path/to/dataset
+    python dataset_validator.py path/to/dataset --workers 16 --report report.json --decode
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from PyQt5.QtGui import QImageReader
+
+from label_format_converter import iter_label_files
+from label_utils import CLASSES_FILENAME, MANIFEST_FILENAME, index_images, label_filename_for, read_classes_file
+
+# 每個工作程序一次檢查的圖片數
+DEFAULT_CHUNK_SIZE = 2000
+# 畫面上每一類問題最多列出幾個檔案（完整清單在報告檔）
+MAX_REPORTED_PROBLEMS = 10
+
+
+def check_label_lines(lines, mode, num_classes):
+    """檢查標籤檔內容，回傳 (類別索引或 None, 問題描述或 None)；空檔案為未標記。"""
+    if not lines:
+        return None, None
+    last_line = lines[-1].strip()
+    parts = last_line.split()
+    try:
+        values = [int(p) for p in parts]
+    except ValueError:
+        return None, f'non-integer value: {last_line!r}'
+    if mode == 'truelabel':
+        if len(values) != 1:
+            return None, f'expected 1 class index, got {len(values)} values: {last_line!r}'
+        if not 0 <= values[0] < num_classes:
+            return None, f'class index {values[0]} out of range 0-{num_classes - 1}'
+        return values[0], None
+    if len(values) != num_classes:
+        return None, f'one-hot length {len(values)} != {num_classes} classes: {last_line!r}'
+    if any(v not in (0, 1) for v in values):
+        return None, f'one-hot values other than 0/1: {last_line!r}'
+    ones = values.count(1)
+    if ones == 0:
+        return None, None
+    # GUI 以最後一個 1 為準，仍可使用但需要注意
+    class_idx = len(values) - 1 - values[::-1].index(1)
+    if ones > 1:
+        return class_idx, f'one-hot has {ones} ones, the last one is used: {last_line!r}'
+    return class_idx, None
+
+
+def validate_chunk(images_dir, label_dir, image_files, mode, num_classes, decode=False):
+    """在工作程序中檢查一批圖片與對應的標籤檔。"""
+    result = {
+        'histogram': [0] * num_classes,
+        'unlabeled': 0,
+        'missing_labels': 0,
+        'invalid_labels': [],
+        'warnings': [],
+        'bad_images': [],
+    }
+    for image_file in image_files:
+        reader = QImageReader(os.path.join(images_dir, image_file))
+        if decode:
+            ok = not reader.read().isNull()
+        else:
+            ok = reader.canRead() and reader.size().isValid()
+        if not ok:
+            result['bad_images'].append((image_file, reader.errorString()))
+
+        label_file = label_filename_for(image_file)
+        try:
+            with open(os.path.join(label_dir, label_file), 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            result['missing_labels'] += 1
+            result['unlabeled'] += 1
+            continue
+        except (OSError, UnicodeDecodeError) as e:
+            result['invalid_labels'].append((label_file, f'read error: {e}'))
+            continue
+
+        class_idx, problem = check_label_lines(lines, mode, num_classes)
+        if class_idx is None:
+            if problem is None:
+                result['unlabeled'] += 1
+            else:
+                result['invalid_labels'].append((label_file, problem))
+            continue
+        if problem is not None:
+            result['warnings'].append((label_file, problem))
+        result['histogram'][class_idx] += 1
+    return result
+
+
+def find_orphaned_labels(label_dir, image_files):
+    """沒有對應圖片的標籤檔（相對路徑，使用 /）。"""
+    expected = {label_filename_for(f) for f in image_files}
+    orphaned = []
+    for path in iter_label_files(label_dir):
+        rel_path = os.path.relpath(path, label_dir).replace(os.sep, '/')
+        if rel_path not in expected:
+            orphaned.append(rel_path)
+    return sorted(orphaned)
+
+
+def validate_dataset(dataset_dir, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, decode=False):
+    """檢查整個資料集，回傳報告（dict）。"""
+    images_dir = os.path.join(dataset_dir, 'images')
+    if not os.path.isdir(images_dir):
+        raise FileNotFoundError(f'資料集內沒有 images 資料夾: {dataset_dir}')
+    label_dir = None
+    for name in ('labels', 'labelTxt'):
+        if os.path.isdir(os.path.join(dataset_dir, name)):
+            label_dir = os.path.join(dataset_dir, name)
+            break
+    if label_dir is None:
+        raise FileNotFoundError(f'資料集內沒有 labels 或 labelTxt 資料夾: {dataset_dir}')
+    classes, mode, mode_from_file = read_classes_file(os.path.join(label_dir, CLASSES_FILENAME))
+    if not classes:
+        raise ValueError(f'{label_dir} 的 classes.txt 沒有任何類別')
+
+    image_files = index_images(images_dir, os.path.join(label_dir, MANIFEST_FILENAME))
+    report = {
+        'dataset_dir': os.path.abspath(dataset_dir),
+        'classes': classes,
+        'mode': mode,
+        'mode_from_file': mode_from_file,
+        'images': len(image_files),
+        'histogram': dict.fromkeys(classes, 0),
+        'unlabeled': 0,
+        'missing_labels': 0,
+        'invalid_labels': [],
+        'warnings': [],
+        'bad_images': [],
+        'orphaned_labels': [],
+    }
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(validate_chunk, images_dir, label_dir, image_files[start:start + chunk_size],
+                                   mode, len(classes), decode)
+                   for start in range(0, len(image_files), chunk_size)]
+        # 程序池檢查圖片時，主程序同時掃描標籤資料夾找出 orphaned 標籤檔
+        report['orphaned_labels'] = find_orphaned_labels(label_dir, image_files)
+        for future in futures:
+            result = future.result()
+            for cls, count in zip(classes, result['histogram']):
+                report['histogram'][cls] += count
+            for key in ('unlabeled', 'missing_labels'):
+                report[key] += result[key]
+            for key in ('invalid_labels', 'warnings', 'bad_images'):
+                report[key].extend(result[key])
+    return report
+
+
+def _print_problems(title, problems):
+    print(f"{title}: {len(problems)}")
+    for problem in problems[:MAX_REPORTED_PROBLEMS]:
+        if isinstance(problem, (list, tuple)):
+            print(f"  {problem[0]}: {problem[1]}")
+        else:
+            print(f"  {problem}")
+    if len(problems) > MAX_REPORTED_PROBLEMS:
+        print(f"  ...另有 {len(problems) - MAX_REPORTED_PROBLEMS} 個")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='檢查資料集的圖片與標籤檔並輸出統計報告。')
+    parser.add_argument('dataset', help='含 images 與 labels 的資料集資料夾')
+    parser.add_argument('--workers', type=int, default=None, help='工作程序數量（預設為 CPU 核心數）')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='每個工作一次檢查的圖片數')
+    parser.add_argument('--decode', action='store_true', help='完整解碼每張圖片（較慢，預設只讀檔頭）')
+    parser.add_argument('--report', help='將完整報告寫入此 JSON 檔')
+    args = parser.parse_args(argv)
+
+    try:
+        report = validate_dataset(args.dataset, args.workers, args.chunk_size, args.decode)
+    except (OSError, ValueError) as e:
+        print(f"檢查失敗: {e}")
+        return 1
+
+    print(f"圖片: {report['images']}，標記模式: {report['mode']}，類別數: {len(report['classes'])}")
+    print("各類別數量:")
+    for cls, count in report['histogram'].items():
+        print(f"  {cls}: {count}")
+    print(f"未標記: {report['unlabeled']}（其中沒有標籤檔: {report['missing_labels']}）")
+    _print_problems("無法解析的標籤檔", report['invalid_labels'])
+    _print_problems("需要注意的標籤檔", report['warnings'])
+    _print_problems("無法讀取的圖片", report['bad_images'])
+    _print_problems("沒有對應圖片的標籤檔", report['orphaned_labels'])
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    problems = report['invalid_labels'] or report['bad_images'] or report['orphaned_labels']
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
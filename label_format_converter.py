@@ -0,0 +1,254 @@
+"""在 one-hot 與 true label 兩種標記模式之間批次轉換整個 labels 資料夾（不需開啟 GUI）。
+
+解析規則與 GUI 相同：每個標籤檔只看最後一行，one-hot 需為長度等於類別數的 0/1 向量
+（有多個 1 時以最後一個 1 為準，另外計數），true label 需為 0-based 且在範圍內的類別索引；
+最後一行以外的內容保持不變。
+所有標籤檔轉換完成後才更新 classes.txt 的 __mode__，中途中斷可直接重新執行。
+
+使用範例：
+    python label_format_converter.py path/to/dataset --to truelabel
+    python label_format_converter.py path/to/dataset/labels --to onehot --workers 8 --dry-run
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from label_utils import (CLASSES_FILENAME, LABEL_MODES, atomic_write_text, format_one_hot, parse_one_hot_line,
+                         parse_true_label_line, read_classes_file, write_classes_file)
+
+# 每個工作程序一次處理的檔案數
+DEFAULT_CHUNK_SIZE = 2000
+# 摘要中最多列出幾個無法解析的檔案
+MAX_REPORTED_FAILURES = 20
+
+
+def find_label_dir(path):
+    """接受資料集根目錄或 labels 資料夾本身。"""
+    for name in ('labels', 'labelTxt'):
+        candidate = os.path.join(path, name)
+        if os.path.isfile(os.path.join(candidate, CLASSES_FILENAME)):
+            return candidate
+    return path
+
+
+def iter_label_files(label_dir):
+    """以 os.scandir 遞迴列出所有標籤檔（排除 classes.txt 與 . 開頭的檔案）。"""
+    pending = [label_dir]
+    while pending:
+        directory = pending.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir():
+                    pending.append(entry.path)
+                elif entry.name.endswith('.txt') and entry.path != os.path.join(label_dir, CLASSES_FILENAME):
+                    yield entry.path
+
+
+def iter_chunks(iterable, chunk_size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _decode_int_rows(rows, width):
+    """把 rows（每列 width 個整數字串）一次轉成 (len(rows), width) 的矩陣，有任何非整數則回傳 None。"""
+    tokens = ' '.join(rows).split()
+    if len(tokens) != len(rows) * width:
+        return None
+    try:
+        return np.array(tokens, dtype=np.int64).reshape(len(rows), width)
+    except ValueError:
+        return None
+
+
+def decode_one_hot_rows(rows, num_classes):
+    """向量化解析 one-hot 列，回傳 (每列的類別索引, 每列 1 的個數)。
+
+    類別索引 -1 為全 0（未標記），-2 為無法解析；有多個 1 時與 GUI（decode_label_lines）一樣以最後一個 1 為準。
+    """
+    result = np.full(len(rows), -2, dtype=np.int64)
+    ones_per_row = np.zeros(len(rows), dtype=np.int64)
+    shaped = [i for i, row in enumerate(rows) if len(row.split()) == num_classes]
+    if not shaped:
+        return result, ones_per_row
+    matrix = _decode_int_rows([rows[i] for i in shaped], num_classes)
+    if matrix is None:
+        # 混有非整數內容時逐列以 GUI 的規則解析
+        parsed = [parse_one_hot_line(rows[i], num_classes) for i in shaped]
+        matrix = np.array([vec if vec is not None else [2] * num_classes for vec in parsed], dtype=np.int64)
+
+    binary = np.all((matrix == 0) | (matrix == 1), axis=1)
+    ones = np.where(binary, matrix.sum(axis=1), 0)
+    last_one = num_classes - 1 - matrix[:, ::-1].argmax(axis=1)
+    decoded = np.where(ones > 0, last_one, -1)
+    result[np.array(shaped)] = np.where(binary, decoded, -2)
+    ones_per_row[np.array(shaped)] = ones
+    return result, ones_per_row
+
+
+def decode_true_label_rows(rows, num_classes):
+    """向量化解析 true label 列，回傳每列的類別索引，無法解析或超出範圍為 -2。"""
+    result = np.full(len(rows), -2, dtype=np.int64)
+    # 只有剛好一個欄位的列才可能是 true label；空白列與多欄位的列不能放進合併解析，否則數值會錯位
+    shaped = [i for i, row in enumerate(rows) if len(row.split()) == 1]
+    if not shaped:
+        return result
+    values = _decode_int_rows([rows[i] for i in shaped], 1)
+    if values is None:
+        parsed = [parse_true_label_line(rows[i], num_classes) for i in shaped]
+        result[np.array(shaped)] = [-2 if v is None else v for v in parsed]
+        return result
+    values = values[:, 0]
+    result[np.array(shaped)] = np.where((values >= 0) & (values < num_classes), values, -2)
+    return result
+
+
+def convert_chunk(paths, source_mode, target_mode, num_classes, dry_run=False):
+    """轉換一批標籤檔，回傳 (統計, [(路徑, 原因), ...])。在工作程序中執行。"""
+    stats = {'converted': 0, 'already': 0, 'unlabeled': 0, 'failed': 0, 'multi_hot': 0}
+    failures = []
+    contents = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                contents.append(f.readlines())
+        except (OSError, UnicodeDecodeError) as e:
+            contents.append(None)
+            failures.append((path, f'read error: {e}'))
+
+    readable = [i for i, lines in enumerate(contents) if lines]
+    stats['unlabeled'] += sum(1 for lines in contents if lines == [])
+    last_lines = [contents[i][-1].strip() for i in readable]
+    if source_mode == 'onehot':
+        indices, ones = decode_one_hot_rows(last_lines, num_classes)
+        # 與 GUI 一樣以最後一個 1 轉換，另外計數供使用者確認
+        stats['multi_hot'] = int(np.count_nonzero(ones > 1))
+        indices = indices.tolist()
+    else:
+        indices = decode_true_label_rows(last_lines, num_classes).tolist()
+
+    # 來源格式解析失敗的列若已是目標格式，代表先前中斷的轉換已處理過（全 0 的 one-hot 視為未標記）
+    failed_pos = [pos for pos, class_idx in enumerate(indices) if class_idx == -2]
+    failed_rows = [last_lines[pos] for pos in failed_pos]
+    if target_mode == 'onehot':
+        already = decode_one_hot_rows(failed_rows, num_classes)[0].tolist()
+    else:
+        already = decode_true_label_rows(failed_rows, num_classes).tolist()
+    already_converted = {pos: target_idx for pos, target_idx in zip(failed_pos, already) if target_idx != -2}
+
+    # 目標格式的字串表，轉換時直接查表
+    if target_mode == 'onehot':
+        table = [format_one_hot(i, num_classes) for i in range(num_classes)]
+    else:
+        table = [str(i) for i in range(num_classes)]
+
+    for pos, (i, class_idx) in enumerate(zip(readable, indices)):
+        path = paths[i]
+        if class_idx == -1:
+            stats['unlabeled'] += 1
+            continue
+        if class_idx == -2:
+            if pos in already_converted:
+                stats['already' if already_converted[pos] >= 0 else 'unlabeled'] += 1
+            else:
+                failures.append((path, f'cannot parse last line as {source_mode}: {last_lines[pos]!r}'))
+            continue
+        lines = contents[i]
+        ending = '\n' if lines[-1].endswith('\n') else ''
+        lines[-1] = table[class_idx] + ending
+        if not dry_run:
+            try:
+                atomic_write_text(path, ''.join(lines), fsync=False)
+            except OSError as e:
+                failures.append((path, f'write error: {e}'))
+                continue
+        stats['converted'] += 1
+
+    stats['failed'] = len(failures)
+    return stats, failures
+
+
+def convert_labels(label_dir, target_mode, source_mode=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                   dry_run=False):
+    """轉換 label_dir 底下所有標籤檔並更新 classes.txt，回傳 (統計, 失敗清單)。"""
+    classes_file = os.path.join(label_dir, CLASSES_FILENAME)
+    classes, file_mode, mode_from_file = read_classes_file(classes_file)
+    if not classes:
+        raise ValueError(f'{classes_file} 沒有任何類別')
+    if source_mode is None:
+        source_mode = file_mode
+    elif mode_from_file and source_mode != file_mode:
+        raise ValueError(f'classes.txt 記錄的模式為 {file_mode}，與指定的來源模式 {source_mode} 不符')
+
+    totals = {'converted': 0, 'already': 0, 'unlabeled': 0, 'failed': 0, 'multi_hot': 0}
+    failures = []
+    if source_mode == target_mode:
+        return totals, failures
+
+    chunks = iter_chunks(iter_label_files(label_dir), chunk_size)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(convert_chunk, chunk, source_mode, target_mode, len(classes), dry_run)
+                   for chunk in chunks]
+        for future in futures:
+            stats, chunk_failures = future.result()
+            for key, value in stats.items():
+                totals[key] += value
+            failures.extend(chunk_failures)
+
+    if not dry_run:
+        write_classes_file(classes_file, classes, target_mode)
+    return totals, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='在 one-hot 與 true label 之間批次轉換標籤檔。')
+    parser.add_argument('path', help='資料集根目錄或 labels 資料夾')
+    parser.add_argument('--to', dest='target_mode', choices=LABEL_MODES, required=True, help='目標標記模式')
+    parser.add_argument('--from', dest='source_mode', choices=LABEL_MODES,
+                        help='來源標記模式（classes.txt 沒有 __mode__ 時使用，預設 onehot）')
+    parser.add_argument('--workers', type=int, default=None, help='工作程序數量（預設為 CPU 核心數）')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='每個工作一次處理的檔案數')
+    parser.add_argument('--dry-run', action='store_true', help='只統計，不寫入任何檔案')
+    parser.add_argument('--report', help='將所有無法解析的檔案寫入此文字檔')
+    args = parser.parse_args(argv)
+
+    label_dir = find_label_dir(args.path)
+    try:
+        totals, failures = convert_labels(label_dir, args.target_mode, args.source_mode, args.workers,
+                                          args.chunk_size, args.dry_run)
+    except (OSError, ValueError) as e:
+        print(f"轉換失敗: {e}")
+        return 1
+
+    print(f"標籤資料夾: {label_dir}")
+    if not any(totals.values()):
+        print("沒有需要轉換的標籤檔（可能已是目標模式）。")
+    print(f"已轉換: {totals['converted']}，先前已轉換: {totals['already']}，"
+          f"未標記: {totals['unlabeled']}，無法解析: {totals['failed']}")
+    if totals['multi_hot']:
+        print(f"其中 {totals['multi_hot']} 個 one-hot 標籤有多個 1，已與 GUI 一樣以最後一個 1 為準轉換。")
+    for path, reason in failures[:MAX_REPORTED_FAILURES]:
+        print(f"  {path}: {reason}")
+    if len(failures) > MAX_REPORTED_FAILURES:
+        print(f"  ...另有 {len(failures) - MAX_REPORTED_FAILURES} 個檔案")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            for path, reason in failures:
+                f.write(f"{path}\t{reason}\n")
+    if args.dry_run:
+        print("dry run：未寫入任何檔案。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,818 @@
+"""標籤檔相關的共用工具（不依賴 Qt，GUI 與命令列工具共用）。"""
+import hashlib
+import json
+import os
+import posixpath
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from profiling import PROFILER
+
+# 新建檔案的權限比照 open(path, 'w')：0o666 扣掉 umask
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# 視為圖片的副檔名（小寫）
+IMAGE_EXTENSIONS = ('.bmp', '.gif', '.jpeg', '.jpg', '.png', '.pbm', '.pgm', '.ppm', '.tif', '.tiff', '.webp')
+# 圖片清單快取，存放在 classes.txt 旁邊
+MANIFEST_FILENAME = '.image_manifest.json'
+MANIFEST_VERSION = 1
+
+CLASSES_FILENAME = 'classes.txt'
+# 標記模式：'onehot' 寫入 0/1 向量，'truelabel' 寫入 0-based 類別索引
+LABEL_MODES = ('onehot', 'truelabel')
+
+# 整個資料集的標籤索引快取，存放在 classes.txt 旁邊的隱藏資料夾
+LABEL_CACHE_DIRNAME = '.label_cache'
+LABEL_CACHE_VERSION = 1
+# 標籤快取中代表未標記（或最後一行無法解析）的值
+UNLABELED = -1
+# journal 背景 fsync 的間隔（秒）：這段時間內的多筆紀錄共用一次 fsync
+JOURNAL_FSYNC_INTERVAL = 0.5
+# LabelStore.load 每批讀取的檔案數，批次之間檢查是否已關閉
+LOAD_CHUNK_SIZE = 4096
+
+
+def label_filename_for(image_name):
+    """圖片檔名對應的標籤檔名：去掉最後一個副檔名後加上 .txt。"""
+    return image_name.rsplit('.', 1)[0] + '.txt'
+
+
+def read_classes_file(classes_file):
+    """讀取 classes.txt，回傳 (類別清單, 標記模式, 模式是否寫在檔案中)。"""
+    mode = 'onehot'
+    classes = []
+    mode_from_file = False
+    with open(classes_file, 'r', encoding='utf-8') as f:
+        for raw_line in f:
+            line = raw_line.strip()
+            if not line:
+                continue
+            if line.startswith('__mode__='):
+                val = line.split('=', 1)[1].strip().lower()
+                if val in LABEL_MODES:
+                    mode = val
+                    mode_from_file = True
+                continue
+            classes.append(line)
+    return classes, mode, mode_from_file
+
+
+def write_classes_file(classes_file, classes, mode):
+    """第一行記錄資料集的標記模式，後面每行為一個類別名稱。"""
+    lines = [f"__mode__={mode}\n"] + [f"{cls}\n" for cls in classes]
+    atomic_write_text(classes_file, ''.join(lines))
+
+
+def parse_one_hot_line(line, num_classes):
+    """嘗試將一行字串解析為 0/1 one-hot 向量，失敗則回傳 None。"""
+    if num_classes <= 0:
+        return None
+
+    parts = line.strip().split()
+    if len(parts) != num_classes:
+        return None
+
+    try:
+        vec = [int(p) for p in parts]
+    except ValueError:
+        return None
+
+    if any(v not in (0, 1) for v in vec):
+        return None
+
+    return vec
+
+
+def parse_true_label_line(line, num_classes):
+    """嘗試將一行字串解析為 0-based 類別索引，失敗或超出範圍則回傳 None。"""
+    try:
+        val = int(line.strip())
+    except ValueError:
+        return None
+    if 0 <= val < num_classes:
+        return val
+    return None
+
+
+def format_one_hot(class_idx, num_classes):
+    return " ".join('1' if i == class_idx else '0' for i in range(num_classes))
+
+
+def decode_label_lines(lines, mode, num_classes):
+    """依 GUI 的規則取得標籤檔代表的類別索引，未標記或無法解析時回傳 UNLABELED。
+
+    只看最後一行；one-hot 有多個 1 時與單選按鈕一樣以最後一個 1 為準。
+    """
+    if not lines:
+        return UNLABELED
+    last_line = lines[-1].strip()
+    if mode == 'truelabel':
+        idx = parse_true_label_line(last_line, num_classes)
+        return UNLABELED if idx is None else idx
+    vec = parse_one_hot_line(last_line, num_classes)
+    if vec is None or 1 not in vec:
+        return UNLABELED
+    return len(vec) - 1 - vec[::-1].index(1)
+
+
+def apply_label(lines, class_idx, mode, num_classes):
+    """回傳把 class_idx 寫入標籤檔內容後的新內容（與 GUI 存檔規則相同）。
+
+    最後一行已是合法標籤時覆寫該行，否則另起一行；空檔案直接寫入。
+    """
+    lines = list(lines)
+    if mode == 'truelabel':
+        value = f"{class_idx}"
+        parse = parse_true_label_line
+    else:
+        value = format_one_hot(class_idx, num_classes)
+        parse = parse_one_hot_line
+    if not lines:
+        lines.append(value)
+    elif parse(lines[-1].strip(), num_classes) is not None:
+        lines[-1] = value
+    else:
+        lines.append(f"\n{value}")
+    return lines
+
+
+def atomic_write_text(path, text, fsync=True):
+    """先寫入同目錄的暫存檔再 rename 取代，避免當機時留下寫到一半的檔案。"""
+    directory, base_name = os.path.split(path)
+    # 暫存檔以 . 開頭，不會被 label transfer 等工具當成標籤檔
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{base_name}.', suffix='.tmp', dir=directory or '.')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def is_image_file(name):
+    return not name.startswith('.') and name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def natural_sort_key(path):
+    """讓 img_2 排在 img_10 前面；原字串放在最後確保排序結果固定。"""
+    parts = re.split(r'(\d+)', path)
+    return [int(p) if i % 2 else p.lower() for i, p in enumerate(parts)], path
+
+
+def image_list_digest(image_files):
+    """圖片清單（含順序）的雜湊，給以圖片索引存放的快取檢查是否仍對應同一份清單。"""
+    return hashlib.blake2b('\n'.join(image_files).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _scan_directory(path):
+    """用 os.scandir 掃描單一資料夾，回傳 (圖片 [名稱, 大小, mtime_ns] 清單, 子資料夾名稱清單)。"""
+    files = []
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                subdirs.append(entry.name)
+            elif is_image_file(entry.name) and entry.is_file():
+                st = entry.stat()
+                files.append([entry.name, st.st_size, st.st_mtime_ns])
+    return files, subdirs
+
+
+def _load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('dirs', {})
+
+
+def index_images(images_dir, manifest_path=None, write_manifest=True):
+    """建立 images_dir 底下所有圖片的相對路徑清單（含子資料夾，使用 / 分隔，自然排序）。
+
+    若提供 manifest_path，會沿用上次的掃描結果，只重新掃描 mtime 有變動的資料夾
+    （新增、刪除或改名檔案都會更新資料夾 mtime），並把新的結果寫回 manifest（write_manifest 為 False 時不寫）。
+    """
+    cached_dirs = _load_manifest(manifest_path) if manifest_path else {}
+    dirs = {}
+    changed = False
+    pending = ['']
+    while pending:
+        rel_dir = pending.pop()
+        full_dir = os.path.join(images_dir, rel_dir) if rel_dir else images_dir
+        mtime_ns = os.stat(full_dir).st_mtime_ns
+        cached = cached_dirs.get(rel_dir)
+        if cached is not None and cached.get('mtime_ns') == mtime_ns:
+            files, subdirs = cached['files'], cached['subdirs']
+        else:
+            files, subdirs = _scan_directory(full_dir)
+            changed = True
+        dirs[rel_dir] = {'mtime_ns': mtime_ns, 'files': files, 'subdirs': subdirs}
+        pending.extend(f'{rel_dir}/{name}' if rel_dir else name for name in subdirs)
+
+    # 有資料夾被刪除時也要更新 manifest
+    if manifest_path and write_manifest and (changed or dirs.keys() != cached_dirs.keys()):
+        text = json.dumps({'version': MANIFEST_VERSION, 'dirs': dirs}, ensure_ascii=False, separators=(',', ':'))
+        atomic_write_text(manifest_path, text, fsync=False)
+
+    image_files = [f'{rel_dir}/{name}' if rel_dir else name
+                   for rel_dir, info in dirs.items()
+                   for name, _, _ in info['files']]
+    image_files.sort(key=natural_sort_key)
+    return image_files
+
+
+class LabelJournal:
+    """附加寫入的標記紀錄（JSON Lines），每筆記錄一個標籤檔修改前後的內容。
+
+    append 只寫入作業系統緩衝區，由背景執行緒每 fsync_interval 秒合併 fsync 一次。
+    標籤檔寫回磁碟後以 checkpoint 標記，重新啟動時只需重播最後一個 checkpoint 之後的紀錄。
+    關閉時所有紀錄都已 checkpoint 的 journal 直接刪除，不會在每次開啟資料集時重新讀取。
+    """
+
+    def __init__(self, path, session_id, fsync_interval=JOURNAL_FSYNC_INTERVAL):
+        self.path = path
+        self.session_id = session_id
+        self.fsync_interval = fsync_interval
+        self.last_seq = 0
+        self.checkpointed = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._pending = threading.Event()
+        self._stop = threading.Event()
+        self._syncer = threading.Thread(target=self._sync_loop, name='LabelJournalSync', daemon=True)
+        self._syncer.start()
+
+    def append(self, records):
+        """records 為 [(圖片相對路徑, 標籤檔名, 修改前內容, 修改後內容), ...]，回傳最後一筆的序號。"""
+        now = time.time()
+        with self._lock:
+            for image_file, label_filename, before, after in records:
+                self.last_seq += 1
+                self._file.write(json.dumps({
+                    'seq': self.last_seq,
+                    't': now,
+                    'session': self.session_id,
+                    'image': image_file,
+                    'label_file': label_filename,
+                    'before': list(before),
+                    'after': list(after),
+                }, ensure_ascii=False) + '\n')
+            self._file.flush()
+            self._pending.set()
+            return self.last_seq
+
+    def checkpoint(self, seq):
+        """記錄序號 seq（含）以前的紀錄都已寫回標籤檔。"""
+        self._write_marker({'checkpoint': seq})
+        self.checkpointed = max(self.checkpointed, seq)
+
+    def _write_marker(self, marker):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(json.dumps(marker) + '\n')
+            self._file.flush()
+            self._pending.set()
+
+    def sync(self):
+        with self._lock:
+            if not self._file.closed and self._pending.is_set():
+                self._pending.clear()
+                os.fsync(self._file.fileno())
+
+    def _sync_loop(self):
+        while not self._stop.is_set():
+            self._pending.wait()
+            self._stop.wait(self.fsync_interval)
+            try:
+                self.sync()
+            except OSError:
+                # 下一次 append 或 close 會再試一次
+                pass
+
+    def close(self):
+        """寫入結束標記並 fsync；之後的 append 會失敗。所有紀錄都已寫回時刪除 journal，回傳是否已刪除。"""
+        self._write_marker({'closed': True})
+        self._stop.set()
+        self._pending.set()
+        self._syncer.join()
+        with self._lock:
+            if not self._file.closed:
+                os.fsync(self._file.fileno())
+                self._file.close()
+        if self.checkpointed < self.last_seq:
+            return False
+        try:
+            os.remove(self.path)
+        except OSError:
+            # 留下的 journal 只剩已 checkpoint 的紀錄，下次開啟資料集時會被清掉
+            return False
+        return True
+
+
+def read_journal(path, markers=False):
+    """依序讀出 journal 的紀錄；寫到一半（當機）的最後一行會被略過。
+
+    markers 為 True 時也回傳 checkpoint 與結束標記。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+            if 'label_file' in record and 'after' in record:
+                yield record
+            elif markers and ('checkpoint' in record or 'closed' in record):
+                yield record
+
+
+def unmaterialized_records(path):
+    """journal 中尚未確認寫回標籤檔的紀錄，以及 journal 是否已正常關閉。"""
+    pending = []
+    closed = False
+    for record in read_journal(path, markers=True):
+        if 'checkpoint' in record:
+            pending = [r for r in pending if r.get('seq', 0) > record['checkpoint']]
+        elif 'closed' in record:
+            closed = True
+        else:
+            pending.append(record)
+    return pending, closed
+
+
+class LabelStore:
+    """標籤檔的記憶體模型。
+
+    載入資料集時一次讀入所有標籤檔，之後的修改只更新記憶體並標記為 dirty，
+    由背景執行緒在 flush_interval 秒內累積的變更一起以原子寫入寫回磁碟。
+    指定 journal 時，修改會先附加到 journal，寫回成功後再記錄 checkpoint，當機時可由 journal 重播。
+    """
+
+    def __init__(self, label_dir, flush_interval=2.0, max_workers=8, on_flushed=None, journal=None,
+                 before_flush=None):
+        self.label_dir = label_dir
+        self.flush_interval = flush_interval
+        self.max_workers = max_workers
+        # 每批寫入前以 [標籤檔名, ...]、寫入完成後以 [(標籤檔名, 內容), ...] 呼叫，可能在背景執行緒執行
+        self.before_flush = before_flush
+        self.on_flushed = on_flushed
+        self.journal = journal
+        # 標籤檔名 -> 檔案內容（readlines() 格式）
+        self._lines = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        # 避免背景寫入與 close() 的 flush 交錯，讓舊內容蓋掉新內容
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._writer = None
+        self._loader = None
+        # 最近一次寫入失敗的 (標籤檔名, 例外)，失敗的項目會保留為 dirty 下次重試
+        self.write_errors = []
+
+    def label_path(self, label_filename):
+        return os.path.join(self.label_dir, label_filename)
+
+    def load(self, label_filenames):
+        """平行讀取所有標籤檔；不存在的檔案視為空內容。已在記憶體中（可能已被修改）的項目不會被覆蓋。"""
+        label_filenames = list(label_filenames)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for start in range(0, len(label_filenames), LOAD_CHUNK_SIZE):
+                if self._stop.is_set():
+                    return
+                chunk = label_filenames[start:start + LOAD_CHUNK_SIZE]
+                contents = list(executor.map(self._read_file, chunk))
+                with self._lock:
+                    for label_filename, lines in zip(chunk, contents):
+                        self._lines.setdefault(label_filename, lines)
+
+    def load_in_background(self, label_filenames):
+        """在背景執行緒執行 load；完成前 get_lines 遇到尚未載入的檔案仍會直接讀取。"""
+        if self._loader is not None:
+            return
+        self._loader = threading.Thread(target=self.load, args=(list(label_filenames),), name='LabelStoreLoader',
+                                        daemon=True)
+        self._loader.start()
+
+    def _read_file(self, label_filename):
+        try:
+            with open(self.label_path(label_filename), 'r', encoding='utf-8') as f:
+                return f.readlines()
+        except FileNotFoundError:
+            return []
+
+    def get_lines(self, label_filename):
+        """回傳標籤內容的複本，尚未載入的檔案會在此時讀取。"""
+        with self._lock:
+            lines = self._lines.get(label_filename)
+        if lines is None:
+            lines = self._read_file(label_filename)
+            with self._lock:
+                lines = self._lines.setdefault(label_filename, lines)
+        return list(lines)
+
+    def set_lines(self, label_filename, lines):
+        """更新記憶體中的內容並排程寫回，內容未變更時不會產生寫入。"""
+        self.set_many([(label_filename, lines)])
+
+    def set_many(self, items, records=None):
+        """一次更新多個 [(標籤檔名, 內容), ...]，全部變更會在同一批寫入中寫回。
+
+        records 為對應的 journal 紀錄，與記憶體的更新在同一個鎖內附加，checkpoint 才不會漏掉。
+        """
+        changed = False
+        with self._lock:
+            if records and self.journal is not None:
+                self.journal.append(records)
+            for label_filename, lines in items:
+                lines = list(lines)
+                if self._lines.get(label_filename) == lines and label_filename not in self._dirty:
+                    continue
+                self._lines[label_filename] = lines
+                self._dirty.add(label_filename)
+                changed = True
+        if changed:
+            self._ensure_writer()
+            self._wake.set()
+
+    def dirty_count(self):
+        with self._lock:
+            return len(self._dirty)
+
+    def flush(self):
+        """立即把所有 dirty 項目寫回磁碟，回傳成功寫入的檔案數。"""
+        with self._flush_lock:
+            with self._lock:
+                batch = [(name, list(self._lines[name])) for name in self._dirty]
+                self._dirty.clear()
+                seq = self.journal.last_seq if self.journal is not None else 0
+            if not batch:
+                return 0
+
+            if self.before_flush is not None:
+                try:
+                    self.before_flush([name for name, _ in batch])
+                except Exception as e:
+                    self.write_errors.append((None, e))
+            errors = []
+            with PROFILER.stage('label_flush'):
+                if len(batch) == 1:
+                    results = [self._write_one(batch[0])]
+                else:
+                    with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                        results = list(executor.map(self._write_one, batch))
+            for (name, _), error in zip(batch, results):
+                if error is not None:
+                    errors.append((name, error))
+            if errors:
+                with self._lock:
+                    self._dirty.update(name for name, _ in errors)
+            elif self.journal is not None:
+                # 序號 seq 以前的修改都已在這一批或之前的批次寫回
+                self.journal.checkpoint(seq)
+            self.write_errors = errors
+            if self.on_flushed is not None:
+                failed = {name for name, _ in errors}
+                try:
+                    self.on_flushed([(name, lines) for name, lines in batch if name not in failed])
+                except Exception as e:
+                    # 回呼失敗不能讓背景寫入執行緒停止
+                    self.write_errors.append((None, e))
+            return len(batch) - len(errors)
+
+    def _write_one(self, item):
+        label_filename, lines = item
+        try:
+            label_path = self.label_path(label_filename)
+            # 圖片位於子資料夾時，標籤檔放在 labels 底下相同的子資料夾
+            os.makedirs(os.path.dirname(label_path), exist_ok=True)
+            atomic_write_text(label_path, ''.join(lines))
+        except Exception as e:
+            return e
+        return None
+
+    def _ensure_writer(self):
+        if self._writer is None and not self._stop.is_set():
+            self._writer = threading.Thread(target=self._writer_loop, name='LabelStoreWriter', daemon=True)
+            self._writer.start()
+
+    def _writer_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            # 去抖動：等一小段時間讓連續的修改合併成同一批寫入
+            self._stop.wait(self.flush_interval)
+            self.flush()
+
+    def close(self):
+        """停止背景寫入並同步寫回剩餘的變更。"""
+        self._stop.set()
+        self._wake.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if self._loader is not None:
+            self._loader.join()
+            self._loader = None
+        self.flush()
+
+
+def find_unlabeled(labeled_mask, start, step=1):
+    """從 start 往 step 方向（循環）尋找下一個 labeled_mask 為 False 的索引，全部已標記時回傳 None。
+
+    以 NumPy 對布林陣列做向量化掃描，百萬張圖片也只需不到 1 毫秒。
+    """
+    n = len(labeled_mask)
+    if n == 0:
+        return None
+    start %= n
+    if step > 0:
+        # 先找 start 之後，再從頭找到 start（含）
+        segments = ((start + 1, labeled_mask[start + 1:]), (0, labeled_mask[:start + 1]))
+        for offset, segment in segments:
+            if segment.size:
+                i = int(segment.argmin())
+                if not segment[i]:
+                    return offset + i
+    else:
+        # 反轉的 view 不會複製陣列，argmin 找到的是離 start 最近的位置
+        segments = ((start - 1, labeled_mask[:start][::-1]), (n - 1, labeled_mask[start:][::-1]))
+        for offset, segment in segments:
+            if segment.size:
+                i = int(segment.argmin())
+                if not segment[i]:
+                    return offset - i
+    return None
+
+
+class LabelIndex:
+    """GUI 用的記憶體標籤索引：每張圖片目前的類別，以及類別 -> 圖片索引（遞增排序的陣列）。
+
+    類別的成員陣列在第一次查詢時以 NumPy 建立並快取，標籤改變時只讓受影響的類別失效。
+    """
+
+    def __init__(self, labels, num_classes):
+        self.labels = np.array(labels, dtype=np.int16)
+        self.num_classes = num_classes
+        self.labeled = self.labels != UNLABELED
+        self.labeled_count = int(np.count_nonzero(self.labeled))
+        self._members = {}
+
+    def __len__(self):
+        return len(self.labels)
+
+    def set(self, img_ids, class_idx):
+        """把 img_ids（單一索引或索引陣列）的類別設為 class_idx。"""
+        ids = np.unique(np.atleast_1d(np.asarray(img_ids, dtype=np.intp)))
+        for old_class in np.unique(self.labels[ids]).tolist():
+            self._members.pop(old_class, None)
+        self._members.pop(class_idx, None)
+        self.labeled_count -= int(np.count_nonzero(self.labeled[ids]))
+        self.labels[ids] = class_idx
+        self.labeled[ids] = class_idx != UNLABELED
+        self.labeled_count += len(ids) if class_idx != UNLABELED else 0
+
+    def members(self, class_idx):
+        """屬於 class_idx（UNLABELED 為未標記）的圖片索引，不可修改。"""
+        ids = self._members.get(class_idx)
+        if ids is None:
+            ids = np.flatnonzero(self.labels == class_idx)
+            ids.flags.writeable = False
+            self._members[class_idx] = ids
+        return ids
+
+    def sorted_by_class(self):
+        """所有圖片依類別排序（未標記在最前面），同類別內維持原本順序。"""
+        return np.argsort(self.labels, kind='stable')
+
+
+def _atomic_save_npy(path, array):
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp',
+                                    dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _encode_names(image_files):
+    # 字串表：以換行分隔的 UTF-8 檔名，存成 uint8 陣列才能 mmap
+    return '\n'.join(image_files).encode('utf-8')
+
+
+def _label_dirs(image_files):
+    """標籤檔所在的各資料夾（相對於 labels，與圖片的子資料夾相同）。"""
+    return sorted({posixpath.dirname(f) for f in image_files})
+
+
+def _dir_mtime(label_dir, rel_dir):
+    try:
+        return os.stat(os.path.join(label_dir, rel_dir) if rel_dir else label_dir).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _label_dirs_stamp(label_dir, label_dirs):
+    """標籤檔所在各資料夾的 mtime，標籤檔被新增、取代或刪除時會改變。"""
+    return {rel_dir: _dir_mtime(label_dir, rel_dir) for rel_dir in label_dirs}
+
+
+class LabelCache:
+    """整個資料集的標籤索引快取，放在 labels/.label_cache/：
+
+    - labels.npy：int16 類別索引（UNLABELED 為未標記），順序與排序後的圖片清單一致
+    - names.npy：對應的圖片相對路徑字串表（換行分隔的 UTF-8，uint8）
+    - meta.json：類別、標記模式與建立時各標籤資料夾的 mtime
+
+    兩個 .npy 都可以用 np.load(mmap_mode='r') 直接映射；.npz 無法 mmap 所以分開存放。
+    open() 以唯讀方式映射，唯讀或共享的資料集也能直接使用；第一次寫入時才改成可寫入的映射，
+    無法寫入時改用記憶體中的複本。
+    標籤檔經由 LabelStore 寫入後以 update() 同步；其他工具以原子取代方式改寫標籤檔時
+    資料夾 mtime 會改變，快取會在下次開啟時視為過期並從 .txt 重建。
+    本程序寫入前會以 prepare_write() 確認資料夾的 mtime 仍是記錄中的值，寫入後只更新這些資料夾的記錄；
+    期間被其他工具改過的資料夾不再更新，外部的修改不會被本程序的寫入蓋過。
+    """
+
+    def __init__(self, label_dir):
+        self.label_dir = label_dir
+        self.cache_dir = os.path.join(label_dir, LABEL_CACHE_DIRNAME)
+        self.labels = None
+        self.classes = []
+        self.mode = 'onehot'
+        # 快取寫入失敗（例如唯讀的共享資料夾）時只保留記憶體中的陣列
+        self.persistent = False
+        self._image_files = []
+        # 資料夾 -> 記錄的 mtime；_foreign 為寫入前發現被其他工具改過的資料夾
+        self._stamp = {}
+        self._foreign = set()
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _write_meta(self):
+        meta = {
+            'version': LABEL_CACHE_VERSION,
+            'classes': self.classes,
+            'mode': self.mode,
+            'count': len(self._image_files),
+            'label_dirs': self._stamp,
+        }
+        atomic_write_text(self._path('meta.json'), json.dumps(meta, ensure_ascii=False), fsync=False)
+
+    def open(self, image_files, classes, mode):
+        """映射既有的快取；快取不存在或與圖片清單、classes.txt、標籤檔不一致時回傳 False。"""
+        try:
+            with open(self._path('meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if (meta.get('version') != LABEL_CACHE_VERSION or meta.get('classes') != list(classes)
+                    or meta.get('mode') != mode or meta.get('count') != len(image_files)):
+                return False
+            stamp = _label_dirs_stamp(self.label_dir, _label_dirs(image_files))
+            if meta.get('label_dirs') != stamp:
+                return False
+            names = np.load(self._path('names.npy'), mmap_mode='r')
+            if names.tobytes() != _encode_names(image_files):
+                return False
+            # 唯讀映射：只讀取快取不需要寫入權限，寫入前才以 _make_writable() 切換
+            labels = np.load(self._path('labels.npy'), mmap_mode='r')
+        except (OSError, ValueError):
+            return False
+        if labels.shape != (len(image_files),):
+            return False
+        self.labels = labels
+        self.classes = list(classes)
+        self.mode = mode
+        self._image_files = list(image_files)
+        self._stamp = stamp
+        self.persistent = True
+        return True
+
+    def build(self, image_files, classes, mode, lines_for, persist=True):
+        """由標籤檔內容重建快取，lines_for(i) 回傳第 i 張圖片的標籤檔內容。
+
+        寫入失敗時仍會保留記憶體中的陣列，並回傳該例外；成功回傳 None。persist 為 False 時只建立記憶體中的陣列。
+        """
+        self.classes = list(classes)
+        self.mode = mode
+        self._image_files = list(image_files)
+        labels = np.fromiter((decode_label_lines(lines_for(i), mode, len(classes)) for i in range(len(image_files))),
+                             dtype=np.int16, count=len(image_files))
+        if not persist:
+            self.labels = labels
+            self.persistent = False
+            return None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            _atomic_save_npy(self._path('names.npy'), np.frombuffer(_encode_names(image_files), dtype=np.uint8))
+            _atomic_save_npy(self._path('labels.npy'), labels)
+            # 最後寫 meta，資料夾 mtime 要在前面的檔案都寫完後才記錄
+            self._stamp = _label_dirs_stamp(self.label_dir, _label_dirs(image_files))
+            self._write_meta()
+            self.labels = np.load(self._path('labels.npy'), mmap_mode='r+')
+            self.persistent = True
+        except OSError as e:
+            self.labels = labels
+            self.persistent = False
+            return e
+        return None
+
+    def _make_writable(self):
+        """把唯讀映射換成可寫入的映射；沒有寫入權限時改用記憶體中的複本，不再寫回快取。需持有 _lock。"""
+        if self.labels.flags.writeable:
+            return
+        if self.persistent:
+            try:
+                labels = np.load(self._path('labels.npy'), mmap_mode='r+')
+            except (OSError, ValueError):
+                labels = None
+            # 映射後快取檔被取代時內容可能不同，以目前的陣列為準
+            if labels is not None and labels.shape == self.labels.shape and np.array_equal(labels, self.labels):
+                self.labels = labels
+                return
+        self.labels = np.array(self.labels)
+        self.persistent = False
+
+    def prepare_write(self, label_filenames):
+        """在本程序寫入這些標籤檔之前呼叫：資料夾的 mtime 已不是記錄中的值時，代表被其他工具改過。"""
+        with self._lock:
+            self._make_writable()
+            for rel_dir in {posixpath.dirname(name) for name in label_filenames}:
+                if rel_dir in self._stamp and _dir_mtime(self.label_dir, rel_dir) != self._stamp[rel_dir]:
+                    self._foreign.add(rel_dir)
+
+    def update(self, updates):
+        """更新 [(圖片索引, 標籤檔內容), ...]，應在對應的 .txt 寫入完成後呼叫。"""
+        with self._lock:
+            self._make_writable()
+            for img_id, lines in updates:
+                self.labels[img_id] = decode_label_lines(lines, self.mode, len(self.classes))
+            if self.persistent:
+                self.labels.flush()
+                # 只更新本程序剛寫入的資料夾；被其他工具改過的資料夾保留舊記錄，下次開啟時重建
+                for rel_dir in {posixpath.dirname(self._image_files[img_id]) for img_id, _ in updates}:
+                    if rel_dir not in self._foreign:
+                        self._stamp[rel_dir] = _dir_mtime(self.label_dir, rel_dir)
+                self._write_meta()
+
+
+def load_label_cache(image_files, label_dir, classes, mode, store=None, persist=True):
+    """開啟資料集的標籤快取，過期或不存在時從 .txt 重建（會把所有標籤檔讀進 store）。
+
+    快取有效時不會讀取標籤檔；有指定 store 時改在背景把所有標籤檔讀進 store。
+    persist 為 False 時不寫入 label_dir，過期的快取只在記憶體中重建。
+    回傳 (LabelCache, 重建時的寫入錯誤或 None)。
+    """
+    cache = LabelCache(label_dir)
+    label_filenames = [label_filename_for(f) for f in image_files]
+    if cache.open(image_files, classes, mode):
+        if store is not None:
+            store.load_in_background(label_filenames)
+        return cache, None
+    if store is None:
+        store = LabelStore(label_dir)
+    store.load(label_filenames)
+    error = cache.build(image_files, classes, mode, lambda i: store.get_lines(label_filenames[i]), persist)
+    return cache, error
+
+
+def read_label_cache(label_dir):
+    """給訓練程式使用：唯讀映射快取，回傳 (圖片相對路徑清單, int16 類別索引陣列)。"""
+    cache_dir = os.path.join(label_dir, LABEL_CACHE_DIRNAME)
+    names = np.load(os.path.join(cache_dir, 'names.npy'), mmap_mode='r')
+    labels = np.load(os.path.join(cache_dir, 'labels.npy'), mmap_mode='r')
+    image_files = names.tobytes().decode('utf-8').split('\n') if len(names) else []
+    return image_files, labels
@@ -0,0 +1,375 @@
+"""以感知雜湊（pHash / dHash）找出資料集中幾乎相同的圖片並分組，GUI 可把一個標籤套用到整組圖片。
+
+每張圖片以多個程序解碼成很小的灰階圖（JPEG 在 DCT 階段就縮小）後計算 64 位元雜湊，
+依圖片順序，每張尚未分組的圖片成為一組的代表，與代表的漢明距離不超過 threshold 且尚未分組的
+圖片歸入該組；不把距離相近的配對一路串連，緩慢變化的連續畫面不會被併成一大組不同的圖片。
+比對使用 multi-index hashing：64 位元切成 threshold + 1 段，距離不超過 threshold 的兩個雜湊
+至少有一段完全相同，所以只需比對某一段相同的雜湊，不必比對所有組合。
+
+結果存放在資料集資料夾的 .near_duplicates：
+    .near_duplicates/hashes.npy   uint64 每張圖片的雜湊（valid.npy 為 False 表示無法讀取）
+    .near_duplicates/groups.npy   int32 每張圖片的組別，不屬於任何一組為 -1
+    .near_duplicates/meta.json    雜湊方法、門檻與圖片清單的雜湊
+只調整 --threshold 重新分組時會沿用已算好的雜湊。
+
+使用範例：
+    python near_duplicates.py path/to/dataset
+    python near_duplicates.py path/to/dataset --hash dhash --threshold 6 --workers 16
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PyQt5.QtCore import QSize
+from PyQt5.QtGui import QImage, QImageReader
+
+from label_utils import MANIFEST_FILENAME, atomic_write_text, image_list_digest, index_images
+
+DUPLICATES_DIRNAME = '.near_duplicates'
+DUPLICATES_VERSION = 2
+HASH_METHODS = ('phash', 'dhash')
+DEFAULT_THRESHOLD = 4
+# 門檻越大分段越短，每段相同的雜湊越多；超過此值已不算近似重複
+MAX_THRESHOLD = 15
+# 每個工作程序一次計算的圖片數
+DEFAULT_CHUNK_SIZE = 512
+# 比對時一次展開的 XOR 矩陣元素數上限（每個元素 8 bytes）
+PAIR_BLOCK_ELEMENTS = 1 << 22
+
+# 各雜湊方法解碼成的灰階圖大小 (寬, 高)
+_HASH_INPUT_SIZE = {'phash': (32, 32), 'dhash': (9, 8)}
+# 32 點 DCT-II 的係數矩陣
+_DCT = np.cos(np.pi * np.outer(np.arange(32), 2 * np.arange(32) + 1) / 64)
+
+if hasattr(np, 'bitwise_count'):
+    # NumPy 2.0 以後有內建的 popcount
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def _popcount(x):
+        x = np.ascontiguousarray(x, dtype=np.uint64)
+        return _POPCOUNT_TABLE[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def duplicates_dir_for(dataset_dir):
+    return os.path.join(dataset_dir, DUPLICATES_DIRNAME)
+
+
+def _pack_bits(bits):
+    """(n, 64) bool 陣列轉成 n 個 uint64。"""
+    return np.packbits(bits, axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def phash(gray):
+    """(n, 32, 32) 灰階圖的 pHash：DCT 後取左上 8x8 低頻係數，與中位數比較。"""
+    coefficients = (_DCT @ gray.astype(np.float64) @ _DCT.T)[:, :8, :8].reshape(len(gray), 64)
+    return _pack_bits(coefficients > np.median(coefficients, axis=1, keepdims=True))
+
+
+def dhash(gray):
+    """(n, 8, 9) 灰階圖的 dHash：每一列左右相鄰像素的亮度差方向。"""
+    return _pack_bits((gray[:, :, 1:] > gray[:, :, :-1]).reshape(len(gray), 64))
+
+
+def _decode_gray(img_path, width, height):
+    reader = QImageReader(img_path)
+    reader.setScaledSize(QSize(width, height))
+    image = reader.read()
+    if image.isNull():
+        return None
+    image = image.convertToFormat(QImage.Format_Grayscale8)
+    if image.width() != width or image.height() != height:
+        return None
+    bits = image.constBits()
+    bits.setsize(image.bytesPerLine() * height)
+    return np.frombuffer(bits, dtype=np.uint8).reshape(height, image.bytesPerLine())[:, :width].copy()
+
+
+def hash_chunk(images_dir, image_files, method='phash'):
+    """在工作程序中計算一批圖片的雜湊，回傳 (uint64 雜湊, 是否成功的 bool 陣列)。"""
+    width, height = _HASH_INPUT_SIZE[method]
+    gray = np.zeros((len(image_files), height, width), dtype=np.uint8)
+    valid = np.zeros(len(image_files), dtype=bool)
+    for i, image_file in enumerate(image_files):
+        pixels = _decode_gray(os.path.join(images_dir, image_file), width, height)
+        if pixels is not None:
+            gray[i] = pixels
+            valid[i] = True
+    hashes = phash(gray) if method == 'phash' else dhash(gray)
+    hashes[~valid] = 0
+    return hashes, valid
+
+
+def _segments(threshold):
+    """把 64 位元切成 threshold + 1 段，回傳 [(位移, 遮罩), ...]。"""
+    count = threshold + 1
+    widths = [64 // count + (1 if i < 64 % count else 0) for i in range(count)]
+    segments = []
+    shift = 0
+    for width in widths:
+        segments.append((np.uint64(shift), np.uint64((1 << width) - 1)))
+        shift += width
+    return segments
+
+
+def _pairs_within(ids, hashes, threshold):
+    """ids 內兩兩距離不超過 threshold 的配對（每對只回傳一次）。"""
+    h = hashes[ids]
+    rows_per_block = max(1, PAIR_BLOCK_ELEMENTS // len(ids))
+    first, second = [], []
+    for start in range(0, len(ids), rows_per_block):
+        block = h[start:start + rows_per_block]
+        rows, cols = np.nonzero(_popcount(block[:, None] ^ h[None, start:]) <= threshold)
+        # cols 從 start 開始，只保留 j > i
+        keep = cols > rows
+        first.append(ids[rows[keep] + start])
+        second.append(ids[cols[keep] + start])
+    return np.concatenate(first), np.concatenate(second)
+
+
+def near_duplicate_pairs(hashes, threshold):
+    """回傳漢明距離不超過 threshold 的所有配對 (索引陣列, 索引陣列)；雜湊不應重複。"""
+    first, second = [np.zeros(0, dtype=np.intp)], [np.zeros(0, dtype=np.intp)]
+    for shift, mask in _segments(threshold):
+        keys = (hashes >> shift) & mask
+        order = np.argsort(keys, kind='stable')
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(order)]))
+        for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+            a, b = _pairs_within(order[start:end], hashes, threshold)
+            first.append(a)
+            second.append(b)
+    return np.concatenate(first), np.concatenate(second)
+
+
+def representative_groups(order, first, second):
+    """以代表分組：依 order 的順序，尚未分組的節點成為代表，與它配對且尚未分組的節點歸入該組。
+
+    回傳每個節點所屬組別的代表索引；每個成員與代表的距離都不超過門檻，不會經由其他成員串連。
+    """
+    count = len(order)
+    roots = np.arange(count)
+    if not len(first):
+        return roots
+    # 鄰接表（CSR），只需走訪有配對的節點
+    nodes = np.concatenate((first, second))
+    neighbours = np.concatenate((second, first))
+    by_node = np.argsort(nodes, kind='stable')
+    neighbours = neighbours[by_node]
+    starts = np.searchsorted(nodes[by_node], np.arange(count + 1))
+    assigned = np.zeros(count, dtype=bool)
+    for node in order[starts[order + 1] > starts[order]]:
+        if assigned[node]:
+            continue
+        assigned[node] = True
+        members = neighbours[starts[node]:starts[node + 1]]
+        members = members[~assigned[members]]
+        roots[members] = node
+        assigned[members] = True
+    return roots
+
+
+def group_hashes(hashes, valid, threshold=DEFAULT_THRESHOLD):
+    """依雜湊分組，回傳每張圖片的組別（int32，依組內第一張圖片排序；單獨一張為 -1）。"""
+    groups = np.full(len(hashes), -1, dtype=np.int32)
+    valid_ids = np.flatnonzero(valid)
+    # 完全相同的雜湊先合併，大量重複的畫面不會產生平方數量的配對
+    unique, first_index, inverse = np.unique(hashes[valid_ids], return_index=True, return_inverse=True)
+    first, second = near_duplicate_pairs(unique, threshold)
+    # 依每個雜湊第一次出現的圖片順序挑選代表
+    roots = representative_groups(np.argsort(first_index, kind='stable'), first, second)[inverse.ravel()]
+    sizes = np.bincount(roots, minlength=len(unique))
+    grouped = sizes[roots] > 1
+    _, group_ids = np.unique(roots[grouped], return_inverse=True)
+    groups[valid_ids[grouped]] = group_ids.ravel()
+    # 重新編號讓組別依第一張圖片的順序排列
+    if grouped.any():
+        order = np.unique(groups[groups >= 0], return_index=True)[1]
+        renumber = np.empty(len(order), dtype=np.int32)
+        renumber[np.argsort(order, kind='stable')] = np.arange(len(order), dtype=np.int32)
+        groups[groups >= 0] = renumber[groups[groups >= 0]]
+    return groups
+
+
+class DuplicateGroups:
+    """資料集的近似重複分組；members() 以預先排序的索引查詢，不必每次掃描整個陣列。"""
+
+    def __init__(self, dataset_dir):
+        self.cache_dir = duplicates_dir_for(dataset_dir)
+        self.groups = None
+        self.hashes = None
+        self.valid = None
+        self.meta = {}
+        self._order = None
+        self._starts = None
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _read_meta(self, image_files):
+        with open(self._path('meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if (meta.get('version') != DUPLICATES_VERSION or meta.get('count') != len(image_files)
+                or meta.get('names') != image_list_digest(image_files)):
+            return None
+        return meta
+
+    def load_hashes(self, image_files, method):
+        """讀取同一份圖片清單、同一種方法算好的雜湊，沒有則回傳 False。"""
+        try:
+            meta = self._read_meta(image_files)
+            if meta is None or meta.get('method') != method:
+                return False
+            hashes = np.load(self._path('hashes.npy'))
+            valid = np.load(self._path('valid.npy'))
+        except (OSError, ValueError):
+            return False
+        if hashes.shape != (len(image_files),) or valid.shape != hashes.shape:
+            return False
+        self.hashes, self.valid = hashes, valid
+        return True
+
+    def open(self, image_files):
+        """讀取分組結果；不存在或圖片清單已改變時回傳 False。"""
+        try:
+            meta = self._read_meta(image_files)
+            if meta is None:
+                return False
+            groups = np.load(self._path('groups.npy'))
+        except (OSError, ValueError):
+            return False
+        if groups.shape != (len(image_files),):
+            return False
+        self.meta = meta
+        self._set_groups(groups)
+        return True
+
+    def _set_groups(self, groups):
+        self.groups = groups
+        self._order = np.argsort(groups, kind='stable')
+        group_count = int(groups.max()) + 1 if len(groups) else 0
+        self._starts = np.searchsorted(groups[self._order], np.arange(group_count + 1))
+
+    def save(self, image_files, method, threshold, hashes, valid, groups):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for name, array in (('hashes.npy', hashes), ('valid.npy', valid), ('groups.npy', groups)):
+            fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=self.cache_dir)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, array)
+                os.replace(tmp_path, self._path(name))
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+        self.meta = {
+            'version': DUPLICATES_VERSION,
+            'method': method,
+            'threshold': threshold,
+            'count': len(image_files),
+            'names': image_list_digest(image_files),
+        }
+        atomic_write_text(self._path('meta.json'), json.dumps(self.meta), fsync=False)
+        self.hashes, self.valid = hashes, valid
+        self._set_groups(groups)
+
+    def group_count(self):
+        return len(self._starts) - 1
+
+    def members(self, img_id):
+        """與 img_id 同一組的所有圖片索引（遞增排序，含自己）。"""
+        group = self.groups[img_id]
+        if group < 0:
+            return np.array([img_id])
+        return self._order[self._starts[group]:self._starts[group + 1]]
+
+    def representatives(self, img_ids):
+        """img_ids 中每一組只保留第一張，不屬於任何一組的圖片全部保留，順序不變。"""
+        img_ids = np.asarray(img_ids)
+        groups = self.groups[img_ids]
+        grouped = np.flatnonzero(groups >= 0)
+        keep = groups < 0
+        keep[grouped[np.unique(groups[grouped], return_index=True)[1]]] = True
+        return img_ids[keep]
+
+
+def find_near_duplicates(dataset_dir, method='phash', threshold=DEFAULT_THRESHOLD, workers=None,
+                         chunk_size=DEFAULT_CHUNK_SIZE, rehash=False):
+    """計算（或沿用）所有圖片的雜湊並分組，回傳 (DuplicateGroups, 統計 dict)。"""
+    if method not in HASH_METHODS:
+        raise ValueError(f'不支援的雜湊方法: {method}')
+    if not 0 <= threshold <= MAX_THRESHOLD:
+        raise ValueError(f'門檻需介於 0 到 {MAX_THRESHOLD}')
+    images_dir = os.path.join(dataset_dir, 'images')
+    if not os.path.isdir(images_dir):
+        raise FileNotFoundError(f'資料集內沒有 images 資料夾: {dataset_dir}')
+    manifest_path = None
+    for name in ('labels', 'labelTxt'):
+        if os.path.isdir(os.path.join(dataset_dir, name)):
+            manifest_path = os.path.join(dataset_dir, name, MANIFEST_FILENAME)
+            break
+    image_files = index_images(images_dir, manifest_path)
+
+    duplicates = DuplicateGroups(dataset_dir)
+    reused = not rehash and duplicates.load_hashes(image_files, method)
+    if reused:
+        hashes, valid = duplicates.hashes, duplicates.valid
+    else:
+        hashes = np.zeros(len(image_files), dtype=np.uint64)
+        valid = np.zeros(len(image_files), dtype=bool)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [(start, executor.submit(hash_chunk, images_dir, image_files[start:start + chunk_size], method))
+                       for start in range(0, len(image_files), chunk_size)]
+            for start, future in futures:
+                chunk_hashes, chunk_valid = future.result()
+                hashes[start:start + len(chunk_hashes)] = chunk_hashes
+                valid[start:start + len(chunk_valid)] = chunk_valid
+
+    groups = group_hashes(hashes, valid, threshold)
+    duplicates.save(image_files, method, threshold, hashes, valid, groups)
+    grouped = int(np.count_nonzero(groups >= 0))
+    stats = {
+        'images': len(image_files),
+        'failed': int(np.count_nonzero(~valid)),
+        'groups': duplicates.group_count(),
+        'grouped_images': grouped,
+        # 每組只需標記一張時可省下的張數
+        'saved': grouped - duplicates.group_count(),
+        'reused_hashes': reused,
+    }
+    return duplicates, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='以感知雜湊找出近似重複的圖片並分組。')
+    parser.add_argument('dataset', help='含 images 資料夾的資料集資料夾')
+    parser.add_argument('--hash', choices=HASH_METHODS, default='phash', help='雜湊方法')
+    parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD,
+                        help='漢明距離不超過此值視為近似重複（0 為完全相同）')
+    parser.add_argument('--workers', type=int, default=None, help='工作程序數量（預設為 CPU 核心數）')
+    parser.add_argument('--rehash', action='store_true', help='重新計算雜湊（圖片內容被修改過時使用）')
+    args = parser.parse_args(argv)
+
+    try:
+        duplicates, stats = find_near_duplicates(args.dataset, args.hash, args.threshold, args.workers,
+                                                 rehash=args.rehash)
+    except (OSError, ValueError) as e:
+        print(f"分組失敗: {e}")
+        return 1
+    if stats['reused_hashes']:
+        print("沿用已計算的雜湊。")
+    print(f"共 {stats['images']} 張圖片，無法讀取 {stats['failed']} 張。")
+    print(f"近似重複: {stats['groups']} 組，共 {stats['grouped_images']} 張；每組只標記一張可少標 {stats['saved']} 張。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,302 @@
+"""以本機的分類模型在 CPU 上批次預測整個資料集，存下每張圖片前 k 個預測類別與信心分數。
+
+GUI 開啟資料集時讀取預測結果：未標記的圖片會預先勾選預測的類別（標記者只需確認），
+也可以依信心由低到高瀏覽未標記的圖片。預測結果不會寫入標籤檔。
+
+預測結果存放在資料集資料夾的 .predictions：
+    .predictions/classes.npy   int16 (圖片數, k)，由高到低的預測類別（無法讀取的圖片為 -1）
+    .predictions/scores.npy    float32 (圖片數, k)，對應的機率
+    .predictions/meta.json     類別、模型與圖片清單的雜湊（順序與 GUI 的圖片清單一致）
+
+推論後端可以替換：預設的 onnx 需要安裝 onnxruntime；也可以用 --backend 模組:工廠函式 指定其他實作，
+工廠函式以模型路徑呼叫，回傳的物件需有 input_size（寬, 高）與 predict(batch)，
+batch 為 uint8 RGB 陣列 (N, 高, 寬, 3)，predict 回傳 (N, 類別數) 的機率或 logits。
+
+使用範例：
+    python prelabel.py path/to/dataset model.onnx
+    python prelabel.py path/to/dataset model.onnx --batch-size 64 --workers 8 --top-k 3
+    python prelabel.py path/to/dataset weights.pt --backend my_models:load_classifier
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PyQt5.QtCore import QSize
+from PyQt5.QtGui import QImage, QImageReader
+
+from label_utils import (CLASSES_FILENAME, MANIFEST_FILENAME, atomic_write_text, image_list_digest, index_images,
+                         read_classes_file)
+
+PREDICTIONS_DIRNAME = '.predictions'
+PREDICTIONS_VERSION = 1
+DEFAULT_TOP_K = 3
+DEFAULT_BATCH_SIZE = 32
+# 模型輸入大小不固定時使用
+DEFAULT_INPUT_SIZE = 224
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def predictions_dir_for(dataset_dir):
+    return os.path.join(dataset_dir, PREDICTIONS_DIRNAME)
+
+
+class OnnxClassifier:
+    """以 onnxruntime 在 CPU 上執行的分類模型，輸入依 ImageNet 的平均值與標準差正規化。"""
+
+    def __init__(self, model_path, threads=None, mean=IMAGENET_MEAN, std=IMAGENET_STD):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError('使用 ONNX 模型需要安裝 onnxruntime（pip install onnxruntime）') from e
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        shape = model_input.shape
+        # NHWC 或 NCHW；不固定的維度在 onnxruntime 中是字串或 None
+        self.channels_last = shape[-1] == 3
+        height, width = (shape[1], shape[2]) if self.channels_last else (shape[2], shape[3])
+        if not isinstance(height, int) or not isinstance(width, int):
+            height = width = DEFAULT_INPUT_SIZE
+        self.input_size = (width, height)
+        # 匯出時固定 batch 為 1 的模型只能逐張推論
+        self.single_batch = shape[0] == 1
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+
+    def predict(self, batch):
+        inputs = (batch.astype(np.float32) / 255.0 - self.mean) / self.std
+        if not self.channels_last:
+            inputs = inputs.transpose(0, 3, 1, 2)
+        inputs = np.ascontiguousarray(inputs)
+        if self.single_batch:
+            outputs = [self.session.run(None, {self.input_name: inputs[i:i + 1]})[0] for i in range(len(inputs))]
+            return np.concatenate(outputs).reshape(len(batch), -1)
+        return self.session.run(None, {self.input_name: inputs})[0].reshape(len(batch), -1)
+
+
+def load_backend(backend, model_path, threads=None):
+    """'onnx' 或 '模組:工廠函式'，回傳推論用的模型物件。"""
+    if backend == 'onnx':
+        return OnnxClassifier(model_path, threads)
+    module_name, _, factory_name = backend.partition(':')
+    if not factory_name:
+        raise ValueError(f'後端格式應為 onnx 或 模組:工廠函式: {backend}')
+    factory = getattr(importlib.import_module(module_name), factory_name)
+    return factory(model_path)
+
+
+def load_batch(images_dir, image_files, input_size):
+    """解碼一批圖片並直接縮放到模型的輸入大小，回傳 (uint8 RGB 陣列, 是否成功的 bool 陣列)。"""
+    width, height = input_size
+    batch = np.zeros((len(image_files), height, width, 3), dtype=np.uint8)
+    ok = np.zeros(len(image_files), dtype=bool)
+    for i, image_file in enumerate(image_files):
+        reader = QImageReader(os.path.join(images_dir, image_file))
+        # JPEG 可在解碼時就縮小，不必先解出整張原圖
+        reader.setScaledSize(QSize(width, height))
+        image = reader.read()
+        if image.isNull():
+            continue
+        image = image.convertToFormat(QImage.Format_RGB888)
+        if image.width() != width or image.height() != height:
+            continue
+        bits = image.constBits()
+        bits.setsize(image.bytesPerLine() * height)
+        # 每一列可能有對齊用的填充位元組
+        rows = np.frombuffer(bits, dtype=np.uint8).reshape(height, image.bytesPerLine())
+        batch[i] = rows[:, :width * 3].reshape(height, width, 3)
+        ok[i] = True
+    return batch, ok
+
+
+def to_probabilities(scores):
+    """模型輸出已是機率（非負且每列總和為 1）時直接使用，否則視為 logits 做 softmax。"""
+    scores = np.asarray(scores, dtype=np.float32)
+    if scores.size and scores.min() >= 0 and np.allclose(scores.sum(axis=1), 1, atol=1e-3):
+        return scores
+    shifted = np.exp(scores - scores.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+def top_k(probabilities, k):
+    """回傳每列機率最高的 k 個 (類別, 機率)，由高到低排列。"""
+    k = min(k, probabilities.shape[1])
+    candidates = np.argpartition(-probabilities, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(probabilities, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+class PredictionCache:
+    """資料集的預測結果；classes 與 scores 以 mmap 唯讀開啟。"""
+
+    def __init__(self, dataset_dir):
+        self.cache_dir = predictions_dir_for(dataset_dir)
+        self.classes = None
+        self.scores = None
+        self.meta = {}
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def open(self, image_files, class_names):
+        """讀取預測結果；不存在或與目前的圖片清單、類別不一致時回傳 False。"""
+        try:
+            with open(self._path('meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if (meta.get('version') != PREDICTIONS_VERSION or meta.get('classes') != list(class_names)
+                    or meta.get('count') != len(image_files) or meta.get('names') != image_list_digest(image_files)):
+                return False
+            classes = np.load(self._path('classes.npy'), mmap_mode='r')
+            scores = np.load(self._path('scores.npy'), mmap_mode='r')
+        except (OSError, ValueError):
+            return False
+        if classes.shape != scores.shape or classes.shape[0] != len(image_files):
+            return False
+        self.classes = classes
+        self.scores = scores
+        self.meta = meta
+        return True
+
+    def save(self, image_files, class_names, classes, scores, model_info):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for name, array in (('classes.npy', classes), ('scores.npy', scores)):
+            fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=self.cache_dir)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, array)
+                os.replace(tmp_path, self._path(name))
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+        # 最後寫 meta，中途失敗時舊的 meta 與新的陣列大小不一致，開啟時會視為無效
+        meta = {
+            'version': PREDICTIONS_VERSION,
+            'classes': list(class_names),
+            'count': len(image_files),
+            'names': image_list_digest(image_files),
+            'model': model_info,
+        }
+        atomic_write_text(self._path('meta.json'), json.dumps(meta, ensure_ascii=False), fsync=False)
+        self.classes = classes
+        self.scores = scores
+        self.meta = meta
+
+    def top(self, img_id):
+        """第 img_id 張圖片的 [(類別索引, 機率), ...]，由高到低；沒有預測時為空清單。"""
+        return [(int(cls), float(score)) for cls, score in zip(self.classes[img_id], self.scores[img_id]) if cls >= 0]
+
+    def confidence(self):
+        """每張圖片最高的機率；沒有預測的圖片為 nan，np.argsort 會把它們排在最後。"""
+        return np.where(self.classes[:, 0] >= 0, self.scores[:, 0], np.nan)
+
+
+def predict_dataset(dataset_dir, model, top=DEFAULT_TOP_K, batch_size=DEFAULT_BATCH_SIZE, workers=None,
+                    model_info=None, progress=None):
+    """對資料集內所有圖片推論並寫入預測快取，回傳統計（dict）。
+
+    工作執行緒解碼與縮放圖片，主執行緒依序把每一批送進模型；最多預先解碼 2 * workers 批以限制記憶體用量。
+    """
+    images_dir = os.path.join(dataset_dir, 'images')
+    if not os.path.isdir(images_dir):
+        raise FileNotFoundError(f'資料集內沒有 images 資料夾: {dataset_dir}')
+    label_dir = None
+    for name in ('labels', 'labelTxt'):
+        if os.path.isdir(os.path.join(dataset_dir, name)):
+            label_dir = os.path.join(dataset_dir, name)
+            break
+    if label_dir is None:
+        raise FileNotFoundError(f'資料集內沒有 labels 或 labelTxt 資料夾: {dataset_dir}')
+    class_names, _, _ = read_classes_file(os.path.join(label_dir, CLASSES_FILENAME))
+    if not class_names:
+        raise ValueError(f'{label_dir} 的 classes.txt 沒有任何類別')
+
+    image_files = index_images(images_dir, os.path.join(label_dir, MANIFEST_FILENAME))
+    k = min(top, len(class_names))
+    classes = np.full((len(image_files), k), -1, dtype=np.int16)
+    scores = np.zeros((len(image_files), k), dtype=np.float32)
+    starts = range(0, len(image_files), batch_size)
+    workers = workers or os.cpu_count() or 1
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        next_starts = iter(starts)
+        for start in next_starts:
+            pending.append((start, executor.submit(load_batch, images_dir, image_files[start:start + batch_size],
+                                                   model.input_size)))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            start, future = pending.popleft()
+            following = next(next_starts, None)
+            if following is not None:
+                pending.append((following, executor.submit(load_batch, images_dir,
+                                                           image_files[following:following + batch_size],
+                                                           model.input_size)))
+            batch, ok = future.result()
+            failed += int(np.count_nonzero(~ok))
+            if ok.any():
+                probabilities = to_probabilities(model.predict(batch[ok]))
+                if probabilities.shape[1] != len(class_names):
+                    raise ValueError(f'模型輸出 {probabilities.shape[1]} 個類別，classes.txt 有 {len(class_names)} 個')
+                ids = start + np.flatnonzero(ok)
+                classes[ids], scores[ids] = top_k(probabilities, k)
+            if progress is not None:
+                progress(min(start + batch_size, len(image_files)), len(image_files))
+
+    PredictionCache(dataset_dir).save(image_files, class_names, classes, scores, model_info or {})
+    confidence = scores[:, 0][classes[:, 0] >= 0]
+    return {
+        'images': len(image_files),
+        'failed': failed,
+        'mean_confidence': float(confidence.mean()) if len(confidence) else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='以分類模型預先標記資料集（結果供 GUI 預先勾選，不寫入標籤檔）。')
+    parser.add_argument('dataset', help='含 images 與 labels 的資料集資料夾')
+    parser.add_argument('model', help='模型檔（預設為 ONNX）')
+    parser.add_argument('--backend', default='onnx', help='onnx，或以 模組:工廠函式 指定其他推論後端')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='每張圖片保存的預測數量')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='每次送進模型的圖片數')
+    parser.add_argument('--workers', type=int, default=None, help='解碼圖片的執行緒數量（預設為 CPU 核心數）')
+    parser.add_argument('--threads', type=int, default=None, help='onnxruntime 推論使用的執行緒數量')
+    args = parser.parse_args(argv)
+
+    try:
+        model = load_backend(args.backend, args.model, args.threads)
+        try:
+            st = os.stat(args.model)
+            model_info = {'path': os.path.abspath(args.model), 'backend': args.backend,
+                          'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+        except OSError:
+            model_info = {'path': args.model, 'backend': args.backend}
+
+        def progress(done, total):
+            print(f"\r推論中: {done} / {total}", end='', flush=True)
+
+        stats = predict_dataset(args.dataset, model, args.top_k, args.batch_size, args.workers, model_info, progress)
+    except (OSError, ValueError, ImportError, AttributeError) as e:
+        print(f"預先標記失敗: {e}")
+        return 1
+    print()
+    print(f"共 {stats['images']} 張圖片，無法讀取 {stats['failed']} 張，平均最高信心 {stats['mean_confidence']:.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""熱點路徑的計時工具：記錄各階段的耗時，計算 p50 / p95，並匯出 Chrome trace。
+
+只依賴標準函式庫與 NumPy（不依賴 Qt），label_utils 也可以使用。
+
+程式各處以共用的 PROFILER 標記要計時的階段：
+
+    with PROFILER.stage('decode'):
+        ...
+
+    @profiled('display')
+    def displayImageAndLabel(self, img_id):
+        ...
+
+停用時（預設）stage() 直接回傳共用的空物件，不讀取時間也不配置記憶體。
+設定環境變數 LABELING_PROFILE=1 可在啟動時啟用。
+匯出的 trace 檔可在 Chrome 的 chrome://tracing 或 https://ui.perfetto.dev 開啟。
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# 每個階段保留最近幾筆耗時用來計算百分位數
+DEFAULT_MAX_SAMPLES = 1000
+# trace 最多保留的事件數，超過時捨棄最舊的
+DEFAULT_MAX_EVENTS = 200000
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns() - self.start)
+        return False
+
+
+class Profiler:
+    """收集各階段的耗時；可在多個執行緒同時使用。"""
+
+    def __init__(self, max_samples=DEFAULT_MAX_SAMPLES, max_events=DEFAULT_MAX_EVENTS):
+        self.enabled = False
+        self.max_samples = max_samples
+        self._samples = {}
+        self._events = deque(maxlen=max_events)
+        self._thread_names = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+
+    def stage(self, name):
+        """計時 with 區塊的 context manager。"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, start_ns, duration_ns):
+        thread_id = threading.get_ident()
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.max_samples)
+            samples.append(duration_ns)
+            self._events.append((name, start_ns, duration_ns, thread_id))
+            if thread_id not in self._thread_names:
+                self._thread_names[thread_id] = threading.current_thread().name
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._events.clear()
+
+    def summary(self):
+        """{階段: {'n', 'p50_ms', 'p95_ms', 'max_ms'}}，依階段名稱排序。"""
+        with self._lock:
+            samples = {name: np.fromiter(values, dtype=np.int64, count=len(values))
+                       for name, values in self._samples.items() if values}
+        result = {}
+        for name in sorted(samples):
+            ms = samples[name] / 1e6
+            p50, p95 = np.percentile(ms, (50, 95))
+            result[name] = {'n': len(ms), 'p50_ms': float(p50), 'p95_ms': float(p95), 'max_ms': float(ms.max())}
+        return result
+
+    def export_chrome_trace(self, path):
+        """以 Chrome trace event 格式（完整事件 ph='X'，時間單位微秒）寫入 path，回傳事件數。"""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+            thread_names = dict(self._thread_names)
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id, 'args': {'name': name}}
+                 for thread_id, name in thread_names.items()]
+        trace.extend({'name': name, 'cat': 'labeling', 'ph': 'X', 'pid': pid, 'tid': thread_id,
+                      'ts': (start - self._origin) / 1000, 'dur': duration / 1000}
+                     for name, start, duration, thread_id in events)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+        return len(events)
+
+
+PROFILER = Profiler()
+PROFILER.set_enabled(os.environ.get('LABELING_PROFILE', '') not in ('', '0'))
+
+
+def profiled(name):
+    """把整個函式當作一個階段計時的裝飾器；停用時只多一層函式呼叫。"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with _Stage(PROFILER, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
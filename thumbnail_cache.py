@@ -0,0 +1,299 @@
+"""標記畫面用的縮圖磁碟快取，也可從命令列預先產生整個資料集的縮圖。
+
+縮圖存放在資料集資料夾（labels 旁邊）的 .thumbnails，以圖片的絕對路徑、mtime 與檔案大小為鍵，
+原始圖片被修改後自動產生新的縮圖。GUI 在沒有縮圖時才解碼原始圖片，縮圖由背景執行緒產生。
+快取總大小超過 max_bytes 時依最後使用時間（讀取時更新縮圖的 mtime）淘汰最久未使用的縮圖。
+
+使用範例：
+    python thumbnail_cache.py path/to/dataset
+    python thumbnail_cache.py path/to/dataset --workers 8 --size 1024 --max-size-mb 8192
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage, QImageReader
+
+from label_utils import MANIFEST_FILENAME, index_images
+from profiling import PROFILER
+
+THUMBNAIL_DIRNAME = '.thumbnails'
+# 縮圖的最長邊；圖片縮放到顯示區域後超過此值時直接解碼原始圖片
+THUMBNAIL_SIZE = 1024
+THUMBNAIL_QUALITY = 90
+# 縮圖快取的大小上限；超過時淘汰到上限的 PRUNE_RATIO，避免每產生一張就整理一次
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024 * 1024
+PRUNE_RATIO = 0.9
+# 每個工作程序一次處理的圖片數
+DEFAULT_CHUNK_SIZE = 64
+
+
+def thumbnail_dir_for(dataset_dir):
+    return os.path.join(dataset_dir, THUMBNAIL_DIRNAME)
+
+
+def _read_within(reader, width, height):
+    """解碼時就縮小到 (width, height) 以內，不先配置整張原始大小的圖片。
+
+    JPEG 會在 DCT 階段直接縮小；不支援縮放解碼的格式由 Qt 解碼後再縮小。原圖較小時照原尺寸解碼。
+    """
+    size = reader.size()
+    if size.isValid() and (size.width() > width or size.height() > height):
+        reader.setScaledSize(size.scaled(width, height, Qt.KeepAspectRatio))
+    return reader.read()
+
+
+def decode_scaled(img_path, width, height):
+    """解碼圖片並等比例縮放到指定大小，失敗則回傳空的 QImage。"""
+    with PROFILER.stage('decode'):
+        image = _read_within(QImageReader(img_path), width, height)
+    if image.isNull():
+        return image
+    # 已是目標大小時 scaled 不會複製；較小的圖片則與以前一樣放大顯示
+    with PROFILER.stage('scale'):
+        return image.scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+
+class ThumbnailCache:
+    """以 (路徑, mtime, 大小) 為鍵的 JPEG 縮圖快取；可在多個執行緒或程序同時使用。
+
+    max_bytes 為 None 時不限制大小（由呼叫端自行 prune）。
+    """
+
+    def __init__(self, cache_dir, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.quality = quality
+        self.max_bytes = max_bytes
+        # 目前快取的總位元組數，第一次產生縮圖時才掃描
+        self._bytes = None
+        self._lock = threading.Lock()
+        self._pruning = False
+
+    def path_for(self, img_path):
+        """縮圖的路徑；原始圖片不存在時回傳 None。"""
+        try:
+            st = os.stat(img_path)
+        except OSError:
+            return None
+        key = f'{os.path.abspath(img_path)}\0{st.st_mtime_ns}\0{st.st_size}\0{self.size}'
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+        # 以前兩個字元分資料夾，避免單一資料夾有上百萬個檔案
+        return os.path.join(self.cache_dir, digest[:2], digest + '.jpg')
+
+    def load(self, img_path, width, height, create=True):
+        """回傳等比例縮放到 (width, height) 的圖片，優先讀取縮圖，沒有則由原始圖片產生。
+
+        create 為 False 時沒有縮圖就直接把原始圖片解碼到顯示大小，不產生縮圖（GUI 執行緒使用，
+        縮圖改由背景的 ensure 產生）。
+        """
+        if (width > self.size or height > self.size) and not self._fits_thumbnail(img_path, width, height):
+            return decode_scaled(img_path, width, height)
+        thumb_path = self.path_for(img_path)
+        if thumb_path is not None:
+            with PROFILER.stage('decode_thumbnail'):
+                image = _read_within(QImageReader(thumb_path), width, height)
+            if not image.isNull():
+                self._touch(thumb_path)
+                with PROFILER.stage('scale'):
+                    return image.scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        if not create:
+            return decode_scaled(img_path, width, height)
+        with PROFILER.stage('create_thumbnail'):
+            thumbnail = self._create(img_path, thumb_path)
+        if thumbnail.isNull():
+            return thumbnail
+        with PROFILER.stage('scale'):
+            return thumbnail.scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+    def _fits_thumbnail(self, img_path, width, height):
+        """圖片等比例縮放到 (width, height) 後是否不超過縮圖大小（只讀檔頭取得原始大小）。
+
+        顯示區域比縮圖大時，圖片的長寬比與顯示區域不同，縮放後仍可能在縮圖大小以內。
+        """
+        size = QImageReader(img_path).size()
+        if not size.isValid():
+            return False
+        fitted = size.scaled(width, height, Qt.KeepAspectRatio)
+        return fitted.width() <= self.size and fitted.height() <= self.size
+
+    def ensure(self, img_path):
+        """確保縮圖存在，回傳 'cached'、'created'、'small'（原圖已小於縮圖不需快取）或 'failed'。"""
+        thumb_path = self.path_for(img_path)
+        if thumb_path is not None and os.path.exists(thumb_path):
+            return 'cached'
+        size = QImageReader(img_path).size()
+        if size.isValid() and size.width() <= self.size and size.height() <= self.size:
+            return 'small'
+        if self._create(img_path, thumb_path).isNull():
+            return 'failed'
+        return 'created'
+
+    def _create(self, img_path, thumb_path):
+        """解碼原始圖片並寫入縮圖（原圖不比縮圖大時不寫入），回傳縮圖大小的圖片。"""
+        reader = QImageReader(img_path)
+        original = reader.size()
+        thumbnail = _read_within(reader, self.size, self.size)
+        if thumbnail.isNull():
+            return thumbnail
+        if thumbnail.width() > self.size or thumbnail.height() > self.size:
+            # 無法事先讀取大小的格式
+            thumbnail = thumbnail.scaled(self.size, self.size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        elif not (original.isValid() and (original.width() > self.size or original.height() > self.size)):
+            return thumbnail
+        if thumb_path is not None:
+            try:
+                self._save(thumbnail, thumb_path)
+                self._added(os.path.getsize(thumb_path))
+            except OSError:
+                # 快取只是加速用，寫不進去（唯讀資料夾、磁碟已滿）時照常顯示
+                pass
+        return thumbnail
+
+    @staticmethod
+    def _touch(thumb_path):
+        # 以 mtime 記錄最後使用時間（atime 常被停用），淘汰時最久未使用的先刪除
+        try:
+            os.utime(thumb_path)
+        except OSError:
+            pass
+
+    def _added(self, nbytes):
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += nbytes
+            needs_prune = self._bytes is None or self._bytes > self.max_bytes
+            if not needs_prune or self._pruning:
+                return
+            self._pruning = True
+        try:
+            self.prune()
+        finally:
+            with self._lock:
+                self._pruning = False
+
+    def _entries(self):
+        """快取內所有縮圖的 [(mtime, 大小, 路徑), ...]。"""
+        entries = []
+        try:
+            subdirs = [entry.path for entry in os.scandir(self.cache_dir) if entry.is_dir()]
+        except OSError:
+            return entries
+        for subdir in subdirs:
+            try:
+                with os.scandir(subdir) as it:
+                    for entry in it:
+                        if entry.name.endswith('.jpg') and not entry.name.startswith('.'):
+                            st = entry.stat()
+                            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+            except OSError:
+                continue
+        return entries
+
+    def prune(self, max_bytes=None):
+        """總大小超過 max_bytes（預設為 self.max_bytes）時，刪除最久未使用的縮圖直到其 PRUNE_RATIO 以下。
+
+        回傳 (刪除的檔案數, 剩下的位元組數)。
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        if max_bytes is not None and total > max_bytes:
+            target = max_bytes * PRUNE_RATIO
+            entries.sort()
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        with self._lock:
+            self._bytes = total
+        return removed, total
+
+    def _save(self, thumbnail, thumb_path):
+        directory = os.path.dirname(thumb_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.jpg')
+        os.close(fd)
+        try:
+            if not thumbnail.convertToFormat(QImage.Format_RGB32).save(tmp_path, 'JPG', self.quality):
+                raise OSError(f'cannot encode thumbnail: {thumb_path}')
+            os.replace(tmp_path, thumb_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+def _warm_chunk(cache_dir, size, quality, img_paths):
+    """在工作程序中產生一批縮圖，回傳各結果的數量。大小上限由主程序在最後統一處理。"""
+    cache = ThumbnailCache(cache_dir, size, quality, max_bytes=None)
+    stats = {'cached': 0, 'created': 0, 'small': 0, 'failed': 0}
+    for img_path in img_paths:
+        stats[cache.ensure(img_path)] += 1
+    return stats
+
+
+def warm_thumbnails(dataset_dir, workers=None, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY,
+                    chunk_size=DEFAULT_CHUNK_SIZE, max_bytes=DEFAULT_MAX_BYTES):
+    """以多個程序為資料集內所有圖片預先產生縮圖，最後把快取縮小到 max_bytes 以內，回傳統計（dict）。"""
+    images_dir = os.path.join(dataset_dir, 'images')
+    if not os.path.isdir(images_dir):
+        raise FileNotFoundError(f'資料集內沒有 images 資料夾: {dataset_dir}')
+    manifest_path = None
+    for name in ('labels', 'labelTxt'):
+        if os.path.isdir(os.path.join(dataset_dir, name)):
+            manifest_path = os.path.join(dataset_dir, name, MANIFEST_FILENAME)
+            break
+    img_paths = [os.path.join(images_dir, name) for name in index_images(images_dir, manifest_path)]
+
+    cache_dir = thumbnail_dir_for(dataset_dir)
+    totals = {'cached': 0, 'created': 0, 'small': 0, 'failed': 0}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_warm_chunk, cache_dir, size, quality, img_paths[start:start + chunk_size])
+                   for start in range(0, len(img_paths), chunk_size)]
+        for future in futures:
+            for key, value in future.result().items():
+                totals[key] += value
+    totals['pruned'], totals['bytes'] = ThumbnailCache(cache_dir, size, quality, max_bytes).prune()
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='預先產生標記畫面使用的縮圖快取。')
+    parser.add_argument('dataset', help='含 images 資料夾的資料集資料夾')
+    parser.add_argument('--workers', type=int, default=None, help='工作程序數量（預設為 CPU 核心數）')
+    parser.add_argument('--size', type=int, default=THUMBNAIL_SIZE, help='縮圖最長邊的像素數')
+    parser.add_argument('--quality', type=int, default=THUMBNAIL_QUALITY, help='JPEG 品質（0-100）')
+    parser.add_argument('--max-size-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help='縮圖快取的大小上限（MB），超過時刪除最久未使用的縮圖')
+    args = parser.parse_args(argv)
+
+    try:
+        totals = warm_thumbnails(args.dataset, args.workers, args.size, args.quality,
+                                 max_bytes=args.max_size_mb * 1024 * 1024)
+    except OSError as e:
+        print(f"產生縮圖失敗: {e}")
+        return 1
+    print(f"新產生: {totals['created']}，已存在: {totals['cached']}，"
+          f"原圖較小不需縮圖: {totals['small']}，無法讀取: {totals['failed']}")
+    print(f"快取大小: {totals['bytes'] / (1024 * 1024):.1f} MB，超過上限刪除: {totals['pruned']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
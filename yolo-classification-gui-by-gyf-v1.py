@@ -1,12 +1,501 @@
 import sys
 import os
+import threading
+from collections import OrderedDict
 import numpy as np
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QLineEdit, QRadioButton, QButtonGroup, QFileDialog, QMessageBox, QWidget, QStackedWidget, QDesktopWidget)
-from PyQt5.QtGui import QPixmap
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QLineEdit, QRadioButton, QButtonGroup, QFileDialog, QMessageBox, QWidget, QStackedWidget, QDesktopWidget, QListView, QAbstractItemView, QSizePolicy, QShortcut, QStyleOptionViewItem, QComboBox, QListWidget, QListWidgetItem, QCheckBox)
+from PyQt5.QtGui import QPixmap, QImage, QKeySequence
+from PyQt5.QtCore import (Qt, QObject, QRunnable, QThreadPool, QStringListModel, QAbstractListModel, QModelIndex, QPoint,
+                          QSize, QTimer, pyqtSignal)
 from PyQt5.QtGui import QFont
+from label_utils import (CLASSES_FILENAME, MANIFEST_FILENAME, UNLABELED, LabelIndex, LabelStore, apply_label,
+                         decode_label_lines, find_unlabeled, index_images, label_filename_for, load_label_cache, parse_one_hot_line,
+                         parse_true_label_line, read_classes_file, write_classes_file)
+from thumbnail_cache import ThumbnailCache, decode_scaled, thumbnail_dir_for
+from annotation_sessions import (DEFAULT_SHARD_SIZE, HEARTBEAT_INTERVAL, AnnotationSession, JournalLease, new_session_id,
+                                 open_journal, recover_journals)
+from prelabel import PredictionCache
+from near_duplicates import DuplicateGroups
+from profiling import PROFILER, profiled
+
+
+def load_scaled_image(img_path, width, height, thumbnails=None, create_thumbnail=True):
+    """解碼圖片並等比例縮放到指定大小，失敗則回傳空的 QImage（可在背景執行緒呼叫）。
+
+    create_thumbnail 為 False 時沒有縮圖也不在這裡產生（GUI 執行緒不做 JPEG 編碼）。
+    """
+    if thumbnails is not None:
+        return thumbnails.load(img_path, width, height, create_thumbnail)
+    return decode_scaled(img_path, width, height)
+
+
+class PixmapLRUCache:
+    """以位元組總量為上限的 QPixmap LRU 快取，只能在 GUI 執行緒使用。"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        pixmap = self._items.get(key)
+        if pixmap is not None:
+            # 最近使用過的移到尾端
+            self._items.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        if key in self._items:
+            self.current_bytes -= self._pixmap_bytes(self._items.pop(key))
+        self._items[key] = pixmap
+        self.current_bytes += self._pixmap_bytes(pixmap)
+        # 超過上限時從最久未使用的開始淘汰，但至少保留剛放入的這張
+        while self.current_bytes > self.max_bytes and len(self._items) > 1:
+            _, evicted = self._items.popitem(last=False)
+            self.current_bytes -= self._pixmap_bytes(evicted)
+
+    def clear(self):
+        self._items.clear()
+        self.current_bytes = 0
+
+    @staticmethod
+    def _pixmap_bytes(pixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+
+class _DecodeSignals(QObject):
+    # (快取鍵, 解碼後的 QImage)；QImage 可跨執行緒傳遞，QPixmap 則只能在 GUI 執行緒建立
+    decoded = pyqtSignal(object, QImage)
+
+
+class _DecodeTask(QRunnable):
+    def __init__(self, key, signals, thumbnails=None):
+        super().__init__()
+        self.key = key
+        self.signals = signals
+        self.thumbnails = thumbnails
+
+    def run(self):
+        img_path, width, height = self.key
+        with PROFILER.stage('prefetch'):
+            image = load_scaled_image(img_path, width, height, self.thumbnails)
+        self.signals.decoded.emit(self.key, image)
+
+
+class _ThumbnailTask(QRunnable):
+    def __init__(self, img_path, thumbnails, prefetcher):
+        super().__init__()
+        self.img_path = img_path
+        self.thumbnails = thumbnails
+        self.prefetcher = prefetcher
+
+    def run(self):
+        # 同一張圖片已在其他執行緒產生（或已完成）時不再重複編碼
+        if not self.prefetcher._start_thumbnail(self.img_path):
+            return
+        try:
+            self.thumbnails.ensure(self.img_path)
+        finally:
+            self.prefetcher._finish_thumbnail(self.img_path)
+
+
+class ImagePrefetcher(QObject):
+    """在背景執行緒預先解碼並縮放前後幾張圖片，結果放入 PixmapLRUCache。"""
+    # 解碼結果放入快取後送出快取鍵
+    imageReady = pyqtSignal(object)
+
+    def __init__(self, cache, max_threads=2, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.signals = _DecodeSignals(self)
+        self.signals.decoded.connect(self._on_decoded)
+        self._pending = set()
+        # 等待在背景產生縮圖的原始圖片路徑（GUI 執行緒同步解碼過、還沒有縮圖的圖片），
+        # 其中已開始產生的放在 _running_thumbnails；兩者都由背景執行緒更新，以 _thumbnail_lock 保護
+        self._pending_thumbnails = set()
+        self._running_thumbnails = set()
+        self._thumbnail_lock = threading.Lock()
+        # 目前資料集的縮圖快取（ThumbnailCache），None 表示一律解碼原始圖片
+        self.thumbnails = None
+
+    def prefetch(self, keys):
+        """依序排入尚未快取的鍵；先前排隊但還沒開始的工作會被取消（還沒開始產生的縮圖會重新排入）。"""
+        self.pool.clear()
+        self._pending.clear()
+        for key in keys:
+            if key in self.cache or key in self._pending:
+                continue
+            self._pending.add(key)
+            self.pool.start(_DecodeTask(key, self.signals, self.thumbnails))
+        with self._thumbnail_lock:
+            queued = self._pending_thumbnails - self._running_thumbnails
+        for img_path in queued:
+            self.pool.start(_ThumbnailTask(img_path, self.thumbnails, self))
+
+    def ensure_thumbnail(self, img_path):
+        """在背景產生 img_path 的縮圖（已存在時只檢查一次）。"""
+        if self.thumbnails is None:
+            return
+        with self._thumbnail_lock:
+            if img_path in self._pending_thumbnails:
+                return
+            self._pending_thumbnails.add(img_path)
+        self.pool.start(_ThumbnailTask(img_path, self.thumbnails, self))
+
+    def _start_thumbnail(self, img_path):
+        """由背景執行緒呼叫：還需要產生且沒有其他執行緒正在產生時標記為產生中並回傳 True。"""
+        with self._thumbnail_lock:
+            if img_path not in self._pending_thumbnails or img_path in self._running_thumbnails:
+                return False
+            self._running_thumbnails.add(img_path)
+            return True
+
+    def _finish_thumbnail(self, img_path):
+        with self._thumbnail_lock:
+            self._running_thumbnails.discard(img_path)
+            self._pending_thumbnails.discard(img_path)
+
+    def _on_decoded(self, key, image):
+        self._pending.discard(key)
+        if not image.isNull() and key not in self.cache:
+            with PROFILER.stage('to_pixmap'):
+                pixmap = QPixmap.fromImage(image)
+            self.cache.put(key, pixmap)
+            self.imageReady.emit(key)
+
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
+        self._pending.clear()
+        with self._thumbnail_lock:
+            self._pending_thumbnails.clear()
+
+
+class ClassSelector(QWidget):
+    """Page5 的類別選擇器：類別確定時建立一次，換圖片時只更新勾選狀態。
+
+    類別數量不多時使用單選按鈕；超過 LIST_VIEW_THRESHOLD 時改用 model-backed
+    的 QListView，只繪製可見的項目，換圖片的成本與類別數量無關。
+    """
+    # 使用者點選類別時送出類別索引
+    classClicked = pyqtSignal(int)
+
+    LIST_VIEW_THRESHOLD = 20
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._classes = []
+        self._radio_buttons = []
+
+        self._layout = QVBoxLayout(self)
+        self._layout.setContentsMargins(0, 0, 0, 0)
+
+        # 單選按鈕共用同一個 QButtonGroup，信號只連接一次
+        self.button_group = QButtonGroup(self)
+        self.button_group.buttonClicked[int].connect(self.classClicked.emit)
+
+        self.list_model = QStringListModel(self)
+        self.list_view = QListView(self)
+        self.list_view.setModel(self.list_model)
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.list_view.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.list_view.setFocusPolicy(Qt.NoFocus)  # 方向鍵與數字鍵留給主視窗
+        self.list_view.clicked.connect(lambda index: self.classClicked.emit(index.row()))
+        self.list_view.hide()
+        self._layout.addWidget(self.list_view)
+
+    def _uses_list_view(self):
+        return len(self._classes) > self.LIST_VIEW_THRESHOLD
+
+    def count(self):
+        return len(self._classes)
+
+    @profiled('rebuild_class_selector')
+    def set_classes(self, classes):
+        """重建類別選項；類別未變更時不做任何事。"""
+        classes = list(classes)
+        if classes == self._classes:
+            return
+        self._classes = classes
+
+        for radio_btn in self._radio_buttons:
+            self.button_group.removeButton(radio_btn)
+            radio_btn.deleteLater()
+        self._radio_buttons = []
+
+        if self._uses_list_view():
+            self.list_model.setStringList(classes)
+            self.list_view.show()
+        else:
+            self.list_model.setStringList([])
+            self.list_view.hide()
+            for idx, cls in enumerate(classes):
+                radio_btn = QRadioButton(cls, self)
+                radio_btn.setFocusPolicy(Qt.NoFocus)
+                self.button_group.addButton(radio_btn, idx)
+                self._layout.insertWidget(idx, radio_btn)
+                self._radio_buttons.append(radio_btn)
+
+    def set_checked(self, idx):
+        """勾選指定類別，idx 不在範圍內時清除勾選。"""
+        valid = 0 <= idx < len(self._classes)
+        if self._uses_list_view():
+            if valid:
+                index = self.list_model.index(idx)
+                self.list_view.setCurrentIndex(index)
+                self.list_view.scrollTo(index)
+            else:
+                self.list_view.clearSelection()
+                self.list_view.setCurrentIndex(QModelIndex())
+        elif valid:
+            self._radio_buttons[idx].setChecked(True)
+        else:
+            # 互斥群組無法直接取消勾選，暫時關閉互斥
+            checked = self.button_group.checkedButton()
+            if checked is not None:
+                self.button_group.setExclusive(False)
+                checked.setChecked(False)
+                self.button_group.setExclusive(True)
+
+    def checked_id(self):
+        """目前勾選的類別索引，未勾選為 -1。"""
+        if self._uses_list_view():
+            rows = self.list_view.selectionModel().selectedRows()
+            return rows[0].row() if rows else -1
+        return self.button_group.checkedId()
+
+
+class ErrorPanel(QWidget):
+    """Page5 的非模態錯誤清單：載入失敗的圖片記在這裡，不會擋住標記流程。"""
+    # 使用者要求重新載入某張圖片時送出圖片索引
+    retryRequested = pyqtSignal(int)
+
+    # 清單最多保留的項目數，完整紀錄在 retry list 檔案
+    MAX_ITEMS = 500
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        header = QHBoxLayout()
+        self.title_label = QLabel('Errors: 0', self)
+        header.addWidget(self.title_label)
+        header.addStretch(1)
+        self.retry_button = QPushButton('Retry selected', self)
+        self.retry_button.setFocusPolicy(Qt.NoFocus)
+        self.retry_button.clicked.connect(self._retry_selected)
+        header.addWidget(self.retry_button)
+        self.clear_button = QPushButton('Clear', self)
+        self.clear_button.setFocusPolicy(Qt.NoFocus)
+        self.clear_button.clicked.connect(self.clear)
+        header.addWidget(self.clear_button)
+        layout.addLayout(header)
+
+        self.list_widget = QListWidget(self)
+        self.list_widget.setFocusPolicy(Qt.NoFocus)  # 方向鍵與數字鍵留給主視窗
+        self.list_widget.setMaximumHeight(100)
+        self.list_widget.itemDoubleClicked.connect(lambda item: self.retryRequested.emit(item.data(Qt.UserRole)))
+        layout.addWidget(self.list_widget)
+
+        # 圖片索引 -> 清單項目，同一張圖片只列一次
+        self._items = {}
+        self.total = 0
+        self.hide()
+
+    def add_error(self, img_id, message):
+        item = self._items.get(img_id)
+        if item is not None:
+            item.setText(message)
+            return
+        self.total += 1
+        item = QListWidgetItem(message)
+        item.setData(Qt.UserRole, img_id)
+        self.list_widget.addItem(item)
+        self._items[img_id] = item
+        while self.list_widget.count() > self.MAX_ITEMS:
+            oldest = self.list_widget.takeItem(0)
+            self._items.pop(oldest.data(Qt.UserRole), None)
+        self.title_label.setText(f'Errors: {self.total}')
+        self.show()
+
+    def resolve(self, img_id):
+        """圖片重新載入成功後從清單移除。"""
+        item = self._items.pop(img_id, None)
+        if item is not None:
+            self.list_widget.takeItem(self.list_widget.row(item))
+            self.total -= 1
+            self.title_label.setText(f'Errors: {self.total}')
+            if not self._items:
+                self.hide()
+
+    def clear(self):
+        self.list_widget.clear()
+        self._items = {}
+        self.total = 0
+        self.title_label.setText('Errors: 0')
+        self.hide()
+
+    def _retry_selected(self):
+        item = self.list_widget.currentItem()
+        if item is not None:
+            self.retryRequested.emit(item.data(Qt.UserRole))
+
+
+class ThumbnailGridModel(QAbstractListModel):
+    """Grid 模式的圖片清單：項目被繪製時才向快取取縮圖，尚未解碼的先顯示佔位圖。"""
+
+    def __init__(self, cache, icon_size, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.icon_size = icon_size
+        self.images_dir = ''
+        self.image_files = []
+        # 第 row 張圖片目前的類別名稱（未標記為空字串）
+        self.label_text = lambda row: ''
+        self._placeholder = QPixmap(icon_size, icon_size)
+        self._placeholder.fill(Qt.lightGray)
+
+    def set_images(self, images_dir, image_files, label_text):
+        self.beginResetModel()
+        self.images_dir = images_dir
+        self.image_files = image_files
+        self.label_text = label_text
+        self.endResetModel()
+
+    def key(self, row):
+        """與 ImagePrefetcher 相同格式的快取鍵。"""
+        return (os.path.join(self.images_dir, self.image_files[row]), self.icon_size, self.icon_size)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.image_files)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            name = os.path.basename(self.image_files[row])
+            text = self.label_text(row)
+            return f'{name}\n{text}' if text else name
+        if role == Qt.DecorationRole:
+            pixmap = self.cache.get(self.key(row))
+            return self._placeholder if pixmap is None else pixmap
+        if role == Qt.ToolTipRole:
+            return self.image_files[row]
+        return None
+
+    def rows_changed(self, rows):
+        """通知 view 重新繪製指定的項目。"""
+        if len(rows):
+            self.dataChanged.emit(self.index(int(min(rows))), self.index(int(max(rows))))
+
+
+class ThumbnailGridView(QListView):
+    """多選的縮圖 grid，只解碼可見範圍（與下一頁）的縮圖。
+
+    使用 ListMode 換行排列加上 Batched 版面配置而不是 IconMode，百萬張圖片也能立即捲動。
+    """
+
+    def __init__(self, model, prefetcher, parent=None):
+        super().__init__(parent)
+        self.prefetcher = prefetcher
+        self.setModel(model)
+        size = model.icon_size
+        self.setFlow(QListView.LeftToRight)
+        self.setWrapping(True)
+        self.setResizeMode(QListView.Adjust)
+        self.setMovement(QListView.Static)
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(5000)
+        self.setIconSize(QSize(size, size))
+        self.setGridSize(QSize(size + 32, size + 56))
+        self.setWordWrap(True)
+        self.setTextElideMode(Qt.ElideMiddle)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        # 已送出解碼的快取鍵 -> 列，解碼完成後只重繪該項目
+        self._requested_rows = {}
+        # 捲動時合併成一次請求
+        self.request_timer = QTimer(self)
+        self.request_timer.setSingleShot(True)
+        self.request_timer.setInterval(0)
+        self.request_timer.timeout.connect(self.request_visible)
+        self.verticalScrollBar().valueChanged.connect(lambda _: self.request_timer.start())
+        model.modelReset.connect(self.request_timer.start)
+        prefetcher.imageReady.connect(self._on_image_ready)
+
+    def viewOptions(self):
+        # 與 IconMode 相同的外觀：圖示在上、檔名與類別置中在下
+        option = super().viewOptions()
+        option.decorationPosition = QStyleOptionViewItem.Top
+        option.displayAlignment = Qt.AlignHCenter | Qt.AlignTop
+        return option
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.request_timer.start()
+
+    def visible_rows(self):
+        """目前可見的列與下一頁，依 grid 大小換算，不必逐一查詢項目位置。"""
+        count = self.model().rowCount()
+        if not count:
+            return range(0)
+        first = self.indexAt(QPoint(0, 0))
+        first_row = first.row() if first.isValid() else 0
+        grid = self.gridSize()
+        viewport = self.viewport().size()
+        per_row = max(1, viewport.width() // grid.width())
+        rows = viewport.height() // grid.height() + 2
+        return range(first_row, min(count, first_row + per_row * rows * 2))
+
+    def request_visible(self):
+        model = self.model()
+        self._requested_rows = {}
+        keys = []
+        for row in self.visible_rows():
+            key = model.key(row)
+            if key not in model.cache:
+                self._requested_rows[key] = row
+                keys.append(key)
+        # 先前排隊但已捲出畫面的工作會被取消
+        self.prefetcher.prefetch(keys)
+
+    def _on_image_ready(self, key):
+        row = self._requested_rows.pop(key, None)
+        if row is not None:
+            self.model().rows_changed([row])
+
 
 class ImageLabelingApp(QMainWindow):
+    # 預先解碼目前圖片之後 / 之前的張數，以及解碼快取的記憶體上限
+    PREFETCH_AHEAD = 8
+    PREFETCH_BEHIND = 3
+    PIXMAP_CACHE_BYTES = 128 * 1024 * 1024
+    # 圖片顯示區的最小大小；實際解碼大小跟著視窗放大
+    DISPLAY_SIZE = (400, 400)
+    # 調整視窗大小後多久才依新大小重新解碼（毫秒）
+    RESIZE_DEBOUNCE_MS = 150
+    # 上一張 / 下一張遇到無法載入的圖片時，最多連續略過幾張
+    MAX_SKIPPED_IMAGES = 50
+    # 無法載入的圖片清單，存放在資料集資料夾，每行為「圖片相對路徑<Tab>錯誤訊息」
+    RETRY_LIST_FILENAME = 'retry_list.txt'
+    # Grid 模式的縮圖大小與快取上限
+    GRID_ICON_SIZE = 128
+    GRID_CACHE_BYTES = 64 * 1024 * 1024
+    # 可復原（Ctrl+Z）的標記動作數上限
+    MAX_UNDO_STEPS = 1000
+    # 效能統計浮層（F12）的更新間隔（毫秒）
+    PROFILE_OVERLAY_INTERVAL_MS = 500
+
     def __init__(self):
         # 初始化
         super().__init__()
@@ -24,6 +513,7 @@ class ImageLabelingApp(QMainWindow):
         self.page3 = QWidget()
         self.page4 = QWidget()
         self.page5 = QWidget()
+        self.page6 = QWidget()
 
         # 五個頁面添加到 QStackedWidget
         self.stackedWidget.addWidget(self.page1)
@@ -31,6 +521,7 @@ class ImageLabelingApp(QMainWindow):
         self.stackedWidget.addWidget(self.page3)
         self.stackedWidget.addWidget(self.page4)
         self.stackedWidget.addWidget(self.page5)
+        self.stackedWidget.addWidget(self.page6)
 
         # 初始化
         self.initPage1()
@@ -39,6 +530,55 @@ class ImageLabelingApp(QMainWindow):
         self.initPage4()
         self.initPage5()
 
+        # 圖片解碼快取與背景預取
+        self.pixmap_cache = PixmapLRUCache(self.PIXMAP_CACHE_BYTES)
+        self.prefetcher = ImagePrefetcher(self.pixmap_cache, parent=self)
+        # Grid 模式的縮圖另外快取，避免把單張顯示用的大圖擠出快取
+        self.grid_cache = PixmapLRUCache(self.GRID_CACHE_BYTES)
+        self.grid_prefetcher = ImagePrefetcher(self.grid_cache, max_threads=4, parent=self)
+        self.initPage6()
+        # 視窗大小變動停止後才重新解碼目前的圖片
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(self.RESIZE_DEBOUNCE_MS)
+        self.resize_timer.timeout.connect(self.refresh_image)
+        # 目前顯示的圖片的快取鍵（路徑, 寬, 高）
+        self.shown_pixmap_key = None
+
+        # 標籤內容的記憶體模型，載入資料集時建立
+        self.label_store = None
+        # 整個資料集的標籤索引快取，進入標記頁面時開啟
+        self.label_cache = None
+        # 已修改但尚未寫入磁碟的標籤檔 -> 圖片索引，寫入後用來同步標籤快取
+        self._unflushed_label_ids = {}
+        # 本次開啟資料集的 session 與其 journal（每個標記動作先附加到 journal，標籤檔由 label_store 在背景寫回）
+        self.session_id = None
+        self.journal = None
+        # journal 的鎖定檔，持有期間其他開啟同一資料集的程式不會重播這個 journal
+        self.journal_lease = None
+        # 標記動作的復原/重做堆疊，每個動作為 [(圖片索引, 修改前內容, 修改後內容), ...]
+        self.undo_stack = []
+        self.redo_stack = []
+        # prelabel.py 產生的模型預測（PredictionCache），沒有或已過期時為 None
+        self.predictions = None
+        # 目前的勾選是否只是預先勾選的預測（使用者尚未確認）；未確認的預測不會存檔
+        self.unconfirmed_suggestion = False
+        # near_duplicates.py 產生的近似重複分組（DuplicateGroups），沒有或已過期時為 None
+        self.duplicates = None
+        # 每張圖片目前的類別與類別 -> 圖片索引，存檔時即時更新
+        self.label_index = LabelIndex(np.zeros(0, dtype=np.int16), 0)
+        # 多人標記的 session（AnnotationSession）與其持有的圖片（bool 陣列），單人使用時為 None
+        self.session = None
+        self.owned_mask = None
+        self.heartbeat_timer = QTimer(self)
+        self.heartbeat_timer.setInterval(HEARTBEAT_INTERVAL * 1000)
+        self.heartbeat_timer.timeout.connect(self.session_heartbeat)
+        # 本次開啟資料集後無法載入的圖片索引（已寫入 retry list）
+        self.failed_image_ids = set()
+        # 篩選後的瀏覽順序（圖片索引陣列，None 為全部圖片）與目前所在位置
+        self.view_ids = None
+        self.view_pos = 0
+
         # 追蹤當前圖片ID
         self.current_img_id = 0
         # 標記模式：'onehot' 或 'truelabel'
@@ -46,6 +586,26 @@ class ImageLabelingApp(QMainWindow):
         # 是否從 classes.txt 載入過模式（用來鎖定此資料集的模式）
         self.label_mode_locked = False
 
+        # 復原/重做在標記頁面與 grid 頁面都可使用
+        QShortcut(QKeySequence('Ctrl+Z'), self).activated.connect(self.undo_label)
+        for keys in ('Ctrl+Y', 'Ctrl+Shift+Z'):
+            QShortcut(QKeySequence(keys), self).activated.connect(self.redo_label)
+
+        # 各階段耗時的浮層：F12 開關計時與浮層，Shift+F12 匯出 Chrome trace
+        self.profile_overlay = QLabel(self)
+        self.profile_overlay.setFont(QFont('Monospace', 9))
+        self.profile_overlay.setStyleSheet('background-color: rgba(0, 0, 0, 170); color: white; padding: 6px;')
+        self.profile_overlay.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.profile_overlay.hide()
+        self.profile_timer = QTimer(self)
+        self.profile_timer.setInterval(self.PROFILE_OVERLAY_INTERVAL_MS)
+        self.profile_timer.timeout.connect(self.update_profile_overlay)
+        QShortcut(QKeySequence('F12'), self).activated.connect(self.toggle_profiling)
+        QShortcut(QKeySequence('Shift+F12'), self).activated.connect(self.export_profile_trace)
+        if PROFILER.enabled:
+            # 以 LABELING_PROFILE 環境變數啟用時一開始就顯示浮層
+            self.set_profile_overlay_visible(True)
+
         # 視窗置中
         self.center_on_screen()
 
@@ -82,6 +642,10 @@ class ImageLabelingApp(QMainWindow):
         self.load_button.clicked.connect(self.load_dataset)
         layout.addWidget(self.load_button)
 
+        # 多人同時標記共享資料夾上的資料集時，每個 session 只鎖定並標記一個分片
+        self.shared_session_checkbox = QCheckBox('Shared dataset: lock a shard of images for this session', self.page2)
+        layout.addWidget(self.shared_session_checkbox)
+
         self.next_button2 = QPushButton('Next', self.page2)
         # 將初始狀態設為不可用
         self.next_button2.setEnabled(False)
@@ -143,6 +707,7 @@ class ImageLabelingApp(QMainWindow):
 
             if reply == QMessageBox.Yes:
                 self.confirm_classes_label.setText('Classes: ' + ', '.join(self.image_classes))
+                self.class_selector.set_classes(self.image_classes)
                 self.stackedWidget.setCurrentWidget(self.page4)
                 return
             else:
@@ -179,7 +744,11 @@ class ImageLabelingApp(QMainWindow):
         layout.addWidget(self.label5)
 
         self.image_label = QLabel(self.page5)
-        layout.addWidget(self.image_label)
+        # 大小由版面決定而不是由圖片決定，圖片依顯示區的實際大小解碼
+        self.image_label.setMinimumSize(*self.DISPLAY_SIZE)
+        self.image_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        self.image_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.image_label, 1)
 
         self.filename_label = QLabel('Filename: ', self.page5)
         self.filename_label.setFont(QFont("Arial", 16, QFont.Bold))
@@ -187,13 +756,53 @@ class ImageLabelingApp(QMainWindow):
         
         self.image_id_label = QLabel('Image ID: ', self.page5)
         layout.addWidget(self.image_id_label)
+
+        self.progress_label = QLabel('Labeled: ', self.page5)
+        layout.addWidget(self.progress_label)
+
+        # 只瀏覽某個類別或未標記的圖片
+        self.view_combo = QComboBox(self.page5)
+        self.view_combo.setFocusPolicy(Qt.NoFocus)  # 方向鍵留給主視窗
+        self.view_combo.currentIndexChanged.connect(self.apply_view_filter)
+        layout.addWidget(self.view_combo)
         
         self.txt_label = QLabel('TXT Content: ', self.page5)
         layout.addWidget(self.txt_label)
+
+        # 模型預測（prelabel.py）：顯示前幾個預測，未標記的圖片預先勾選最可能的類別，按下一張即確認
+        prediction_layout = QHBoxLayout()
+        self.prediction_label = QLabel('', self.page5)
+        prediction_layout.addWidget(self.prediction_label, 1)
+        self.preselect_checkbox = QCheckBox('Preselect predicted class (Enter or click to accept)', self.page5)
+        self.preselect_checkbox.setChecked(True)
+        self.preselect_checkbox.setFocusPolicy(Qt.NoFocus)
+        self.preselect_checkbox.toggled.connect(lambda: self.displayImageAndLabel(self.current_img_id))
+        prediction_layout.addWidget(self.preselect_checkbox)
+        layout.addLayout(prediction_layout)
+        self.prediction_label.hide()
+        self.preselect_checkbox.hide()
+
+        # 近似重複（near_duplicates.py）：選擇類別時把類別一併套用到同一組尚未標記的圖片
+        duplicates_layout = QHBoxLayout()
+        self.duplicates_label = QLabel('', self.page5)
+        duplicates_layout.addWidget(self.duplicates_label, 1)
+        self.propagate_checkbox = QCheckBox('Apply label to near-duplicates', self.page5)
+        self.propagate_checkbox.setChecked(True)
+        self.propagate_checkbox.setFocusPolicy(Qt.NoFocus)
+        duplicates_layout.addWidget(self.propagate_checkbox)
+        layout.addLayout(duplicates_layout)
+        self.duplicates_label.hide()
+        self.propagate_checkbox.hide()
+
+        # 載入失敗的圖片列在這裡並自動略過，不跳出對話框
+        self.error_panel = ErrorPanel(self.page5)
+        self.error_panel.retryRequested.connect(self.retry_image)
+        layout.addWidget(self.error_panel)
         
-        self.radio_buttons_layout = QVBoxLayout()
-        self.radio_button_group = QButtonGroup()
-        layout.addLayout(self.radio_buttons_layout)
+        # 類別選擇器只建立一次，換圖片時僅更新勾選狀態
+        self.class_selector = ClassSelector(self.page5)
+        self.class_selector.classClicked.connect(self.on_radio_button_clicked)
+        layout.addWidget(self.class_selector)
         
         button_layout = QHBoxLayout()
 
@@ -207,29 +816,92 @@ class ImageLabelingApp(QMainWindow):
         self.next_button5.setFocusPolicy(Qt.NoFocus)  # 讓按鈕無法被選中
         button_layout.addWidget(self.next_button5)
 
+        # 跳到上一張 / 下一張尚未標記的圖片（Shift + ← / →）
+        self.prev_unlabeled_button = QPushButton('Prev unlabeled', self.page5)
+        self.prev_unlabeled_button.clicked.connect(self.show_previous_unlabeled_image)
+        self.prev_unlabeled_button.setFocusPolicy(Qt.NoFocus)
+        button_layout.insertWidget(0, self.prev_unlabeled_button)
+
+        self.next_unlabeled_button = QPushButton('Next unlabeled', self.page5)
+        self.next_unlabeled_button.clicked.connect(self.show_next_unlabeled_image)
+        self.next_unlabeled_button.setFocusPolicy(Qt.NoFocus)
+        button_layout.addWidget(self.next_unlabeled_button)
+
+        self.grid_view_button = QPushButton('Grid view', self.page5)
+        self.grid_view_button.clicked.connect(self.show_grid_view)
+        self.grid_view_button.setFocusPolicy(Qt.NoFocus)
+        button_layout.addWidget(self.grid_view_button)
+
         layout.addLayout(button_layout)
         self.page5.setLayout(layout)
 
+    def initPage6(self):
+        # Grid 模式：多選圖片後一次指定類別
+        layout = QVBoxLayout()
+
+        self.label6 = QLabel('Grid View: \n Select images (Ctrl/Shift + click), then click a class or press 0-9.', self.page6)
+        layout.addWidget(self.label6)
+
+        self.grid_model = ThumbnailGridModel(self.grid_cache, self.GRID_ICON_SIZE, self)
+        self.grid_view = ThumbnailGridView(self.grid_model, self.grid_prefetcher, self.page6)
+        # 雙擊或 Enter 以單張模式開啟
+        self.grid_view.activated.connect(lambda index: self.show_single_view(index.row()))
+        self.grid_view.selectionModel().selectionChanged.connect(self.update_grid_status)
+        layout.addWidget(self.grid_view, 1)
+
+        self.grid_status_label = QLabel('Selected: 0', self.page6)
+        layout.addWidget(self.grid_status_label)
+
+        self.grid_class_selector = ClassSelector(self.page6)
+        self.grid_class_selector.classClicked.connect(self.assign_class_to_selection)
+        layout.addWidget(self.grid_class_selector)
+
+        # 列表有焦點時會攔下數字鍵做搜尋，改用快捷鍵
+        for digit in range(10):
+            shortcut = QShortcut(QKeySequence(str(digit)), self.page6)
+            shortcut.setContext(Qt.WidgetWithChildrenShortcut)
+            shortcut.activated.connect(lambda idx=digit: self.assign_class_to_selection(idx))
+
+        button_layout = QHBoxLayout()
+        self.single_view_button = QPushButton('Single view', self.page6)
+        self.single_view_button.clicked.connect(lambda: self.show_single_view())
+        self.single_view_button.setFocusPolicy(Qt.NoFocus)
+        button_layout.addWidget(self.single_view_button)
+
+        layout.addLayout(button_layout)
+        self.page6.setLayout(layout)
+
     def keyPressEvent(self, event):
         if self.stackedWidget.currentWidget() == self.page5:  # 只在 Page 5 監聽鍵盤
             key = event.key()
             # 數字鍵 0-9 對應到類別索引 0-9
             if Qt.Key_0 <= key <= Qt.Key_9:
                 index = key - Qt.Key_0  # 轉換為索引（0-based），0 對應第一個類別
-                button = self.radio_button_group.button(index)
-                if button:
-                    button.setChecked(True)  # 設定選中
+                if index < self.class_selector.count():
+                    self.class_selector.set_checked(index)  # 設定選中
                     # 手動呼叫 slot，讓 TXT Content 也一起更新
                     self.on_radio_button_clicked(index)
+            elif key in (Qt.Key_Return, Qt.Key_Enter):
+                # 接受目前勾選的類別（主要用於預先勾選的預測）並跳到下一張
+                checked = self.class_selector.checked_id()
+                if checked != -1:
+                    self.on_radio_button_clicked(checked)
+                return
             elif key == Qt.Key_Left:
                 self.prev_button.setFocusPolicy(Qt.NoFocus)
                 self.next_button5.setFocusPolicy(Qt.NoFocus)
-                self.show_previous_image()
+                if event.modifiers() & Qt.ShiftModifier:
+                    self.show_previous_unlabeled_image()
+                else:
+                    self.show_previous_image()
                 return
             elif key == Qt.Key_Right:
                 self.prev_button.setFocusPolicy(Qt.NoFocus)
                 self.next_button5.setFocusPolicy(Qt.NoFocus)
-                self.show_next_image()
+                if event.modifiers() & Qt.ShiftModifier:
+                    self.show_next_unlabeled_image()
+                else:
+                    self.show_next_image()
                 return
         super().keyPressEvent(event)  # 傳遞其他事件
 
@@ -261,33 +933,67 @@ class ImageLabelingApp(QMainWindow):
                 QMessageBox.critical(self, 'Error', 'Dataset must contain an "images" folder.')
                 return
 
-            # 計算圖片數量
-            self.image_files = os.listdir(self.images_dir)
+            # 換資料集時丟棄舊的解碼結果，並寫回上一個資料集尚未存檔的標籤
+            self.prefetcher.shutdown()
+            self.pixmap_cache.clear()
+            self.grid_prefetcher.shutdown()
+            self.grid_cache.clear()
+            # 縮圖存放在資料集資料夾（labels 旁邊），重新開啟資料集時不必再解碼原始大圖
+            self.prefetcher.thumbnails = ThumbnailCache(thumbnail_dir_for(dataset_dir))
+            self.grid_prefetcher.thumbnails = self.prefetcher.thumbnails
+            self.close_label_store()
+            self.end_shared_session()
+
+            # 計算圖片數量：只收錄圖片檔並排序，掃描結果快取在 labels 資料夾的 manifest
+            try:
+                self.image_files = index_images(self.images_dir, os.path.join(self.label_dir, MANIFEST_FILENAME))
+            except OSError as e:
+                QMessageBox.critical(self, 'Error', f'Failed to index images: {e}')
+                return
+            if not self.image_files:
+                QMessageBox.critical(self, 'Error', 'No image files found in the "images" folder.')
+                return
             self.image_count = len(self.image_files)
             # 根據圖片數量創建相同數量的"未開啟過"
             self.has_ever_opened = [False] * self.image_count
+            # 一次把所有標籤讀進記憶體，之後換圖片不再逐一開檔
+            # 標籤在進入標記頁面時才載入（此時類別與模式已確定）
+            # 上次當掉時還沒寫回標籤檔的 journal 紀錄，先寫回再讀取標籤
+            try:
+                recovered = recover_journals(dataset_dir, self.label_dir)
+            except OSError as e:
+                QMessageBox.warning(self, 'Warning', f'Failed to recover labels from the journal: {e}')
+                recovered = {'written': 0, 'conflicts': []}
+            self.session_id = new_session_id()
+            try:
+                # 先取得鎖定再建立 journal，其他程式不會把還在寫的 journal 當成當掉的 session 重播
+                self.journal_lease = JournalLease(dataset_dir, self.session_id)
+                self.journal = open_journal(dataset_dir, self.session_id)
+            except OSError as e:
+                # 沒有 journal 仍可標記，只是當機時會遺失最後幾秒的修改
+                QMessageBox.warning(self, 'Warning', f'Failed to open the label journal: {e}')
+                if self.journal_lease is not None:
+                    self.journal_lease.release()
+                    self.journal_lease = None
+                self.journal = None
+            else:
+                self.heartbeat_timer.start()
+            self.label_store = LabelStore(self.label_dir, on_flushed=self._on_labels_flushed, journal=self.journal,
+                                          before_flush=self._before_labels_flushed)
+            self.undo_stack = []
+            self.redo_stack = []
+            self.label_cache = None
+            self._unflushed_label_ids = {}
+            self.failed_image_ids = set()
+            self.error_panel.clear()
             self.next_button2.setEnabled(True)
             self.dataset_info_label.setText(f'Dataset Directory: {self.dataset_dir}\nImage Directory: {self.images_dir}\nLabel Directory: {self.label_dir}')
 
             # 嘗試從 labels 資料夾讀取已儲存的 classes 設定檔
-            classes_file = os.path.join(self.label_dir, 'classes.txt')
+            classes_file = os.path.join(self.label_dir, CLASSES_FILENAME)
             if os.path.exists(classes_file):
                 try:
-                    mode = 'onehot'
-                    loaded_classes = []
-                    mode_from_file = False
-                    with open(classes_file, 'r', encoding='utf-8') as f:
-                        for raw_line in f:
-                            line = raw_line.strip()
-                            if not line:
-                                continue
-                            if line.startswith('__mode__='):
-                                val = line.split('=', 1)[1].strip().lower()
-                                if val in ('onehot', 'truelabel'):
-                                    mode = val
-                                    mode_from_file = True
-                                continue
-                            loaded_classes.append(line)
+                    loaded_classes, mode, mode_from_file = read_classes_file(classes_file)
                     if loaded_classes:
                         self.image_classes = loaded_classes
                         self.label_mode = mode
@@ -308,7 +1014,15 @@ class ImageLabelingApp(QMainWindow):
                 except Exception as e:
                     QMessageBox.warning(self, 'Warning', f'Failed to load saved classes: {e}')
 
-            QMessageBox.information(self, 'Success', 'Dataset loaded successfully.')
+            message = 'Dataset loaded successfully.'
+            if recovered['written']:
+                message += f"\nRecovered {recovered['written']} unsaved labels from the journal."
+            if recovered['conflicts']:
+                names = ', '.join(label_file for label_file, _ in recovered['conflicts'][:5])
+                more = len(recovered['conflicts']) - 5
+                message += (f"\n{len(recovered['conflicts'])} journaled labels were changed elsewhere afterwards "
+                            f"and were not restored: {names}" + (f' and {more} more' if more > 0 else ''))
+            QMessageBox.information(self, 'Success', message)
 
     def add_class(self):
         class_name = self.class_input.text().strip()
@@ -336,38 +1050,22 @@ class ImageLabelingApp(QMainWindow):
                 self.label_mode = 'onehot'
 
         try:
-            classes_file = os.path.join(self.label_dir, 'classes.txt')
-            with open(classes_file, 'w', encoding='utf-8') as f:
-                # 第一行記錄此資料集的標記模式
-                f.write(f"__mode__={self.label_mode}\n")
-                # 後面每行為一個類別名稱
-                for cls in self.image_classes:
-                    f.write(f"{cls}\n")
+            # 第一行記錄此資料集的標記模式，後面每行為一個類別名稱
+            write_classes_file(os.path.join(self.label_dir, CLASSES_FILENAME), self.image_classes, self.label_mode)
         except Exception as e:
             QMessageBox.warning(self, 'Warning', f'Failed to save classes: {e}')
 
         self.confirm_classes_label.setText('Classes: ' + ', '.join(self.image_classes))
+        self.class_selector.set_classes(self.image_classes)
         self.stackedWidget.setCurrentWidget(self.page4)
 
     def _parse_one_hot_line(self, line):
         """嘗試將一行字串解析為 0/1 one-hot 向量，失敗則回傳 None。"""
         if not hasattr(self, 'image_classes') or not self.image_classes:
             return None
+        return parse_one_hot_line(line, len(self.image_classes))
 
-        parts = line.strip().split()
-        if len(parts) != len(self.image_classes):
-            return None
-
-        try:
-            vec = [int(p) for p in parts]
-        except ValueError:
-            return None
-
-        if any(v not in (0, 1) for v in vec):
-            return None
-
-        return vec
-
+    @profiled('display')
     def displayImageAndLabel(self, img_id):
         try:
             # 將目錄中所有的圖片與標籤放入image_files, label_files
@@ -379,86 +1077,307 @@ class ImageLabelingApp(QMainWindow):
 
             # 根據圖片ID選取該圖片
             self.tempfilename = image_files[img_id]
-            img_path = os.path.join(self.images_dir, self.tempfilename)
-            label_filename = self.tempfilename.rsplit('.', 1)[0] + '.txt'
-            label_path = os.path.join(self.label_dir, label_filename)
-
-            # Try loading and displaying the image
-            pixmap = QPixmap(img_path)
-            if pixmap.isNull():
-                raise FileNotFoundError(f"Image file not found or could not be loaded: {img_path}")
-            
-            self.image_label.setPixmap(pixmap.scaled(400, 400, Qt.KeepAspectRatio))
+            self.temp_img_id = img_id
+            label_filename = label_filename_for(self.tempfilename)
+
+            self._show_pixmap(img_id)
+            self.prefetch_around(img_id)
 
             # Display image ID
             self.image_id_label.setText(f'Image ID: {img_id}')
             # Display filename
             self.filename_label.setText(f'Filename: {self.tempfilename}')
 
-            # 若找不到對應的標籤檔，則自動建立一個空的 txt 檔案
-            if not os.path.exists(label_path):
-                try:
-                    open(label_path, 'w').close()
-                except Exception as e:
-                    raise FileNotFoundError(f"Failed to create label file: {label_path}, error: {e}")
-
-            # 讀取並從開頭開始寫入
-            with open(label_path, 'r+') as file:
-                label_lines = file.readlines()
-                
-                # 沒有標記內容則引發錯誤訊息
-                if not label_lines:
-                    # 無任何標記：預設全 0，不選擇任何類別
+            # 從記憶體中的標籤模型讀取，不存在的標籤檔視為空內容
+            with PROFILER.stage('label_read'):
+                label_lines = self.label_store.get_lines(label_filename)
+            
+            # 沒有標記內容則引發錯誤訊息
+            if not label_lines:
+                # 無任何標記：預設全 0，不選擇任何類別
+                one_hot_vector = np.zeros(len(self.image_classes), dtype=int)
+                one_hot_str = " ".join(map(str, one_hot_vector.astype(int)))
+                self.txt_label.setText(f'TXT Content: ')
+            else:
+                # 取得最後一行內容
+                last_line = label_lines[-1].strip()
+
+                if self.label_mode == 'truelabel':
+                    # TrueLabel：嘗試讀取整數索引（0-based），轉為 one-hot 顯示
+                    parsed_idx = parse_true_label_line(last_line, len(self.image_classes))
+                    idx = -1 if parsed_idx is None else parsed_idx
+
                     one_hot_vector = np.zeros(len(self.image_classes), dtype=int)
+                    if idx >= 0:
+                        one_hot_vector[idx] = 1
+                        self.txt_label.setText(f'TXT Content: {idx}')
+                    else:
+                        self.txt_label.setText(f'TXT Content: ')
+
                     one_hot_str = " ".join(map(str, one_hot_vector.astype(int)))
-                    self.txt_label.setText(f'TXT Content: ')
                 else:
-                    # 取得最後一行內容
-                    last_line = label_lines[-1].strip()
-
-                    if self.label_mode == 'truelabel':
-                        # TrueLabel：嘗試讀取整數索引（0-based），轉為 one-hot 顯示
-                        idx = -1
-                        try:
-                            val = int(last_line)
-                            if 0 <= val < len(self.image_classes):
-                                idx = val
-                        except ValueError:
-                            idx = -1
-
+                    # One-hot 模式：解析最後一行為 one-hot，失敗則使用全 0
+                    parsed_vec = self._parse_one_hot_line(last_line)
+                    if parsed_vec is not None:
+                        one_hot_str = " ".join(map(str, parsed_vec))
+                        self.txt_label.setText(f'TXT Content: {one_hot_str}')
+                    else:
                         one_hot_vector = np.zeros(len(self.image_classes), dtype=int)
-                        if idx >= 0:
-                            one_hot_vector[idx] = 1
-                            self.txt_label.setText(f'TXT Content: {idx}')
-                        else:
-                            self.txt_label.setText(f'TXT Content: ')
-
                         one_hot_str = " ".join(map(str, one_hot_vector.astype(int)))
-                    else:
-                        # One-hot 模式：解析最後一行為 one-hot，失敗則使用全 0
-                        parsed_vec = self._parse_one_hot_line(last_line)
-                        if parsed_vec is not None:
-                            one_hot_str = " ".join(map(str, parsed_vec))
-                            self.txt_label.setText(f'TXT Content: {one_hot_str}')
-                        else:
-                            one_hot_vector = np.zeros(len(self.image_classes), dtype=int)
-                            one_hot_str = " ".join(map(str, one_hot_vector.astype(int)))
-                            self.txt_label.setText(f'TXT Content: ')
+                        self.txt_label.setText(f'TXT Content: ')
+
+            self.updateRadioButtons(one_hot_str, self.show_prediction(img_id))
+            self.show_duplicates(img_id)
 
-                self.updateRadioButtons(one_hot_str)
+            self.has_ever_opened[img_id] = True
 
-                self.has_ever_opened[img_id] = True
+            self.error_panel.resolve(img_id)
+            return True
 
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load image or label: {str(e)}") #跳出錯誤訊息
+            # 記錄到錯誤清單與 retry list，不跳出對話框擋住標記流程
+            self.report_image_error(img_id, f"Failed to load image or label: {str(e)}")
             self.image_label.clear()  # Clear the image label if there was an error
+            self.shown_pixmap_key = None
             self.image_id_label.setText('Image ID: Error')
             self.filename_label.setText('Filename: Error')
             self.txt_label.setText('TXT Content: Error')
+            # 清除勾選，避免上一張的類別被存到這張圖片
+            self.class_selector.set_checked(-1)
+            return False
+
+    def report_image_error(self, img_id, message):
+        """把無法載入的圖片加入錯誤清單，並附加到資料集資料夾的 retry list。"""
+        name = self.image_files[img_id] if 0 <= img_id < len(self.image_files) else str(img_id)
+        if img_id not in self.failed_image_ids:
+            self.failed_image_ids.add(img_id)
+            try:
+                with open(os.path.join(self.dataset_dir, self.RETRY_LIST_FILENAME), 'a', encoding='utf-8') as f:
+                    f.write(f"{name}\t{message}\n")
+            except OSError:
+                pass
+        self.error_panel.add_error(img_id, f'{img_id}: {name}: {message}')
+
+    def retry_image(self, img_id):
+        """從錯誤清單重新載入圖片（例如檔案修復或網路磁碟恢復後）。"""
+        self.save_annotation()
+        self.failed_image_ids.discard(img_id)
+        self.current_img_id = img_id
+        self.sync_view_pos()
+        self.displayImageAndLabel(img_id)
+
+    def display_size(self):
+        """圖片顯示區目前的實際大小（不小於 DISPLAY_SIZE）。"""
+        rect = self.image_label.contentsRect()
+        return (max(rect.width(), self.DISPLAY_SIZE[0]), max(rect.height(), self.DISPLAY_SIZE[1]))
+
+    def _show_pixmap(self, img_id):
+        """優先使用預取好的縮圖，沒有才在 GUI 執行緒同步解碼。"""
+        key = self._pixmap_key(img_id)
+        pixmap = self.pixmap_cache.get(key)
+        if pixmap is None:
+            # 預取還沒完成（或連續快速換圖）時才會走到這裡；沒有縮圖時直接解碼到顯示大小，縮圖交給背景產生
+            with PROFILER.stage('decode_sync'):
+                image = load_scaled_image(*key, self.prefetcher.thumbnails, create_thumbnail=False)
+            if image.isNull():
+                raise FileNotFoundError(f"Image file not found or could not be loaded: {key[0]}")
+            self.prefetcher.ensure_thumbnail(key[0])
+            with PROFILER.stage('to_pixmap'):
+                pixmap = QPixmap.fromImage(image)
+            self.pixmap_cache.put(key, pixmap)
+        with PROFILER.stage('set_pixmap'):
+            self.image_label.setPixmap(pixmap)
+        self.shown_pixmap_key = key
+
+    def _pixmap_key(self, img_id):
+        img_path = os.path.join(self.images_dir, self.image_files[img_id])
+        return (img_path, *self.display_size())
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resize_timer.start()
+
+    def refresh_image(self):
+        """顯示區大小改變後，以新的大小重新解碼目前的圖片（標籤狀態不變）。"""
+        img_id = getattr(self, 'temp_img_id', None)
+        if self.stackedWidget.currentWidget() != self.page5 or img_id is None or img_id >= self.image_count:
+            return
+        if self._pixmap_key(img_id) == self.shown_pixmap_key:
+            return
+        try:
+            self._show_pixmap(img_id)
+        except FileNotFoundError:
+            return
+        self.prefetch_around(img_id)
+
+    def prefetch_around(self, img_id):
+        """預取下一批（優先）與上一批圖片，讓方向鍵與自動跳下一張能立即顯示。
+
+        篩選模式依篩選結果中的位置預取，與上一張 / 下一張實際移動的順序一致。
+        """
+        if not self.image_count:
+            return
+        order = self.view_ids
+        pos = img_id if order is None else self.view_pos
+        if order is not None and (pos >= len(order) or order[pos] != img_id):
+            hits = np.flatnonzero(order == img_id)
+            if not len(hits):
+                return
+            pos = int(hits[0])
+        count = self.image_count if order is None else len(order)
+        steps = list(range(1, self.PREFETCH_AHEAD + 1)) + [-step for step in range(1, self.PREFETCH_BEHIND + 1)]
+        ids = [(pos + step) % count for step in steps]
+        if order is not None:
+            ids = [int(order[i]) for i in ids]
+        # 圖片數量少於預取範圍時避免重複
+        ids = list(dict.fromkeys(i for i in ids if i != img_id))
+        self.prefetcher.prefetch([self._pixmap_key(i) for i in ids])
+
+    def load_label_index(self):
+        """開啟標籤快取（單次 mmap）；快取過期時平行讀取所有標籤檔重建，有效時改在背景把標籤檔讀進 label_store。"""
+        self.label_cache, error = load_label_cache(self.image_files, self.label_dir, self.image_classes,
+                                                   self.label_mode, self.label_store)
+        if error is not None:
+            QMessageBox.warning(self, 'Warning', f'Failed to save label cache, labels are kept in memory only: {error}')
+        self.label_index = LabelIndex(self.label_cache.labels, len(self.image_classes))
+        self.update_progress_label()
+
+    def load_predictions(self):
+        """讀取 prelabel.py 的預測結果；沒有、或圖片清單與類別已改變時不使用。"""
+        predictions = PredictionCache(self.dataset_dir)
+        self.predictions = predictions if predictions.open(self.image_files, self.image_classes) else None
+        self.prediction_label.setVisible(self.predictions is not None)
+        self.preselect_checkbox.setVisible(self.predictions is not None)
+
+    def show_prediction(self, img_id):
+        """顯示圖片的預測，回傳要預先勾選的類別（不預先勾選時為 -1）。"""
+        if self.predictions is None:
+            return -1
+        top = self.predictions.top(img_id)
+        self.prediction_label.setText('Prediction: ' + ', '.join(f'{self.image_classes[cls]} {score:.2f}'
+                                                                 for cls, score in top))
+        if not top or not self.preselect_checkbox.isChecked():
+            return -1
+        return top[0][0]
+
+    def load_duplicates(self):
+        """讀取 near_duplicates.py 的分組結果；圖片清單已改變時不使用。"""
+        duplicates = DuplicateGroups(self.dataset_dir)
+        self.duplicates = duplicates if duplicates.open(self.image_files) else None
+        self.duplicates_label.setVisible(self.duplicates is not None)
+        self.propagate_checkbox.setVisible(self.duplicates is not None)
+
+    def show_duplicates(self, img_id):
+        if self.duplicates is None:
+            return
+        others = len(self.duplicates.members(img_id)) - 1
+        self.duplicates_label.setText(f'Near-duplicates: {others} other images' if others else 'Near-duplicates: none')
+
+    def update_progress_label(self):
+        text = f'Labeled: {self.label_index.labeled_count} / {self.image_count}'
+        if self.view_ids is not None:
+            text += f'    View: {self.view_pos + 1} / {len(self.view_ids)}'
+        self.progress_label.setText(text)
+        self.update_grid_status()
+
+    def update_grid_status(self):
+        selected = len(self.grid_view.selectionModel().selectedIndexes())
+        self.grid_status_label.setText(f'Selected: {selected}    Labeled: {self.label_index.labeled_count} / {self.image_count}')
+
+    def close_label_store(self):
+        """同步寫回尚未存檔的標籤並關閉 journal，回傳寫入失敗的項目。"""
+        errors = []
+        if self.label_store is not None:
+            self.label_store.close()
+            errors = self.label_store.write_errors
+        if self.journal is not None:
+            try:
+                self.journal.close()
+            except OSError as e:
+                errors = errors + [(None, e)]
+            self.journal = None
+        if self.journal_lease is not None:
+            # journal 關閉後才釋放，之後開啟資料集的程式才能重播其中寫入失敗的紀錄
+            self.heartbeat_timer.stop()
+            self.journal_lease.release()
+            self.journal_lease = None
+        return errors
+
+    def _before_labels_flushed(self, label_filenames):
+        # 由 LabelStore 的背景寫入執行緒呼叫：寫入前記下被其他工具改過的標籤資料夾
+        if self.label_cache is not None:
+            self.label_cache.prepare_write(label_filenames)
+
+    def _on_labels_flushed(self, written):
+        # 由 LabelStore 的背景寫入執行緒呼叫：.txt 寫入完成後才更新標籤快取，兩者保持一致
+        if self.label_cache is None:
+            return
+        updates = [(self._unflushed_label_ids[name], lines) for name, lines in written
+                   if name in self._unflushed_label_ids]
+        if updates:
+            self.label_cache.update(updates)
 
     def show_page5_with_pictureid0(self):
+        self.load_predictions()
+        self.load_duplicates()
+        self.populate_view_filter()
+        self.load_label_index()
+        self.grid_model.set_images(self.images_dir, self.image_files, self.grid_label_text)
+        if self.shared_session_checkbox.isChecked() and self.session is None:
+            if not self.start_shared_session():
+                return
+        if self.session is not None:
+            # 只瀏覽自己分片內的圖片
+            self.view_ids = self.session.image_ids()
+            self.view_pos = 0
+            self.current_img_id = int(self.view_ids[0])
+            self.update_progress_label()
         self.stackedWidget.setCurrentWidget(self.page5)
-        self.displayImageAndLabel(0)
+        self.displayImageAndLabel(self.current_img_id)
+
+    def start_shared_session(self):
+        """鎖定一個還有未標記圖片的分片，之後只能瀏覽與標記該分片。"""
+        session = AnnotationSession(self.dataset_dir, self.image_files, session_id=self.session_id)
+        starts = np.arange(0, self.image_count, DEFAULT_SHARD_SIZE)
+        unlabeled = np.add.reduceat(~self.label_index.labeled, starts)
+        # 優先取得未標記圖片最多的分片，已全部標記的分片放在最後
+        candidates = np.argsort(-unlabeled, kind='stable').tolist()
+        try:
+            acquired = session.acquire(candidates)
+        except (OSError, ValueError) as e:
+            # ValueError：其他 session 的圖片清單不同，分片會重疊
+            QMessageBox.warning(self, 'Warning', f'Failed to lock a shard: {e}')
+            return False
+        if not acquired:
+            QMessageBox.warning(self, 'No Free Shard', 'All shards of this dataset are locked by other sessions.')
+            return False
+        self.session = session
+        self.owned_mask = np.zeros(self.image_count, dtype=bool)
+        self.owned_mask[session.image_ids()] = True
+        # 其他 session 也會改寫標籤快取，這裡只保留記憶體中的複本
+        self.label_cache.labels = np.array(self.label_cache.labels)
+        self.label_cache.persistent = False
+        self.heartbeat_timer.start()
+        return True
+
+    def session_heartbeat(self):
+        if self.journal_lease is not None:
+            self.journal_lease.heartbeat()
+        if self.session is None:
+            return
+        lost = self.session.heartbeat()
+        if lost:
+            self.owned_mask[:] = False
+            self.owned_mask[self.session.image_ids()] = True
+            QMessageBox.warning(self, 'Warning', f'The lock on shard {lost} was taken over by another session; '
+                                                 'labels in it are no longer saved by this session.')
+
+    def end_shared_session(self):
+        if self.session is not None:
+            # heartbeat_timer 也更新 journal 的鎖定，由 close_label_store 停止
+            self.session.release()
+            self.session = None
+            self.owned_mask = None
 
     def is_float(self, string):
         """Checks if a string represents a float."""
@@ -535,80 +1454,277 @@ class ImageLabelingApp(QMainWindow):
         #     QMessageBox.critical(self, "Error", f"Unrecognised data format") #無法辨別標籤格式
 
     def show_next_image(self):
+        self._step_image(1)
+
+    def show_previous_image(self):
+        self._step_image(-1)
+
+    def _step_image(self, step):
         self.save_annotation()
-        self.current_img_id = (self.current_img_id + 1) % self.image_count
+        # 無法載入的圖片記入錯誤清單後繼續往同一方向略過
+        for _ in range(self.MAX_SKIPPED_IMAGES):
+            if self.view_ids is None:
+                self.current_img_id = (self.current_img_id + step) % self.image_count
+            else:
+                # 篩選模式只在篩選結果內移動
+                self.view_pos = (self.view_pos + step) % len(self.view_ids)
+                self.current_img_id = int(self.view_ids[self.view_pos])
+                self.update_progress_label()
+            if self.displayImageAndLabel(self.current_img_id):
+                return
+
+    def populate_view_filter(self):
+        """依目前的類別重建篩選選單，並回到全部圖片。"""
+        self.view_combo.blockSignals(True)
+        self.view_combo.clear()
+        self.view_combo.addItem('All images', None)
+        self.view_combo.addItem('All images, sorted by class', 'sorted')
+        self.view_combo.addItem('Unlabeled', UNLABELED)
+        if self.predictions is not None:
+            self.view_combo.addItem('Unlabeled, lowest confidence first', 'confidence')
+        if self.duplicates is not None:
+            self.view_combo.addItem('Unlabeled, one per near-duplicate group', 'deduplicated')
+        for idx, cls in enumerate(self.image_classes):
+            self.view_combo.addItem(f'Class: {cls}', idx)
+        self.view_combo.blockSignals(False)
+        self.view_ids = None
+        self.view_pos = 0
+
+    def apply_view_filter(self, combo_index):
+        """只瀏覽某個類別或未標記的圖片；篩選結果在切換時固定下來，標記後不會跳動。"""
+        self.save_annotation()
+        choice = self.view_combo.itemData(combo_index)
+        if choice is None and self.session is not None:
+            self.view_ids = self.session.image_ids()
+            self.sync_view_pos()
+            self.current_img_id = int(self.view_ids[self.view_pos])
+        elif choice is None:
+            self.view_ids = None
+        else:
+            if choice == 'sorted':
+                view_ids = self.label_index.sorted_by_class()
+            elif choice == 'confidence':
+                # 模型最沒把握的圖片先標記
+                view_ids = self.label_index.members(UNLABELED)
+                view_ids = view_ids[np.argsort(self.predictions.confidence()[view_ids], kind='stable')]
+            elif choice == 'deduplicated':
+                # 標記每組的第一張時會一併套用到整組
+                view_ids = self.duplicates.representatives(self.label_index.members(UNLABELED))
+            else:
+                view_ids = self.label_index.members(choice)
+            if self.session is not None:
+                view_ids = view_ids[self.owned_mask[view_ids]]
+            if not len(view_ids):
+                QMessageBox.information(self, 'Empty View', 'No images match this filter.')
+                self.view_combo.setCurrentIndex(0)
+                return
+            self.view_ids = view_ids
+            self.sync_view_pos()
+            # 目前的圖片不在篩選結果內時跳到第一張
+            self.current_img_id = int(self.view_ids[self.view_pos])
+        self.update_progress_label()
         self.displayImageAndLabel(self.current_img_id)
 
-    def show_previous_image(self):
+    def sync_view_pos(self):
+        """不是用上一張 / 下一張移動時（跳到未標記、從 grid 開啟），重新找出目前圖片在篩選結果中的位置。"""
+        if self.view_ids is None:
+            return
+        hits = np.flatnonzero(self.view_ids == self.current_img_id)
+        self.view_pos = int(hits[0]) if len(hits) else 0
+        self.update_progress_label()
+
+    def show_next_unlabeled_image(self):
+        self._jump_to_unlabeled(1)
+
+    def show_previous_unlabeled_image(self):
+        self._jump_to_unlabeled(-1)
+
+    def _jump_to_unlabeled(self, step):
+        # 先存檔，目前這張若剛標記完就不會再被找到
         self.save_annotation()
-        self.current_img_id = (self.current_img_id - 1) % self.image_count
+        labeled = self.label_index.labeled
+        if self.session is not None:
+            # 其他 session 的圖片視為已標記，只在自己的分片內尋找
+            labeled = labeled | ~self.owned_mask
+        img_id = find_unlabeled(labeled, self.current_img_id, step)
+        if img_id is None:
+            QMessageBox.information(self, 'All Labeled', 'All images are labeled.')
+            return
+        self.current_img_id = img_id
+        self.sync_view_pos()
         self.displayImageAndLabel(self.current_img_id)
 
+    @profiled('save_annotation')
     def save_annotation(self):
         # 獲取使用者的單一選擇，未選擇為-1
-        selected_id = self.radio_button_group.checkedId()
-        # 如果有勾選則把該項改成1
-        if selected_id != -1:
-            # 建立一個class長度的one_hot向量，並初始為0
-            one_hot_vector = np.zeros(len(self.image_classes), dtype=int)
-            one_hot_vector[selected_id] = 1
-            one_hot_vector_str = " ".join(map(str, one_hot_vector.astype(int)))
-            
-            # 將tempfilename的文件名稱根據.位置分割成兩份，並只取前面部份加上.txt
-            label_filename = self.tempfilename.rsplit('.', 1)[0] + '.txt'
-            # label_filename文件存放在self.label_dir目錄之中，並用label_path儲存路徑
-            label_path = os.path.join(self.label_dir, label_filename)
-            # 確保標籤檔存在
-            if not os.path.exists(label_path):
-                open(label_path, 'w').close()
-
-            # 依標記模式寫入檔案
-            if self.label_mode == 'truelabel':
-                # TrueLabel：直接寫入類別索引（0-based，第一類為 0）
-                label_value = selected_id
-                with open(label_path, 'r+') as file:
-                    lines = file.readlines()
-                    if not lines:
-                        lines.append(f"{label_value}")
-                    else:
-                        last_line = lines[-1].strip()
-                        is_valid_int = False
-                        try:
-                            existing = int(last_line)
-                            if 0 <= existing < len(self.image_classes):
-                                is_valid_int = True
-                        except ValueError:
-                            is_valid_int = False
-
-                        if is_valid_int:
-                            lines[-1] = f"{label_value}"
-                        else:
-                            lines.append(f"\n{label_value}")
+        selected_id = self.class_selector.checked_id()
+        # 如果有勾選則寫入該類別；只是預先勾選、使用者沒有確認的預測不寫入
+        # 換圖、篩選、切換 grid 時存檔只寫目前這張，近似重複只在使用者選擇類別時套用（confirm_class）
+        if selected_id != -1 and not self.unconfirmed_suggestion:
+            self.assign_class([self.temp_img_id], selected_id)
+
+    def confirm_class(self, class_idx):
+        """使用者選擇類別（點選、數字鍵或 Enter）時寫入目前圖片，並套用到同一組尚未標記的近似重複圖片。
+
+        整組是同一個復原動作；回傳一併標記的近似重複張數。
+        """
+        img_ids = [self.temp_img_id]
+        members = []
+        if self.duplicates is not None and self.propagate_checkbox.isChecked():
+            # 同一組已標記的圖片保留原本的類別，只補上尚未標記的
+            members = self.duplicates.members(self.temp_img_id)
+            members = members[~self.label_index.labeled[members] & (members != self.temp_img_id)]
+            img_ids += [int(i) for i in members]
+        self.assign_class(img_ids, class_idx)
+        return int(np.count_nonzero(self.label_index.labels[members] == class_idx)) if len(members) else 0
+
+    def assign_class(self, img_ids, class_idx):
+        """把多張圖片一次標記為 class_idx，所有標籤檔在同一批背景寫入中寫回，回傳實際標記的張數。
+
+        多人標記時不屬於自己分片的圖片不會被修改。
+        """
+        if self.session is not None:
+            img_ids = [img_id for img_id in img_ids if self.owned_mask[img_id]]
+        if not img_ids:
+            return 0
+        num_classes = len(self.image_classes)
+        changes = []
+        for img_id in img_ids:
+            # 從記憶體讀取目前內容，依標記模式覆寫最後一行（或新增一行）
+            before = self.label_store.get_lines(label_filename_for(self.image_files[img_id]))
+            lines = apply_label(before, class_idx, self.label_mode, num_classes)
+            if lines != before:
+                changes.append((img_id, before, lines))
+        if changes:
+            self._write_labels(changes)
+            self.undo_stack.append(changes)
+            del self.undo_stack[:-self.MAX_UNDO_STEPS]
+            self.redo_stack.clear()
+        return len(img_ids)
+
+    def _write_labels(self, changes):
+        """changes 為 [(圖片索引, 修改前內容, 修改後內容), ...]：附加到 journal 並交給 label_store 在背景批次寫回。"""
+        num_classes = len(self.image_classes)
+        items = []
+        records = []
+        by_class = {}
+        for img_id, before, lines in changes:
+            image_file = self.image_files[img_id]
+            label_filename = label_filename_for(image_file)
+            items.append((label_filename, lines))
+            records.append((image_file, label_filename, before, lines))
+            self._unflushed_label_ids[label_filename] = img_id
+            by_class.setdefault(decode_label_lines(lines, self.label_mode, num_classes), []).append(img_id)
+        with PROFILER.stage('label_write'):
+            self.label_store.set_many(items, records)
+        for class_idx, ids in by_class.items():
+            self.label_index.set(ids, class_idx)
+        self.update_progress_label()
+        self.grid_model.rows_changed([img_id for img_id, _, _ in changes])
+
+    def toggle_profiling(self):
+        enabled = not PROFILER.enabled
+        PROFILER.set_enabled(enabled)
+        self.set_profile_overlay_visible(enabled)
+
+    def set_profile_overlay_visible(self, visible):
+        if visible:
+            self.update_profile_overlay()
+            self.profile_overlay.show()
+            self.profile_overlay.raise_()
+            self.profile_timer.start()
+        else:
+            self.profile_timer.stop()
+            self.profile_overlay.hide()
+
+    def update_profile_overlay(self):
+        """以每個階段最近的耗時更新浮層（p50 / p95，毫秒）。"""
+        rows = [f'{"stage":<24}{"n":>6}{"p50 ms":>9}{"p95 ms":>9}']
+        for name, stats in PROFILER.summary().items():
+            rows.append(f'{name:<24}{stats["n"]:>6}{stats["p50_ms"]:>9.2f}{stats["p95_ms"]:>9.2f}')
+        if len(rows) == 1:
+            rows.append('(no samples yet)')
+        self.profile_overlay.setText('\n'.join(rows))
+        self.profile_overlay.adjustSize()
+        self.profile_overlay.move(self.width() - self.profile_overlay.width() - 8, 8)
+        self.profile_overlay.raise_()
+
+    def export_profile_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, 'Export Profile Trace', 'labeling_trace.json',
+                                              'Chrome trace (*.json)')
+        if not path:
+            return
+        try:
+            count = PROFILER.export_chrome_trace(path)
+        except OSError as e:
+            QMessageBox.warning(self, 'Warning', f'Failed to export trace: {e}')
+            return
+        QMessageBox.information(self, 'Success', f'Exported {count} events to {path}.\n'
+                                'Open it in chrome://tracing or https://ui.perfetto.dev.')
 
-                    file.seek(0)
-                    file.writelines(lines)
-                    file.truncate()
-            else:
-                # One-hot：維持原本行為
-                with open(label_path, 'r+') as file:
-                    # 讀取所有行
-                    lines = file.readlines()
-                    if not lines:
-                        lines.append(f"{one_hot_vector_str}")
-                    else:
-                        last_line = lines[-1].strip()
-                        # 如果最後一行已是合法 one-hot，則覆寫；否則新增一行
-                        if self._parse_one_hot_line(last_line) is not None:
-                            lines[-1] = f"{one_hot_vector_str}"
-                        else:
-                            lines.append(f"\n{one_hot_vector_str}")
-                    # 將讀寫頭放回開頭
-                    file.seek(0)
-                    # 複寫新文字
-                    file.writelines(lines)
-                    # 截斷多餘舊內容
-                    file.truncate()
+    def undo_label(self):
+        self._replay_history(self.undo_stack, self.redo_stack, undo=True)
 
+    def redo_label(self):
+        self._replay_history(self.redo_stack, self.undo_stack, undo=False)
+
+    def _replay_history(self, source, target, undo):
+        """從 source 取出最後一個標記動作，還原（或重做）後放到 target；復原本身也會寫入 journal。"""
+        if self.stackedWidget.currentWidget() not in (self.page5, self.page6) or not source:
+            return
+        changes = source.pop()
+        target.append(changes)
+        if self.session is not None:
+            # 已失去鎖定的分片不能再修改
+            changes = [change for change in changes if self.owned_mask[change[0]]]
+            if not changes:
+                return
+        if undo:
+            self._write_labels([(img_id, after, before) for img_id, before, after in changes])
+        else:
+            self._write_labels(changes)
+        if self.stackedWidget.currentWidget() == self.page5:
+            # 回到被修改的圖片，讓使用者看到復原的結果
+            self.current_img_id = changes[0][0]
+            self.sync_view_pos()
+            self.displayImageAndLabel(self.current_img_id)
+
+    def assign_class_to_selection(self, class_idx):
+        if not 0 <= class_idx < len(self.image_classes):
+            return
+        img_ids = sorted(index.row() for index in self.grid_view.selectionModel().selectedIndexes())
+        if img_ids:
+            skipped = len(img_ids) - self.assign_class(img_ids, class_idx)
+            if skipped:
+                self.grid_status_label.setText(self.grid_status_label.text() +
+                                               f'    Skipped {skipped} images outside this session\'s shard')
+        # 類別選擇器在 grid 模式只當作按鈕使用
+        self.grid_class_selector.set_checked(-1)
+
+    def grid_label_text(self, row):
+        # 繪製時呼叫，只讀記憶體中的標籤索引（存檔時已同步更新），不讀標籤檔
+        class_idx = int(self.label_index.labels[row])
+        return self.image_classes[class_idx] if 0 <= class_idx < len(self.image_classes) else ''
+
+    def show_grid_view(self):
+        self.save_annotation()
+        self.grid_class_selector.set_classes(self.image_classes)
+        self.stackedWidget.setCurrentWidget(self.page6)
+        index = self.grid_model.index(self.current_img_id)
+        self.grid_view.setCurrentIndex(index)
+        self.grid_view.scrollTo(index)
+        self.grid_view.setFocus()
+        self.grid_view.request_timer.start()
+        self.update_grid_status()
+
+    def show_single_view(self, img_id=None):
+        if img_id is None:
+            current = self.grid_view.currentIndex()
+            img_id = current.row() if current.isValid() else self.current_img_id
+        self.current_img_id = img_id
+        self.sync_view_pos()
+        self.stackedWidget.setCurrentWidget(self.page5)
+        self.displayImageAndLabel(self.current_img_id)
 
     def string_to_one_hot(self, labels, classes):
         one_hot = np.zeros((len(labels), len(classes)))
@@ -616,14 +1732,10 @@ class ImageLabelingApp(QMainWindow):
             one_hot[i, classes.index(label)] = 1
         return one_hot
 
-    def updateRadioButtons(self ,one_hot_str):
-        # 刪除舊有的單選按鈕
-        for i in reversed(range(self.radio_buttons_layout.count())):
-            widget = self.radio_buttons_layout.itemAt(i).widget()
-            if widget is not None:
-                widget.setParent(None)
-
-        self.radio_button_group = QButtonGroup()
+    @profiled('update_radio_buttons')
+    def updateRadioButtons(self ,one_hot_str, suggested_idx=-1):
+        # 類別選項已在確認類別時建立，這裡只更新勾選狀態
+        # suggested_idx 為模型預測的類別，只在尚未標記時預先勾選，且在使用者確認前不會存檔
         parts = one_hot_str.split()
         expected_len = len(self.image_classes)
         # 預設為全 0，長度與 classes 一致
@@ -638,22 +1750,24 @@ class ImageLabelingApp(QMainWindow):
                 # 若解析失敗則維持全 0
                 pass
 
-        #根據one_hot建立對應的單選按鈕 
-        for idx, (cls, value) in enumerate(zip(self.image_classes, one_hot_vector)):
-            radio_btn = QRadioButton(cls)
+        # 互斥選擇下以最後一個 1 為準，全 0 則不勾選
+        checked_idx = -1
+        for idx, value in enumerate(one_hot_vector):
             if value == 1:
-                radio_btn.setChecked(True)
-            self.radio_button_group.addButton(radio_btn, idx)
-            self.radio_buttons_layout.addWidget(radio_btn)
-
-        # 點擊任一單選按鈕時，立即更新下方 TXT Content 顯示
-        self.radio_button_group.buttonClicked[int].connect(self.on_radio_button_clicked)
+                checked_idx = idx
+        self.unconfirmed_suggestion = checked_idx == -1 and 0 <= suggested_idx < expected_len
+        if self.unconfirmed_suggestion:
+            checked_idx = suggested_idx
+        self.class_selector.set_checked(checked_idx)
 
     def on_radio_button_clicked(self, idx):
         """當使用者在 Page5 點擊類別單選按鈕時，即時更新 TXT Content。"""
         # idx 為 QButtonGroup 中的按鈕 ID，與類別索引一致
         if idx < 0 or idx >= len(self.image_classes):
             return
+        # 點選（或按數字鍵、Enter）即確認，包含預先勾選的預測
+        self.unconfirmed_suggestion = False
+        propagated = self.confirm_class(idx)
 
         if self.label_mode == 'truelabel':
             # True label 模式：直接顯示類別索引
@@ -667,6 +1781,10 @@ class ImageLabelingApp(QMainWindow):
 
         # 選擇完類別後，自動跳到下一張圖片（等同按下 Next image）
         self.show_next_image()
+        if propagated:
+            # 換圖後才顯示，避免被下一張的近似重複資訊蓋掉
+            self.duplicates_label.setText(f'Applied "{self.image_classes[idx]}" to {propagated} near-duplicates '
+                                          'of the previous image (Ctrl+Z to undo)')
     
     def closeEvent(self, event):
         reply = QMessageBox.question(
@@ -679,6 +1797,15 @@ class ImageLabelingApp(QMainWindow):
 
         if reply == QMessageBox.Yes:
             self.save_annotation()
+            self.prefetcher.shutdown()
+            self.grid_prefetcher.shutdown()
+            # 同步寫回所有尚未存檔的標籤；寫入失敗的修改仍留在 journal，下次開啟資料集時重播
+            errors = self.close_label_store()
+            if errors:
+                failed = ', '.join(name or str(e) for name, e in errors)
+                QMessageBox.warning(self, 'Warning', f'Failed to save labels: {failed}')
+            # 標籤寫完才釋放分片，其他 session 接手時看到的是最新內容
+            self.end_shared_session()
             event.accept()
         else:
             event.ignore()